@@ -0,0 +1,120 @@
+"""Discovery against loopback players: the old scan vs discovery.discover.
+
+Starts loopback responders on consecutive UDP ports that answer
+ARE_YOU_AVAILABLE after a short random delay; every fourth one ignores the
+first probe, like a lost datagram. The old scan_for_players loop (send
+once, read until a 0.5 s gap) and discovery.discover with the expected
+count are timed against them.
+
+Before timing anything it checks, with assertions, that discover finds
+every loopback player, including those that drop the first probe, and
+returns well before its timeout.
+
+Usage: python benchmarks/bench_discovery.py [players]   (default 20)
+"""
+import asyncio
+import os
+import random
+import socket
+import sys
+import time
+
+HW_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, HW_DIR)
+
+import discovery
+
+BASE_PORT = 28324
+
+
+class Responder(asyncio.DatagramProtocol):
+    def __init__(self, drop_first):
+        self.drops = 1 if drop_first else 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if data != discovery.PROBE:
+            return
+        if self.drops:
+            self.drops -= 1
+            return
+        asyncio.get_running_loop().call_later(random.uniform(0.001, 0.02), self.transport.sendto,
+                                              discovery.AVAILABLE, addr)
+
+
+def old_scan(targets):
+    # scan_for_players before discovery.py, with the targets passed in.
+    udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp_sock.settimeout(0.5)
+    for target in targets:
+        udp_sock.sendto(b"ARE_YOU_AVAILABLE", target)
+    found = []
+    start_time = time.time()
+    while time.time() - start_time < 2:
+        try:
+            data, addr = udp_sock.recvfrom(1024)
+            if data.decode() == "AVAILABLE":
+                found.append(addr)
+        except socket.timeout:
+            break
+    udp_sock.close()
+    return found
+
+
+async def check_loopback(players):
+    loop = asyncio.get_running_loop()
+    transports = []
+    for n in range(players):
+        transport, _ = await loop.create_datagram_endpoint(lambda n=n: Responder(n % 2 == 0),
+                                                           local_addr=('127.0.0.1', BASE_PORT + n))
+        transports.append(transport)
+    targets = discovery.expand_targets(['127.0.0.1'], [f"{BASE_PORT}-{BASE_PORT + players - 1}"])
+    try:
+        timeout = 2.0
+        start = time.perf_counter()
+        found = await discovery.discover(targets, expected=players, timeout=timeout, backoff=0.05)
+        elapsed = time.perf_counter() - start
+    finally:
+        for transport in transports:
+            transport.close()
+    assert sorted(found) == sorted(targets), f"missing {sorted(set(targets) - set(found))}"
+    assert elapsed < timeout / 2, f"took {elapsed:.2f} s, expected an early exit"
+    print(f"check: all {players} loopback players found in {elapsed * 1000:.0f} ms "
+          f"(half dropped the first probe)\n")
+
+
+async def run(players):
+    loop = asyncio.get_running_loop()
+    transports = []
+    for n in range(players):
+        transport, _ = await loop.create_datagram_endpoint(lambda n=n: Responder(n % 4 == 0),
+                                                           local_addr=('127.0.0.1', BASE_PORT + n))
+        transports.append(transport)
+    targets = discovery.expand_targets(['127.0.0.1'], [f"{BASE_PORT}-{BASE_PORT + players - 1}"])
+    try:
+        start = time.perf_counter()
+        found = await loop.run_in_executor(None, old_scan, targets)
+        print(f"old scan        found {len(found):3}/{players} in {(time.perf_counter() - start) * 1000:6.0f} ms")
+        for n in range(0, players, 4):
+            transports[n].get_protocol().drops = 1
+        start = time.perf_counter()
+        found = await discovery.discover(targets, expected=players)
+        print(f"discover        found {len(found):3}/{players} in {(time.perf_counter() - start) * 1000:6.0f} ms")
+        start = time.perf_counter()
+        found = await discovery.discover(targets + [('127.0.0.1', BASE_PORT + players)], expected=None, timeout=1.0)
+        print(f"discover (wait) found {len(found):3}/{players} in {(time.perf_counter() - start) * 1000:6.0f} ms"
+              f"  (no expected count: runs to the timeout)")
+    finally:
+        for transport in transports:
+            transport.close()
+
+
+def main(players):
+    asyncio.run(check_loopback(players))
+    asyncio.run(run(players))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
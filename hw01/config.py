@@ -0,0 +1,27 @@
+# Player B listens for invitations on UDP_PORT; player A serves the game on TCP_PORT.
+UDP_PORT = 18324
+TCP_PORT = 19000
+
+# Hosts and ports player A probes for ARE_YOU_AVAILABLE. Ports are single
+# ports or "low-high" ranges. A broadcast address (e.g. '255.255.255.255')
+# in DISCOVERY_HOSTS needs DISCOVERY_BROADCAST; DISCOVERY_MULTICAST_GROUP
+# is probed as well and player B joins it when set.
+DISCOVERY_HOSTS = [
+    '140.113.235.151',  # linux1.cs.nycu.edu.tw
+    '140.113.235.152',  # linux2.cs.nycu.edu.tw
+    '140.113.235.153',  # linux3.cs.nycu.edu.tw
+    '140.113.235.154',  # linux4.cs.nycu.edu.tw
+]
+DISCOVERY_PORTS = [str(UDP_PORT)]
+DISCOVERY_BROADCAST = False
+DISCOVERY_MULTICAST_GROUP = None  # e.g. '239.255.18.24'
+
+# A scan stops once DISCOVERY_EXPECTED players answered. None expects one
+# player per probed host and port, or waits the full DISCOVERY_TIMEOUT when
+# probing a broadcast address or multicast group. Silent targets are probed
+# again after DISCOVERY_BACKOFF seconds, doubling each time, up to
+# DISCOVERY_RETRIES times.
+DISCOVERY_EXPECTED = None
+DISCOVERY_TIMEOUT = 2.0
+DISCOVERY_RETRIES = 3
+DISCOVERY_BACKOFF = 0.25
@@ -0,0 +1,82 @@
+# discovery.py
+# Concurrent UDP discovery of available players
+
+import asyncio
+import socket
+
+PROBE = b"ARE_YOU_AVAILABLE"
+AVAILABLE = b"AVAILABLE"
+BUSY = b"BUSY"  # player B is deciding on an invitation or in a game
+
+
+def parse_ports(specs):
+    """Ports from specs like 18324 or "18324-18330"."""
+    ports = []
+    for spec in specs:
+        low, _, high = str(spec).partition('-')
+        ports.extend(range(int(low), int(high or low) + 1))
+    return ports
+
+
+def expand_targets(hosts, port_specs, multicast_group=None):
+    ports = parse_ports(port_specs)
+    targets = [(host, port) for host in hosts for port in ports]
+    if multicast_group:
+        targets.extend((multicast_group, port) for port in ports)
+    return targets
+
+
+class DiscoveryProtocol(asyncio.DatagramProtocol):
+    def __init__(self, expected=None):
+        self.expected = expected
+        self.found = {}  # (ip, port) -> "AVAILABLE" or "BUSY", from the latest answer
+        self.done = asyncio.get_running_loop().create_future()
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        answer = data.strip()
+        if answer not in (AVAILABLE, BUSY):
+            return
+        self.found[addr[:2]] = answer.decode()
+        if self.expected and len(self.found) >= self.expected and not self.done.done():
+            self.done.set_result(None)
+
+    def error_received(self, exc):
+        # ICMP port unreachable from a host with nobody listening; the others may still answer.
+        pass
+
+
+async def discover(targets, expected=None, timeout=2.0, retries=3, backoff=0.25, broadcast=False, multicast=False):
+    """Probe every target at once; returns {(ip, port): "AVAILABLE" or "BUSY"} for each player that answered.
+
+    Targets that have not answered are probed again after backoff,
+    2 * backoff, ... seconds. Returns as soon as ``expected`` players
+    answered, or after ``timeout`` seconds.
+    """
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: DiscoveryProtocol(expected), local_addr=('0.0.0.0', 0), allow_broadcast=broadcast)
+    if multicast:
+        transport.get_extra_info('socket').setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+    deadline = loop.time() + timeout
+    try:
+        delay = backoff
+        for attempt in range(retries + 1):
+            for target in targets:
+                # Unicast targets that answered are done; broadcast and multicast answers come from other addresses.
+                if target not in protocol.found:
+                    transport.sendto(PROBE, target)
+            wait = deadline - loop.time() if attempt == retries else min(delay, deadline - loop.time())
+            if wait <= 0:
+                break
+            try:
+                await asyncio.wait_for(asyncio.shield(protocol.done), wait)
+                break
+            except asyncio.TimeoutError:
+                delay *= 2
+    finally:
+        transport.close()
+    return protocol.found
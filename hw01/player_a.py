@@ -1,12 +1,21 @@
 # player_a.py
 # UDP Client and TCP Server
 
+import asyncio
 import socket
 import threading
 import time
 
+import config
+import discovery
+
 def main():
-    available_players = scan_for_players()
+    available_players, busy_players = scan_for_players()
+
+    if busy_players:
+        print("Busy players (in a game or deciding on an invitation, cannot be invited):")
+        for player in busy_players:
+            print(f"   {player} (busy)")
 
     if not available_players:
         print("No available players found.")
@@ -44,7 +53,7 @@ def main():
         if response == "ACCEPTED":
             print("Invitation accepted.")
 
-            tcp_port = 19000 
+            tcp_port = config.TCP_PORT
             threading.Thread(target=start_tcp_server, args=(tcp_port,)).start()
             time.sleep(1)  # Give some time for TCP server to start
             udp_sock.sendto(str(tcp_port).encode(), (player_ip, int(player_port)))
@@ -55,34 +64,19 @@ def main():
         print("No response received. Invitation timed out.")
 
 def scan_for_players():
-    servers = [
-        '140.113.235.151',  # linux1.cs.nycu.edu.tw
-        '140.113.235.152',  # linux2.cs.nycu.edu.tw
-        '140.113.235.153',  # linux3.cs.nycu.edu.tw
-        '140.113.235.154',  # linux4.cs.nycu.edu.tw
-    ]
-
-    port = 18324
-    available_players = []
-
-    udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    udp_sock.settimeout(0.5)
-
-    for server in servers:
-            udp_sock.sendto(b"ARE_YOU_AVAILABLE", (server, port))
-
-    start_time = time.time()
-    while time.time() - start_time < 2: 
-        try:
-            data, addr = udp_sock.recvfrom(1024)
-            response = data.decode()
-            if response == "AVAILABLE":
-                available_players.append(f"{addr[0]}:{addr[1]}")
-        except socket.timeout:
-            break
-
-    udp_sock.close()
-    return available_players
+    # All hosts and ports are probed at once; see discovery.py and the DISCOVERY_* settings in config.py.
+    targets = discovery.expand_targets(config.DISCOVERY_HOSTS, config.DISCOVERY_PORTS,
+                                       config.DISCOVERY_MULTICAST_GROUP)
+    expected = config.DISCOVERY_EXPECTED
+    if expected is None and not (config.DISCOVERY_BROADCAST or config.DISCOVERY_MULTICAST_GROUP):
+        # Unicast only: stop as soon as every probed address has answered.
+        expected = len(targets)
+    found = asyncio.run(discovery.discover(
+        targets, expected, config.DISCOVERY_TIMEOUT, config.DISCOVERY_RETRIES,
+        config.DISCOVERY_BACKOFF, config.DISCOVERY_BROADCAST, bool(config.DISCOVERY_MULTICAST_GROUP)))
+    available = [f"{ip}:{port}" for (ip, port), status in found.items() if status == "AVAILABLE"]
+    busy = [f"{ip}:{port}" for (ip, port), status in found.items() if status == "BUSY"]
+    return available, busy
 
 def start_tcp_server(tcp_port):
     tcp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
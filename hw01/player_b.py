@@ -1,51 +1,100 @@
 # player_b.py
 # UDP Server and TCP Client
 
+import asyncio
 import socket
+import struct
 
-def main():
-    UDP_IP = ''
-    UDP_PORT = 18324 
+import config
 
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.bind((UDP_IP, UDP_PORT))
+INVITE_PORT_TIMEOUT = 10  # player A stops waiting for our answer after 10 s as well
 
-    print(f"Player B is waiting for game invitations on port {UDP_PORT}...")
 
-    while True:
-        data, addr = sock.recvfrom(1024)
-        message = data.decode()
-        print(f"Received message from {addr}: {message}")
+async def get_user_input(prompt):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, lambda: input(prompt).strip().lower())
+
+class PlayerB(asyncio.DatagramProtocol):
+    """Answers discovery and invitations from the event loop, whatever the game is doing.
+
+    state: idle -> deciding (prompting about an invitation) -> waiting_port
+    (accepted, waiting for player A's TCP port) -> in_game -> idle.
+    """
+
+    def __init__(self):
+        self.transport = None
+        self.state = "idle"
+        self.inviter = None
+        self.port_timer = None
+        self.tasks = set()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def datagram_received(self, data, addr):
+        message = data.decode(errors='replace').strip()
 
         if message == "ARE_YOU_AVAILABLE":
-            sock.sendto(b"AVAILABLE", addr)
-            print(f"Sent availability response to {addr}")
+            # Answered right away in every state; only an idle player shows up in scans.
+            self.transport.sendto(b"AVAILABLE" if self.state == "idle" else b"BUSY", addr)
+            if self.state == "idle":
+                print(f"Sent availability response to {addr}")
         elif message == "GAME_INVITATION":
-            response = input("Do you want to accept the invitation? (y/N): ").strip().lower()
-            if response == 'y':
-                sock.sendto(b"ACCEPTED", addr)
-                print("Invitation accepted, waiting for TCP port info...")
-
-                data, addr = sock.recvfrom(1024)
-                tcp_port_info = data.decode()
-                TCP_PORT = int(tcp_port_info)
-                print(f"Received TCP port info from Player A: {TCP_PORT}")
-
-                play_game(addr[0], TCP_PORT)
-                print("Game finished. Returning to wait for new invitations.")
-            else:
-                sock.sendto(b"DECLINED", addr)
-                print("Invitation declined, waiting for new invitations...")
+            if self.state != "idle":
+                self.transport.sendto(b"DECLINED", addr)
+                print(f"Declined invitation from {addr}: busy ({self.state}).")
+                return
+            print(f"Received game invitation from {addr}")
+            self.state = "deciding"
+            self.inviter = addr
+            self.spawn(self.decide(addr))
+        elif self.state == "waiting_port" and addr == self.inviter and message.isdigit():
+            self.port_timer.cancel()
+            tcp_port = int(message)
+            print(f"Received TCP port info from Player A: {tcp_port}")
+            self.state = "in_game"
+            self.spawn(self.run_game(addr[0], tcp_port))
+
+    async def decide(self, addr):
+        response = await get_user_input("Do you want to accept the invitation? (y/N): ")
+        if response == 'y':
+            self.transport.sendto(b"ACCEPTED", addr)
+            print("Invitation accepted, waiting for TCP port info...")
+            self.state = "waiting_port"
+            self.port_timer = asyncio.get_running_loop().call_later(INVITE_PORT_TIMEOUT, self.port_timed_out)
         else:
-            pass
+            self.transport.sendto(b"DECLINED", addr)
+            print("Invitation declined, waiting for new invitations...")
+            self.reset()
+
+    def port_timed_out(self):
+        print("Player A did not send the TCP port in time. Waiting for new invitations...")
+        self.reset()
+
+    async def run_game(self, player_a_ip, tcp_port):
+        try:
+            await play_game(player_a_ip, tcp_port)
+            print("Game finished. Returning to wait for new invitations.")
+        except OSError as e:
+            print(f"Game connection failed: {e}")
+        finally:
+            self.reset()
+
+    def reset(self):
+        self.state = "idle"
+        self.inviter = None
 
-def play_game(player_a_ip, tcp_port):
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.connect((player_a_ip, tcp_port))
+async def play_game(player_a_ip, tcp_port):
+    reader, writer = await asyncio.open_connection(player_a_ip, tcp_port)
     print(f"Connected to Player A's game server at {player_a_ip}:{tcp_port}")
 
     while True:
-        data = sock.recv(1024)
+        data = await reader.read(1024)
         if not data:
             print("Connection closed by server.")
             break
@@ -53,17 +102,40 @@ def play_game(player_a_ip, tcp_port):
         print(f"Server says: {message}")
 
         if message == "MAKE_MOVE":
-            move = input("Enter your move (rock/paper/scissors): ").strip().lower()
+            move = await get_user_input("Enter your move (rock/paper/scissors): ")
             while move not in ['rock', 'paper', 'scissors']:
-                move = input("Invalid move. Enter your move (rock/paper/scissors): ").strip().lower()
-            sock.sendall(move.encode())
+                move = await get_user_input("Invalid move. Enter your move (rock/paper/scissors): ")
+            writer.write(move.encode())
+            await writer.drain()
         elif message.startswith("RESULT"):
             print(message)
-        elif message == "GAME_OVER":
+        if message.endswith("GAME_OVER"):
+            # Player A may send RESULT and GAME_OVER in one segment.
             print("Game over.")
             break
 
-    sock.close()
+    writer.close()
+    await writer.wait_closed()
+
+def join_multicast_group(transport, group):
+    sock = transport.get_extra_info('socket')
+    membership = struct.pack('4s4s', socket.inet_aton(group), socket.inet_aton('0.0.0.0'))
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+
+async def main():
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(PlayerB, local_addr=('0.0.0.0', config.UDP_PORT))
+    if config.DISCOVERY_MULTICAST_GROUP:
+        join_multicast_group(transport, config.DISCOVERY_MULTICAST_GROUP)
+
+    print(f"Player B is waiting for game invitations on port {config.UDP_PORT}...")
+    try:
+        await asyncio.Future()
+    finally:
+        transport.close()
 
 if __name__ == "__main__":
-    main()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,90 @@
+"""Connect Four engine: win check cost and search speed in positions per second.
+
+Usage: python benchmarks/bench_connectfour.py [depth]
+"""
+import os
+import random
+import sys
+import time
+
+HW_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, HW_DIR)
+
+import connectfour_engine
+
+
+def check_connectfour_winner(board, row, column, player):
+    # The list-of-lists checker client.py used before the bitboard engine.
+    directions = [(0,1), (1,0), (1,1), (1,-1)]
+    for dx, dy in directions:
+        count = 1
+        for dir in [1, -1]:
+            x, y = row, column
+            while True:
+                x += dir * dx
+                y += dir * dy
+                if 0 <= x < 6 and 0 <= y < 7 and board[x][y] == player:
+                    count += 1
+                else:
+                    break
+        if count >= 4:
+            return True
+    return False
+
+
+def random_games(count, rng):
+    """Every move of count random games, as (list board, row, column, symbol, position before the move)."""
+    samples = []
+    for _ in range(count):
+        board = [[' ' for _ in range(7)] for _ in range(6)]
+        position = connectfour_engine.Position()
+        while not position.is_full():
+            column = rng.choice([col for col in range(7) if position.can_play(col)])
+            symbol = 'X' if position.moves % 2 == 0 else 'O'
+            before = position.copy()
+            won = position.is_winning_move(column)
+            row = 5 - position.play(column)
+            board[row][column] = symbol
+            samples.append(([r[:] for r in board], row, column, symbol, before))
+            if won:
+                break
+    return samples
+
+
+def main(depth):
+    rng = random.Random(1)
+    samples = random_games(2000, rng)
+
+    start = time.perf_counter()
+    for board, row, column, symbol, _ in samples:
+        check_connectfour_winner(board, row, column, symbol)
+    list_ns = (time.perf_counter() - start) / len(samples) * 1e9
+    start = time.perf_counter()
+    for _, _, column, _, position in samples:
+        position.is_winning_move(column)
+    bit_ns = (time.perf_counter() - start) / len(samples) * 1e9
+    print(f"win check, {len(samples)} moves")
+    print(f"  list scan           {list_ns:8.0f} ns/move")
+    print(f"  bitboard shifts     {bit_ns:8.0f} ns/move  ({list_ns / bit_ns:.1f}x)")
+
+    print(f"\nsearch to depth {depth}")
+    openings = [[], [3], [3, 3], [3, 2, 4], [2, 3, 3, 4, 4]]
+    total_nodes = 0
+    total_time = 0.0
+    for moves in openings:
+        position = connectfour_engine.Position()
+        for column in moves:
+            position.play(column)
+        searcher = connectfour_engine.Searcher()
+        start = time.perf_counter()
+        column, score, reached = searcher.search(position, max_depth=depth)
+        elapsed = time.perf_counter() - start
+        total_nodes += searcher.nodes
+        total_time += elapsed
+        print(f"  opening {str(moves):18} best {column}  score {score:5}  {searcher.nodes:8} positions"
+              f"  {elapsed * 1000:8.1f} ms  {searcher.nodes / elapsed:9.0f} pos/s")
+    print(f"  overall {total_nodes / total_time:.0f} positions/s")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
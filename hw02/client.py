@@ -3,6 +3,7 @@ import json
 import sys
 import logging
 import config
+import connectfour_engine
 
 logging.basicConfig(
     filename='client.log',
@@ -551,20 +552,25 @@ async def start_connectfour_game_as_client(peer_ip, peer_port, max_retries=10, r
         await writer.wait_closed()
 
 async def connectfour_game_loop(reader, writer, role):
-    board = [[' ' for _ in range(7)] for _ in range(6)]
+    position = connectfour_engine.Position()
+    searcher = connectfour_engine.Searcher() if config.CONNECTFOUR_BOT else None
     my_symbol = 'X' if role == "Host" else 'O'
     opponent_symbol = 'O' if role == "Host" else 'X'
     current_turn = 'X'  # 'X' 總是先手
     game_over = False
 
     while not game_over:
-        display_connectfour_board(board)
+        display_connectfour_board(position)
         if current_turn == my_symbol:
-            column = await get_connectfour_move(board, my_symbol)
-            if column == -1:
-                print("該欄已滿，請選擇另一個欄位。")
-                continue
-            row = place_piece(board, column, my_symbol)
+            if searcher is not None:
+                # The search runs for up to CONNECTFOUR_BOT_TIME; keep it off the loop so lobby and peer I/O go on.
+                loop = asyncio.get_event_loop()
+                column, score, depth = await loop.run_in_executor(
+                    None, lambda: searcher.search(position, time_limit=config.CONNECTFOUR_BOT_TIME))
+                print(f"電腦玩家 {my_symbol} 選擇第 {column} 列（搜尋深度 {depth}）")
+                logging.debug(f"Connect Four 機器人：列 {column}，分數 {score}，深度 {depth}，節點 {searcher.nodes}")
+            else:
+                column = await get_connectfour_move(position, my_symbol)
             await send_message(writer, {"column": column})
         else:
             print("等待對手的移動...")
@@ -576,27 +582,23 @@ async def connectfour_game_loop(reader, writer, role):
             try:
                 message = json.loads(data.decode())
                 column = message.get("column")
-                if column is not None and 0 <= column <= 6 and board[0][column] == ' ':
-                    row = place_piece(board, column, opponent_symbol)
-                else:
+                if not isinstance(column, int) or not position.can_play(column):
                     print("收到無效的移動。")
                     continue
             except json.JSONDecodeError:
                 print("收到無效的訊息。")
                 continue
 
-        if check_connectfour_winner(board, row, column, my_symbol):
-            display_connectfour_board(board)
-            print(f"玩家 {my_symbol} 獲勝!")
-            game_over = True
-            server_close_event.set()
-        elif check_connectfour_winner(board, row, column, opponent_symbol):
-            display_connectfour_board(board)
-            print(f"玩家 {opponent_symbol} 獲勝!")
+        # Only the player making this move can complete a four with it.
+        won = position.is_winning_move(column)
+        position.play(column)
+        if won:
+            display_connectfour_board(position)
+            print(f"玩家 {current_turn} 獲勝!")
             game_over = True
             server_close_event.set()
-        elif all(board[0][col] != ' ' for col in range(7)):
-            display_connectfour_board(board)
+        elif position.is_full():
+            display_connectfour_board(position)
             print("平局!")
             game_over = True
             server_close_event.set()
@@ -604,50 +606,29 @@ async def connectfour_game_loop(reader, writer, role):
             # Switch turns
             current_turn = opponent_symbol if current_turn == my_symbol else my_symbol
 
-def display_connectfour_board(board):
+def display_connectfour_board(position):
     print("\n當前棋盤：")
-    for row in board:
-        print('|'.join(row))
+    for row in reversed(range(connectfour_engine.HEIGHT)):
+        cells = []
+        for col in range(connectfour_engine.WIDTH):
+            owner = position.cell(col, row)
+            cells.append(' ' if owner is None else 'X' if owner else 'O')
+        print('|'.join(cells))
         print('-' * 13)
     print('0 1 2 3 4 5 6\n')
 
-async def get_connectfour_move(board, player):
+async def get_connectfour_move(position, player):
     while True:
         try:
             column_input = await get_user_input(f"玩家 {player}，請輸入要放置的列號 (0-6)：")
             column = int(column_input)
-            if 0 <= column <= 6 and board[0][column] == ' ':
+            if position.can_play(column):
                 return column
             else:
                 print("無效的列號，請再試一次。")
         except ValueError:
             print("請輸入 0 到 6 之間的數字。")
 
-def place_piece(board, column, player):
-    for row in reversed(range(6)):
-        if board[row][column] == ' ':
-            board[row][column] = player
-            return row
-    print("該欄已滿。")
-    return -1  # Invalid move
-
-def check_connectfour_winner(board, row, column, player):
-    directions = [(0,1), (1,0), (1,1), (1,-1)]
-    for dx, dy in directions:
-        count = 1
-        for dir in [1, -1]:
-            x, y = row, column
-            while True:
-                x += dir * dx
-                y += dir * dy
-                if 0 <= x < 6 and 0 <= y < 7 and board[x][y] == player:
-                    count += 1
-                else:
-                    break
-        if count >= 4:
-            return True
-    return False
-
 def display_online_users(online_users):
     print("\n=== 在線用戶列表 ===")
     if not online_users:
@@ -5,3 +5,8 @@ PORT = 47298
 LOG_FILE = 'server.log'
 
 P2P_PORT_RANGE = (62838, 63021)
+
+# Let the Connect Four engine play this client's moves, searching up to
+# CONNECTFOUR_BOT_TIME seconds per move.
+CONNECTFOUR_BOT = False
+CONNECTFOUR_BOT_TIME = 1.0
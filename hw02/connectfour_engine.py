@@ -0,0 +1,208 @@
+import time
+
+WIDTH = 7
+HEIGHT = 6
+H1 = HEIGHT + 1  # one spare bit on top of every column keeps shifted lines from wrapping
+
+# Bit col * H1 + row is the cell in column col, row counted from the bottom.
+BOTTOM_MASK = sum(1 << (col * H1) for col in range(WIDTH))
+BOARD_MASK = BOTTOM_MASK * ((1 << HEIGHT) - 1)
+COLUMN_MASKS = tuple(((1 << HEIGHT) - 1) << (col * H1) for col in range(WIDTH))
+BOTTOM_MASKS = tuple(1 << (col * H1) for col in range(WIDTH))
+TOP_MASKS = tuple(1 << (HEIGHT - 1 + col * H1) for col in range(WIDTH))
+CENTER_MASK = COLUMN_MASKS[WIDTH // 2]
+# Central columns take part in more lines, so search them first.
+MOVE_ORDER = (3, 2, 4, 1, 5, 0, 6)
+
+WIN_SCORE = 1000
+EXACT, LOWER, UPPER = 0, 1, 2
+
+if hasattr(int, "bit_count"):
+    popcount = int.bit_count
+else:
+    def popcount(bits):
+        return bin(bits).count("1")
+
+
+def has_four(stones):
+    """True if stones contain four in a row: two shift-and steps per direction."""
+    pairs = stones & (stones >> H1)  # horizontal
+    if pairs & (pairs >> (2 * H1)):
+        return True
+    pairs = stones & (stones >> (H1 - 1))  # diagonal, falling to the right
+    if pairs & (pairs >> (2 * (H1 - 1))):
+        return True
+    pairs = stones & (stones >> (H1 + 1))  # diagonal, rising to the right
+    if pairs & (pairs >> (2 * (H1 + 1))):
+        return True
+    pairs = stones & (stones >> 1)  # vertical
+    return pairs & (pairs >> 2) != 0
+
+
+def winning_cells(stones, mask):
+    """Empty cells that would complete four in a row for stones."""
+    cells = (stones << 1) & (stones << 2) & (stones << 3)  # vertical
+    for shift in (H1, H1 - 1, H1 + 1):
+        pair = (stones << shift) & (stones << (2 * shift))
+        cells |= pair & (stones << (3 * shift))
+        cells |= pair & (stones >> shift)
+        pair = (stones >> shift) & (stones >> (2 * shift))
+        cells |= pair & (stones << shift)
+        cells |= pair & (stones >> (3 * shift))
+    return cells & (BOARD_MASK ^ mask)
+
+
+class Position:
+    """Connect Four position as two bitboards.
+
+    ``current`` holds the stones of the player to move and ``mask`` every
+    stone on the board, so the opponent's stones are ``current ^ mask``.
+    """
+
+    def __init__(self, current=0, mask=0, moves=0):
+        self.current = current
+        self.mask = mask
+        self.moves = moves
+
+    def copy(self):
+        return Position(self.current, self.mask, self.moves)
+
+    def can_play(self, col):
+        return 0 <= col < WIDTH and not self.mask & TOP_MASKS[col]
+
+    def play(self, col):
+        """Drop a stone for the player to move; returns the row it landed on (0 is the bottom)."""
+        row = popcount(self.mask & COLUMN_MASKS[col])
+        self.current ^= self.mask
+        self.mask |= self.mask + BOTTOM_MASKS[col]
+        self.moves += 1
+        return row
+
+    def is_winning_move(self, col):
+        stone = (self.mask + BOTTOM_MASKS[col]) & COLUMN_MASKS[col]
+        return has_four(self.current | stone)
+
+    def possible(self):
+        """The cell each non-full column would take next."""
+        return (self.mask + BOTTOM_MASK) & BOARD_MASK
+
+    def can_win_next(self):
+        return winning_cells(self.current, self.mask) & self.possible() != 0
+
+    def last_player_won(self):
+        return has_four(self.current ^ self.mask)
+
+    def is_full(self):
+        return self.moves == WIDTH * HEIGHT
+
+    def key(self):
+        # current + mask is unique per position: it is mask with one extra bit per column.
+        return self.current + self.mask
+
+    def stones(self, first_player):
+        """Stones of the first (True) or second (False) player."""
+        mine_to_move = self.moves % 2 == 0
+        return self.current if mine_to_move == first_player else self.current ^ self.mask
+
+    def cell(self, col, row):
+        bit = 1 << (col * H1 + row)
+        if not self.mask & bit:
+            return None
+        return self.stones(True) & bit != 0
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class Searcher:
+    """Alpha-beta negamax with a transposition table and iterative deepening.
+
+    Scores are from the side to move: WIN_SCORE plus the empty cells left
+    for a forced win (sooner is better), otherwise a heuristic counting
+    cells that would complete a four for each side.
+    """
+
+    def __init__(self):
+        self.table = {}  # key -> (depth, flag, score, best column)
+        self.nodes = 0
+        self.deadline = None
+
+    def evaluate(self, position):
+        opponent = position.current ^ position.mask
+        mine = popcount(winning_cells(position.current, position.mask))
+        theirs = popcount(winning_cells(opponent, position.mask))
+        center = popcount(position.current & CENTER_MASK) - popcount(opponent & CENTER_MASK)
+        return 4 * (mine - theirs) + center
+
+    def negamax(self, position, depth, alpha, beta):
+        self.nodes += 1
+        if self.deadline is not None and self.nodes & 1023 == 0 and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+        if position.is_full():
+            return 0
+        if position.can_win_next():
+            return WIN_SCORE + WIDTH * HEIGHT - position.moves
+        if depth == 0:
+            return self.evaluate(position)
+
+        key = position.key()
+        entry = self.table.get(key)
+        tt_move = None
+        if entry is not None:
+            entry_depth, flag, score, tt_move = entry
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return score
+                if flag == LOWER and score >= beta:
+                    return score
+                if flag == UPPER and score <= alpha:
+                    return score
+
+        original_alpha = alpha
+        best_score = -WIN_SCORE * 2
+        best_move = None
+        order = MOVE_ORDER if tt_move is None else (tt_move,) + tuple(c for c in MOVE_ORDER if c != tt_move)
+        for col in order:
+            if not position.can_play(col):
+                continue
+            child = position.copy()
+            child.play(col)
+            score = -self.negamax(child, depth - 1, -beta, -alpha)
+            if score > best_score:
+                best_score, best_move = score, col
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+
+        if best_score <= original_alpha:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table[key] = (depth, flag, best_score, best_move)
+        return best_score
+
+    def search(self, position, max_depth=WIDTH * HEIGHT, time_limit=None):
+        """Deepen one ply at a time until max_depth or time_limit; returns (column, score, depth)."""
+        self.deadline = time.perf_counter() + time_limit if time_limit else None
+        best = (None, 0, 0)
+        for col in MOVE_ORDER:
+            if position.can_play(col) and position.is_winning_move(col):
+                return col, WIN_SCORE + WIDTH * HEIGHT - position.moves, 1
+        for depth in range(1, min(max_depth, WIDTH * HEIGHT - position.moves) + 1):
+            try:
+                score = self.negamax(position, depth, -WIN_SCORE * 2, WIN_SCORE * 2)
+            except SearchTimeout:
+                break
+            entry = self.table.get(position.key())
+            if entry is not None and entry[3] is not None:
+                best = (entry[3], score, depth)
+            if abs(score) >= WIN_SCORE:
+                break  # a forced result does not change with more depth
+        if best[0] is None:
+            best = (next(col for col in MOVE_ORDER if position.can_play(col)), 0, 0)
+        self.deadline = None
+        return best
@@ -0,0 +1,112 @@
+"""Vectorized win/draw detection for many Tic-Tac-Toe or Connect Four boards.
+
+Boards are packed into bitboard arrays (uint16 for Tic-Tac-Toe, uint64 for
+Connect Four) and every board is classified with a handful of NumPy
+operations instead of a Python loop per board. Needs NumPy.
+"""
+import numpy as np
+
+import ttt_engine
+
+ONGOING, FIRST_WINS, SECOND_WINS, DRAW, INVALID = 0, 1, 2, 3, 4
+RESULT_NAMES = ("ongoing", "first_wins", "second_wins", "draw", "invalid")
+
+# Tic-Tac-Toe: square i is bit i, the same layout as ttt_engine.
+TTT_WINNING = np.frombuffer(ttt_engine.WINNING, dtype=np.uint8).astype(bool)
+TTT_POPCOUNT = np.array([bin(bits).count("1") for bits in range(1 << 9)], dtype=np.int8)
+TTT_SQUARE_BITS = (1 << np.arange(9)).astype(np.uint16)
+POPCOUNT_BYTE = np.array([bin(value).count("1") for value in range(256)], dtype=np.int16)
+
+# Connect Four: the hw02 connectfour_engine layout, bit col * 7 + row with row 0 at the bottom.
+C4_WIDTH, C4_HEIGHT = 7, 6
+C4_H1 = C4_HEIGHT + 1
+C4_SHIFTS = tuple(np.uint64(shift) for shift in (1, C4_H1, C4_H1 - 1, C4_H1 + 1))
+C4_BOTTOM = np.uint64(sum(1 << (col * C4_H1) for col in range(C4_WIDTH)))
+# Bit of each cell of a flattened list-layout board (row 0 on top).
+C4_CELL_BITS = np.array([1 << (col * C4_H1 + (C4_HEIGHT - 1 - row))
+                         for row in range(C4_HEIGHT) for col in range(C4_WIDTH)], dtype=np.uint64)
+C4_PACK_CHUNK = 65536
+
+
+def ttt_pack(boards):
+    """(N, 9) array, 0 empty / 1 X / 2 O -> (x_bits, o_bits) uint16 arrays."""
+    boards = np.asarray(boards)
+    x_bits = ((boards == 1) * TTT_SQUARE_BITS).sum(axis=1, dtype=np.uint16)
+    o_bits = ((boards == 2) * TTT_SQUARE_BITS).sum(axis=1, dtype=np.uint16)
+    return x_bits, o_bits
+
+
+def ttt_results(x_bits, o_bits):
+    """Classify every board; X moves first, so X has as many stones as O or one more."""
+    x_bits = np.asarray(x_bits, dtype=np.uint16)
+    o_bits = np.asarray(o_bits, dtype=np.uint16)
+    out_of_range = ((x_bits | o_bits) & ~np.uint16(ttt_engine.FULL)) != 0
+    x_bits = x_bits & np.uint16(ttt_engine.FULL)
+    o_bits = o_bits & np.uint16(ttt_engine.FULL)
+    x_wins = TTT_WINNING[x_bits]
+    o_wins = TTT_WINNING[o_bits]
+    lead = TTT_POPCOUNT[x_bits] - TTT_POPCOUNT[o_bits]
+    full = (x_bits | o_bits) == ttt_engine.FULL
+    results = np.full(x_bits.shape, ONGOING, dtype=np.int8)
+    results[full] = DRAW
+    results[x_wins] = FIRST_WINS
+    results[o_wins] = SECOND_WINS
+    # Overlapping stones, impossible counts, both winning, or a win by the player who did not move last.
+    invalid = out_of_range | ((x_bits & o_bits) != 0) | (lead < 0) | (lead > 1) | (x_wins & o_wins) \
+        | (x_wins & (lead != 1)) | (o_wins & (lead != 0))
+    results[invalid] = INVALID
+    return results
+
+
+def c4_pack(boards):
+    """(N, 6, 7) array in hw02's list layout (row 0 on top), 0 empty / 1 first / 2 second -> uint64 pairs."""
+    cells = np.asarray(boards).reshape(-1, C4_HEIGHT * C4_WIDTH)
+    first = np.empty(len(cells), dtype=np.uint64)
+    second = np.empty(len(cells), dtype=np.uint64)
+    # Bits are disjoint, so a dot product with the cell bits is an OR; chunks bound the uint64 temporary.
+    for start in range(0, len(cells), C4_PACK_CHUNK):
+        chunk = cells[start:start + C4_PACK_CHUNK]
+        first[start:start + C4_PACK_CHUNK] = (chunk == 1).astype(np.uint64) @ C4_CELL_BITS
+        second[start:start + C4_PACK_CHUNK] = (chunk == 2).astype(np.uint64) @ C4_CELL_BITS
+    return first, second
+
+
+def c4_has_four(stones):
+    """Vectorized connectfour_engine.has_four: two shift-and steps per direction."""
+    found = np.zeros(stones.shape, dtype=bool)
+    for shift in C4_SHIFTS:
+        pairs = stones & (stones >> shift)
+        found |= (pairs & (pairs >> (shift + shift))) != 0
+    return found
+
+
+def popcount64(values):
+    counts = np.zeros(values.shape, dtype=np.int16)
+    for byte in range(8):
+        counts += POPCOUNT_BYTE[(values >> np.uint64(8 * byte)) & np.uint64(0xFF)]
+    return counts
+
+
+def c4_results(first, second):
+    first = np.asarray(first, dtype=np.uint64)
+    second = np.asarray(second, dtype=np.uint64)
+    first_wins = c4_has_four(first)
+    second_wins = c4_has_four(second)
+    lead = popcount64(first) - popcount64(second)
+    full = popcount64(first | second) == C4_WIDTH * C4_HEIGHT
+    # A stone must sit on the bottom row or on another stone.
+    mask = first | second
+    floating = (mask & ~((mask << np.uint64(1)) | C4_BOTTOM)) != 0
+    results = np.full(first.shape, ONGOING, dtype=np.int8)
+    results[full] = DRAW
+    results[first_wins] = FIRST_WINS
+    results[second_wins] = SECOND_WINS
+    invalid = ((first & second) != 0) | (lead < 0) | (lead > 1) | floating | (first_wins & second_wins) \
+        | (first_wins & (lead != 1)) | (second_wins & (lead != 0))
+    results[invalid] = INVALID
+    return results
+
+
+def summarize(results):
+    counts = np.bincount(results, minlength=len(RESULT_NAMES))
+    return {name: int(count) for name, count in zip(RESULT_NAMES, counts)}
@@ -0,0 +1,135 @@
+"""Batch win/draw detection with NumPy vs the scalar per-board checks.
+
+Usage: python benchmarks/bench_batch_eval.py [sizes...]   (default 1000 100000 1000000)
+
+Scalar paths are timed on at most SCALAR_LIMIT boards and scaled to the
+full size so the 1M case finishes in reasonable time.
+"""
+import os
+import sys
+import time
+
+HW_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, HW_DIR)
+
+import numpy as np
+
+import batch_eval
+import ttt_engine
+
+SCALAR_LIMIT = 100000
+
+
+def check_winner(board, player):
+    # games/ttt.py before the bitboard engine.
+    win_conditions = [
+        [0,1,2], [3,4,5], [6,7,8],  # rows
+        [0,3,6], [1,4,7], [2,5,8],  # columns
+        [0,4,8], [2,4,6]            # diagonals
+    ]
+    return any(all(board[pos] == player for pos in condition) for condition in win_conditions)
+
+
+def check_connectfour_board(board, player):
+    # hw02 check_connectfour_winner, applied to every stone since a stored board has no "last move".
+    for row in range(6):
+        for column in range(7):
+            if board[row][column] != player:
+                continue
+            for dx, dy in [(0,1), (1,0), (1,1), (1,-1)]:
+                count = 1
+                x, y = row + dx, column + dy
+                while 0 <= x < 6 and 0 <= y < 7 and board[x][y] == player:
+                    count += 1
+                    x += dx
+                    y += dy
+                if count >= 4:
+                    return True
+    return False
+
+
+def random_ttt(n, rng):
+    """Random legal positions: shuffle squares, play a random number of alternating moves."""
+    order = np.argsort(rng.random((n, 9)), axis=1)
+    moves = rng.integers(0, 10, n)
+    plies = np.argsort(order, axis=1)  # ply at which each square is played
+    boards = np.where(plies < moves[:, None], np.where(plies % 2 == 0, 1, 2), 0).astype(np.int8)
+    return boards
+
+
+def random_c4(n, rng):
+    """Random gravity-respecting boards in hw02's list layout (row 0 on top).
+
+    Owners are random, so most boards come out INVALID on stone counts; the
+    classification cost is the same either way.
+    """
+    heights = rng.integers(0, 7, (n, 7))
+    rows = np.arange(6)[None, :, None]
+    filled = (5 - rows) < heights[:, None, :]
+    owners = rng.integers(1, 3, (n, 6, 7))
+    return np.where(filled, owners, 0).astype(np.int8)
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def scalar_time(func, sample, n):
+    """Time func over sample and scale to n boards."""
+    elapsed, _ = timed(lambda: [func(item) for item in sample])
+    return elapsed * n / len(sample)
+
+
+def bench_ttt(n, rng):
+    boards = random_ttt(n, rng)
+    as_lists = [[' ' if c == 0 else 'X' if c == 1 else 'O' for c in board] for board in boards[:SCALAR_LIMIT].tolist()]
+    list_time = scalar_time(lambda board: check_winner(board, 'X') or check_winner(board, 'O'), as_lists, n)
+    x_bits, o_bits = batch_eval.ttt_pack(boards)
+    pairs = list(zip(x_bits[:SCALAR_LIMIT].tolist(), o_bits[:SCALAR_LIMIT].tolist()))
+    engine_time = scalar_time(lambda pair: ttt_engine.is_win(pair[0]) or ttt_engine.is_win(pair[1]), pairs, n)
+    pack_time, (x_bits, o_bits) = timed(lambda: batch_eval.ttt_pack(boards))
+    eval_time, _ = timed(lambda: batch_eval.ttt_results(x_bits, o_bits))
+    report("ttt", n, list_time, engine_time, pack_time, eval_time)
+
+
+def bench_c4(n, rng):
+    boards = random_c4(n, rng)
+    as_lists = [[[' ' if c == 0 else 'X' if c == 1 else 'O' for c in row] for row in board]
+                for board in boards[:SCALAR_LIMIT // 10].tolist()]
+    list_time = scalar_time(lambda board: check_connectfour_board(board, 'X') or check_connectfour_board(board, 'O'),
+                            as_lists, n)
+    first, second = batch_eval.c4_pack(boards)
+    stones = list(zip(first[:SCALAR_LIMIT].tolist(), second[:SCALAR_LIMIT].tolist()))
+    engine_time = scalar_time(lambda pair: batch_has_four(pair[0]) or batch_has_four(pair[1]), stones, n)
+    pack_time, (first, second) = timed(lambda: batch_eval.c4_pack(boards))
+    eval_time, _ = timed(lambda: batch_eval.c4_results(first, second))
+    report("c4", n, list_time, engine_time, pack_time, eval_time)
+
+
+def batch_has_four(stones):
+    # connectfour_engine.has_four, inlined so hw03 does not import from hw02.
+    for shift in (1, 7, 6, 8):
+        pairs = stones & (stones >> shift)
+        if pairs & (pairs >> (2 * shift)):
+            return True
+    return False
+
+
+def report(game, n, list_time, engine_time, pack_time, eval_time):
+    print(f"{game:4} {n:>9}  list {list_time * 1000:10.1f} ms  bitboard loop {engine_time * 1000:9.1f} ms"
+          f"  numpy pack {pack_time * 1000:8.1f} ms + eval {eval_time * 1000:7.1f} ms"
+          f"  ({list_time / (pack_time + eval_time):6.0f}x vs list, {engine_time / eval_time:5.0f}x eval vs loop)")
+
+
+def main(sizes):
+    rng = np.random.default_rng(1)
+    for n in sizes:
+        bench_ttt(n, rng)
+    for n in sizes:
+        bench_c4(n, rng)
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 100000, 1000000])
@@ -0,0 +1,63 @@
+"""Cold vs warm game start: read + exec from scratch against GameLoader.
+
+Usage: python benchmarks/bench_game_loader.py [iterations]
+"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+HW_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, HW_DIR)
+
+import aiofiles
+
+from game_loader import GameLoader
+
+GAMES = ["ttt", "rps"]
+
+
+async def exec_from_scratch(file_path):
+    async with aiofiles.open(file_path, 'r') as f:
+        code = await f.read()
+    game_globals = {}
+    exec(code, game_globals)
+    return game_globals
+
+
+async def timed(factory, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await factory()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+async def main(iterations):
+    cache_dir = tempfile.mkdtemp()
+    try:
+        for game in GAMES:
+            file_path = os.path.join(HW_DIR, "games", game + ".py")
+            baseline = await timed(lambda: exec_from_scratch(file_path), iterations)
+            # Cold: new loader, empty disk cache, every iteration compiles.
+            async def cold():
+                shutil.rmtree(cache_dir, ignore_errors=True)
+                await GameLoader(cache_dir).load(file_path)
+            cold_us = await timed(cold, iterations)
+            # Disk-warm: new loader (client restart), marshalled code on disk.
+            await GameLoader(cache_dir).load(file_path)
+            disk_us = await timed(lambda: GameLoader(cache_dir).load(file_path), iterations)
+            # Memory-warm: same loader, namespace reused across matches.
+            loader = GameLoader(cache_dir)
+            await loader.load(file_path)
+            warm_us = await timed(lambda: loader.load(file_path), iterations)
+            print(f"{game}: read+exec {baseline:8.1f} us | cold {cold_us:8.1f} us | "
+                  f"disk-warm {disk_us:8.1f} us | warm {warm_us:8.1f} us")
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    asyncio.run(main(iterations))
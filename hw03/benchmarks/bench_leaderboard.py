@@ -0,0 +1,84 @@
+"""Leaderboard: Elo updates, RANK and LEADERBOARD pages vs sorting every player.
+
+Rates a synthetic population (default 100k players) by playing random
+matches, then times one rating update, a player's rank and a page of ten
+at the top, the middle and the end of the board. The baseline keeps a
+plain {player: rating} dict and sorts it for every RANK or LEADERBOARD,
+which is what the server would do without the skip list. Also reports how
+often the cached top page had to be rebuilt while ratings kept changing.
+
+Usage: python benchmarks/bench_leaderboard.py [players]   (default 100000)
+"""
+import os
+import random
+import sys
+import time
+
+HW_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, HW_DIR)
+
+import leaderboard
+
+UPDATES = 20000
+QUERIES = 2000
+SORT_REPEAT = 5
+
+
+def sorted_rank(ratings, player):
+    order = sorted(ratings, key=lambda name: (-ratings[name], name))
+    return order.index(player) + 1
+
+
+def sorted_page(ratings, offset, limit):
+    order = sorted(ratings.items(), key=lambda item: (-item[1], item[0]))
+    return [(offset + number + 1, player, rating)
+            for number, (player, rating) in enumerate(order[offset:offset + limit])]
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main(players):
+    rng = random.Random(1)
+    names = [f"player{n}" for n in range(players)]
+    start = time.perf_counter()
+    board = leaderboard.Leaderboard({name: round(rng.gauss(1200, 200), 2) for name in names})
+    print(f"{players} players loaded in {time.perf_counter() - start:.2f} s")
+
+    matches = [(rng.choice(names), rng.choice(names), rng.choice((1.0, 0.5, 0.0))) for _ in range(UPDATES)]
+    matches = [(first, second, score) for first, second, score in matches if first != second]
+    start = time.perf_counter()
+    for first, second, score in matches:
+        board.record(first, second, score)
+    update = (time.perf_counter() - start) / len(matches)
+    print(f"Elo update (two players re-ranked)  {update * 1e6:9.1f} µs")
+
+    wanted = rng.sample(names, QUERIES)
+    rank_time = timed(lambda: [board.rank(name) for name in wanted], 1) / QUERIES
+    sort_rank = timed(lambda: sorted_rank(board.ratings, wanted[0]), SORT_REPEAT)
+    assert sorted_rank(board.ratings, wanted[0]) == board.rank(wanted[0])
+    print(f"RANK  skip list {rank_time * 1e6:9.1f} µs   sort all {sort_rank * 1e6:11.0f} µs"
+          f"   ({sort_rank / rank_time:.0f}x)")
+
+    for label, offset in (("top", 0), ("middle", players // 2), ("end", players - 10)):
+        assert board.page(offset, 10) == sorted_page(board.ratings, offset, 10)
+        page_time = timed(lambda: board.page(offset, 10), QUERIES)
+        sort_time = timed(lambda: sorted_page(board.ratings, offset, 10), SORT_REPEAT)
+        print(f"LEADERBOARD {label:6} skip list {page_time * 1e6:9.1f} µs   sort all {sort_time * 1e6:11.0f} µs"
+              f"   ({sort_time / page_time:.0f}x)")
+
+    # Interleave updates with top-page reads, as a busy lobby would.
+    board.top_rebuilds = 0
+    for first, second, score in matches:
+        board.record(first, second, score)
+        board.page(0, 10)
+    print(f"top {board.top_size} cache rebuilt {board.top_rebuilds} times over {len(matches)} updates"
+          f" ({board.top_rebuilds / len(matches):.1%})")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
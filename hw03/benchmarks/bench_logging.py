@@ -0,0 +1,113 @@
+"""Event-loop time spent logging under broadcast load: direct vs queued handlers.
+
+Each simulated lobby event (a login) broadcasts the lobby JSON to every
+connected client, saves the users file and logs the way the server does.
+The old setup formats f-strings and writes to the log file and console on
+the loop thread, including the full users dump at DEBUG. The new one only
+queues records for logger_setup's listener thread, formats lazily, logs a
+user count instead of the dump and samples a per-recipient DEBUG line.
+The console goes to /dev/null here; a real terminal is slower still.
+
+Usage: python benchmarks/bench_logging.py [events] [clients]   (default 2000 200)
+"""
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+HW_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, HW_DIR)
+
+import config
+import logger_setup
+
+USERS = 1000
+
+
+class NullWriter:
+    def write(self, data):
+        pass
+
+    async def drain(self):
+        pass
+
+
+def direct_logger(log_file):
+    """logger_setup.setup_logger before the queue: handlers run on the caller's thread."""
+    logger = logging.getLogger("bench.direct")
+    logger.setLevel(logging.DEBUG)
+    formatter = logging.Formatter(logger_setup.FORMAT)
+    fh = logging.FileHandler(log_file)
+    fh.setLevel(logging.DEBUG)
+    ch = logging.StreamHandler()
+    ch.setLevel(logging.INFO)
+    for handler in (fh, ch):
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+    return logger
+
+
+async def login_event_direct(logger, writers, users, name):
+    message = json.dumps({"type": "ONLINE_USERS", "online_users": list(users)[:len(writers)]}) + '\n'
+    for number, writer in enumerate(writers):
+        writer.write(message.encode())
+        await writer.drain()
+        logger.debug(f"Sent lobby update to client {number}")
+    data = json.dumps(users, indent=4)
+    logger.debug(f"Saved users: {data}")
+    logger.info(f"用戶登錄成功: {name}")
+
+
+async def login_event_queued(logger, writers, users, name):
+    message = json.dumps({"type": "ONLINE_USERS", "online_users": list(users)[:len(writers)]}) + '\n'
+    for number, writer in enumerate(writers):
+        writer.write(message.encode())
+        await writer.drain()
+        logger.debug("Sent lobby update to client %d", number)
+    json.dumps(users, indent=4)
+    logger.debug("Saved %d users to %s", len(users), "users.json")
+    logger.info("用戶登錄成功: %s", name)
+
+
+async def run(event, logger, events, clients, users):
+    writers = [NullWriter() for _ in range(clients)]
+    times = []
+    for number in range(events):
+        start = time.perf_counter()
+        await event(logger, writers, users, f"player{number % USERS}")
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def report(label, times, log_file, drain=0.0):
+    times = sorted(times)
+    print(f"{label:8} per event mean {statistics.fmean(times) * 1e6:8.0f} µs"
+          f"  p99 {times[int(len(times) * 0.99)] * 1e6:8.0f} µs"
+          f"  log {os.path.getsize(log_file) / 1e6:7.1f} MB"
+          + (f"  (listener drained {drain * 1000:.0f} ms after the loop)" if drain else ""))
+    return statistics.fmean(times)
+
+
+def main(events, clients):
+    users = {f"player{n}": {"password": "x" * 64, "status": "idle"} for n in range(USERS)}
+    sys.stderr = open(os.devnull, 'w')
+    with tempfile.TemporaryDirectory() as folder:
+        direct_file = os.path.join(folder, "direct.log")
+        direct = report("direct", asyncio.run(run(login_event_direct, direct_logger(direct_file), events, clients, users)),
+                        direct_file)
+
+        queued_file = os.path.join(folder, "queued.log")
+        logger = logger_setup.setup_logger(queued_file, name="bench.queued", debug_rate=config.LOG_DEBUG_RATE)
+        times = asyncio.run(run(login_event_queued, logger, events, clients, users))
+        start = time.perf_counter()
+        logger_setup.stop_logging()
+        queued = report("queued", times, queued_file, time.perf_counter() - start)
+    print(f"event-loop time saved: {(direct - queued) * 1e6:.0f} µs per event ({direct / queued:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000, int(sys.argv[2]) if len(sys.argv) > 2 else 200)
@@ -0,0 +1,97 @@
+"""Loop monitor: overhead on a busy loop and what it catches.
+
+Part one runs many small tasks that yield to each other, with and without
+the monitor, and compares the time taken. Part two injects the blocking
+calls the lobby used to make on its loop (PBKDF2 hashes, an indented
+json.dumps of a large users dict, a synchronous sleep) between normal
+ticks and prints the lag quantiles plus the innermost frame of every
+stack the watchdog captured.
+
+Usage: python benchmarks/bench_loop_monitor.py [tasks]   (default 1000)
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+
+HW_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, HW_DIR)
+
+import auth
+import config
+from loop_monitor import LoopMonitor
+
+YIELDS = 200
+ROUNDS = 5
+USERS = {f"player{n}": hashlib.sha256(str(n).encode()).hexdigest() * 2 for n in range(200000)}
+
+
+async def busy_loop(tasks):
+    async def worker():
+        for _ in range(YIELDS):
+            await asyncio.sleep(0)
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(tasks)))
+    return time.perf_counter() - start
+
+
+async def overhead(tasks, monitored):
+    monitor = LoopMonitor(config.LOOP_MONITOR_INTERVAL, config.LOOP_STALL_THRESHOLD)
+    if monitored:
+        await monitor.start()
+    elapsed = await busy_loop(tasks)
+    monitor.stop()
+    return elapsed
+
+
+def pbkdf2_hashes():
+    for _ in range(3):
+        auth.hash_password("hunter2")
+
+
+def dump_users():
+    json.dumps(USERS, indent=4)
+
+
+def sleep_sync():
+    time.sleep(0.3)
+
+
+async def stalls():
+    monitor = LoopMonitor(config.LOOP_MONITOR_INTERVAL, config.LOOP_STALL_THRESHOLD,
+                          logger=logging.getLogger("bench.silent"))
+    await monitor.start()
+    await asyncio.sleep(0.5)
+    for blocker in (pbkdf2_hashes, dump_users, sleep_sync):
+        start = time.perf_counter()
+        blocker()
+        print(f"{blocker.__name__:14} blocked the loop {(time.perf_counter() - start) * 1000:6.0f} ms")
+        await asyncio.sleep(0.3)
+    monitor.stop()
+    quantiles = monitor.quantiles()
+    print("lag " + "  ".join(f"p{q * 100:g} {lag * 1000:.1f} ms" for q, lag in quantiles.items())
+          + f"  max {monitor.max_lag * 1000:.0f} ms, {monitor.slow_callbacks} slow ticks")
+    for _, blocked, stack in monitor.stacks:
+        innermost = stack.rstrip().splitlines()[-2].strip()
+        print(f"captured after {blocked * 1000:4.0f} ms: {innermost}")
+
+
+def main(tasks):
+    silent = logging.getLogger("bench.silent")
+    silent.addHandler(logging.NullHandler())
+    silent.propagate = False
+    times = {False: [], True: []}
+    for _ in range(ROUNDS):
+        for monitored in times:
+            times[monitored].append(asyncio.run(overhead(tasks, monitored)))
+    plain, monitored = min(times[False]), min(times[True])
+    print(f"{tasks} tasks x {YIELDS} yields (best of {ROUNDS}): no monitor {plain * 1000:.0f} ms, "
+          f"with monitor {monitored * 1000:.0f} ms ({(monitored / plain - 1) * 100:+.1f}%)\n")
+    asyncio.run(stalls())
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
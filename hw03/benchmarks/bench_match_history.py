@@ -0,0 +1,126 @@
+"""Match history queries at scale: NumPy columns vs a loop over match dicts.
+
+Builds a synthetic history (default 10M matches, 10k players, 20 games),
+then times STATS for a player and a game and HISTORY for a player. The
+dict loop is timed on at most LOOP_LIMIT matches and scaled to the full
+size. Also times writing and loading the column files.
+
+Usage: python benchmarks/bench_match_history.py [matches]   (default 10000000)
+"""
+import os
+import sys
+import tempfile
+import time
+
+HW_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, HW_DIR)
+
+import numpy as np
+
+import match_history
+
+PLAYERS = 10000
+GAMES = 20
+LOOP_LIMIT = 1000000
+REPEAT = 5
+
+
+def synthetic_history(matches, rng):
+    history = match_history.MatchHistory()
+    history.players = [f"player{n}" for n in range(PLAYERS)]
+    history.player_ids = {name: n for n, name in enumerate(history.players)}
+    history.games = [f"game{n}" for n in range(GAMES)]
+    history.game_ids = {name: n for n, name in enumerate(history.games)}
+    history.names_dirty = True
+    first = rng.integers(0, PLAYERS, matches)
+    second = (first + rng.integers(1, PLAYERS, matches)) % PLAYERS
+    history.extend({
+        "first": first,
+        "second": second,
+        "game": rng.integers(0, GAMES, matches),
+        "outcome": rng.choice(5, matches, p=[0.03, 0.45, 0.4, 0.1, 0.02]),
+        "duration": rng.exponential(60, matches),
+        "ended_at": 1.7e9 + np.arange(matches, dtype=np.float64)
+    })
+    return history
+
+
+def as_dicts(history, limit):
+    names, games = history.players, history.games
+    columns = [history.column(name)[:limit].tolist() for name in ("first", "second", "game", "outcome", "duration")]
+    return [{"first": names[a], "second": names[b], "game": games[g], "outcome": o, "duration": d}
+            for a, b, g, o, d in zip(*columns)]
+
+
+def loop_player_stats(matches, player):
+    stats = {"matches": 0, "wins": 0, "losses": 0, "draws": 0, "games": {}}
+    for match in matches:
+        if match["first"] == player:
+            won, lost = match["outcome"] == match_history.FIRST_WINS, match["outcome"] == match_history.SECOND_WINS
+        elif match["second"] == player:
+            won, lost = match["outcome"] == match_history.SECOND_WINS, match["outcome"] == match_history.FIRST_WINS
+        else:
+            continue
+        game = stats["games"].setdefault(match["game"], {"matches": 0, "wins": 0, "losses": 0, "draws": 0})
+        for counts in (stats, game):
+            counts["matches"] += 1
+            counts["wins"] += won
+            counts["losses"] += lost
+            counts["draws"] += match["outcome"] == match_history.DRAW
+    return stats
+
+
+def loop_game_stats(matches, game):
+    counts = [0] * len(match_history.OUTCOME_NAMES)
+    duration = 0.0
+    for match in matches:
+        if match["game"] == game:
+            counts[match["outcome"]] += 1
+            duration += match["duration"]
+    return counts, duration
+
+
+def loop_history(matches, player, limit=10):
+    return [match for match in matches if player in (match["first"], match["second"])][-limit:][::-1]
+
+
+def timed(func, repeat=REPEAT):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main(matches):
+    rng = np.random.default_rng(1)
+    start = time.perf_counter()
+    history = synthetic_history(matches, rng)
+    print(f"{matches} matches built in {time.perf_counter() - start:.1f} s, "
+          f"{sum(history.column(name).nbytes for name, _ in match_history.COLUMNS) / 1e6:.0f} MB of columns")
+
+    sample = as_dicts(history, LOOP_LIMIT)
+    scale = matches / len(sample)
+    queries = [
+        ("STATS player", lambda: history.player_stats("player42"), lambda: loop_player_stats(sample, "player42")),
+        ("STATS game", lambda: history.game_stats("game7"), lambda: loop_game_stats(sample, "game7")),
+        ("HISTORY player", lambda: history.history("player42"), lambda: loop_history(sample, "player42")),
+    ]
+    for label, vectorized, loop in queries:
+        numpy_time = timed(vectorized)
+        loop_time = timed(loop, 1) * scale
+        print(f"{label:16} numpy {numpy_time * 1000:8.1f} ms   dict loop {loop_time * 1000:9.0f} ms"
+              f"   ({loop_time / numpy_time:.0f}x)")
+
+    with tempfile.TemporaryDirectory() as folder:
+        history.folder = folder
+        write_time = timed(history.flush, 1)
+        load_time = timed(lambda: match_history.open_history(folder), 1)
+        assert len(match_history.open_history(folder)) == matches
+        history.append("player1", "player2", "game1", match_history.FIRST_WINS, 30.0, time.time())
+        append_time = timed(history.flush, 1)
+        print(f"flush all {write_time * 1000:.0f} ms, load {load_time * 1000:.0f} ms, "
+              f"append + flush one match {append_time * 1e6:.0f} µs")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000000)
@@ -0,0 +1,87 @@
+"""Cost of the metrics endpoint: per-update overhead and scrape time.
+
+Times the counter, labelled counter and histogram updates the lobby makes
+on its hot paths, then renders a registry shaped like the server's with
+callback gauges over many online users and rooms, both directly and over
+HTTP from the same event loop.
+
+Usage: python benchmarks/bench_metrics.py [users]   (default 10000)
+"""
+import asyncio
+import os
+import sys
+import time
+
+HW_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, HW_DIR)
+
+import metrics
+
+UPDATES = 1000000
+SCRAPES = 50
+STATUSES = ("idle", "In Room", "In Game")
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def lobby_registry(users, rooms):
+    registry = metrics.Registry()
+    registry.counter("lobby_bytes_sent_total", "Bytes written to lobby clients")
+    registry.histogram("lobby_broadcast_fanout", "Recipients of each broadcast", (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000))
+    registry.counter("lobby_file_transfer_bytes_total", "File bytes", ("direction", "kind"))
+
+    def count_by(items, *keys):
+        counts = {}
+        for item in items:
+            key = tuple(item[name] for name in keys)
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    registry.gauge("lobby_online_users", "Users by status", ("status",), callback=lambda: count_by(users.values(), "status"))
+    registry.gauge("lobby_rooms", "Rooms by status and type", ("status", "type"),
+                   callback=lambda: count_by(rooms.values(), "status", "type"))
+    return registry
+
+
+async def scrape_over_http(registry, count):
+    server = metrics.MetricsServer(registry)
+    listener = await server.start('127.0.0.1', 0)
+    port = listener.sockets[0].getsockname()[1]
+    start = time.perf_counter()
+    for _ in range(count):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        await writer.drain()
+        body = await reader.read()
+        writer.close()
+    elapsed = (time.perf_counter() - start) / count
+    listener.close()
+    await listener.wait_closed()
+    return elapsed, len(body)
+
+
+def main(user_count):
+    counter = metrics.Counter("c", "counter")
+    labelled = metrics.Counter("l", "labelled", ("direction", "kind"))
+    histogram = metrics.Histogram("h", "histogram", (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000))
+    print(f"counter.inc                      {timed(lambda: counter.inc(512), UPDATES) * 1e9:6.0f} ns")
+    print(f"labels(...).inc                  {timed(lambda: labelled.labels('upload', 'game').inc(512), UPDATES) * 1e9:6.0f} ns")
+    print(f"histogram.observe (fan-out 150)  {timed(lambda: histogram.observe(150), UPDATES) * 1e9:6.0f} ns")
+
+    users = {f"player{n}": {"status": STATUSES[n % 3]} for n in range(user_count)}
+    rooms = {f"room{n}": {"status": ("Waiting", "In Game")[n % 2], "type": ("public", "private")[n % 3 == 0]}
+             for n in range(user_count // 2)}
+    registry = lobby_registry(users, rooms)
+    render = timed(registry.render, SCRAPES)
+    http, size = asyncio.run(scrape_over_http(registry, SCRAPES))
+    print(f"\n{user_count} users, {len(rooms)} rooms: render {render * 1000:.2f} ms, "
+          f"HTTP scrape {http * 1000:.2f} ms ({size} bytes)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
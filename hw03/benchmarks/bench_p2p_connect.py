@@ -0,0 +1,94 @@
+"""START_GAME to connected: fixed retry vs backoff vs backoff + peer_ready.
+
+The host starts listening after a random delay (its game still loading),
+the client starts connecting at once. Reports time until the client is
+connected for each strategy.
+
+Usage: python benchmarks/bench_p2p_connect.py [trials] [max_host_delay_ms]
+"""
+import asyncio
+import contextlib
+import io
+import os
+import random
+import socket
+import statistics
+import sys
+import time
+
+HW_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, HW_DIR)
+
+import game_transport
+
+LOBBY_HOP = 0.001  # host -> lobby -> client forwarding of peer_ready
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def fixed_retry(port, peer_info, retry_delay=2, max_retries=10):
+    # The games' connect loop before peer_ready and backoff.
+    for attempt in range(max_retries):
+        try:
+            return await asyncio.open_connection('127.0.0.1', port)
+        except ConnectionRefusedError:
+            await asyncio.sleep(retry_delay)
+    return None
+
+
+async def backoff(port, peer_info):
+    return await game_transport.connect_peer('127.0.0.1', port, peer_info)
+
+
+async def trial(strategy, host_delay, signal):
+    loop = asyncio.get_running_loop()
+    port = free_port()
+    peer_info = {"role": "client"}
+    if signal:
+        game_transport.set_event_handler(lambda event: loop.call_later(LOBBY_HOP, game_transport.signal_peer_ready))
+    else:
+        game_transport.set_event_handler(None)
+
+    async def host():
+        await asyncio.sleep(host_delay)
+        conn = await game_transport.accept_peer(port, {"role": "host"})
+        await conn.close()
+
+    host_task = asyncio.create_task(host())
+    start = time.perf_counter()
+    result = await strategy(port, peer_info)
+    elapsed = time.perf_counter() - start
+    if isinstance(result, tuple):
+        result[1].close()
+    elif result is not None:
+        await result.close()
+    await host_task
+    return elapsed
+
+
+async def main(trials, max_host_delay):
+    delays = [random.uniform(0, max_host_delay) for _ in range(trials)]
+    cases = [
+        ("fixed 2 s retry", fixed_retry, False),
+        ("jittered backoff", backoff, False),
+        ("backoff + peer_ready", backoff, True)
+    ]
+    print(f"{trials} trials, host listens after 0-{max_host_delay * 1000:.0f} ms")
+    for name, strategy, signal in cases:
+        samples = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for delay in delays:
+                samples.append(await trial(strategy, delay, signal))
+        samples.sort()
+        p95 = samples[int(len(samples) * 0.95) - 1]
+        print(f"{name:22} p50 {statistics.median(samples) * 1000:8.1f} ms   p95 {p95 * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    trials = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    max_host_delay = (int(sys.argv[2]) if len(sys.argv) > 2 else 300) / 1000
+    asyncio.run(main(trials, max_host_delay))
@@ -0,0 +1,72 @@
+"""Overhead of the sampling profiler vs running under cProfile.
+
+Runs a lobby-like workload on an event loop (JSON-encoding a lobby update
+and writing it to many fake clients, yielding between clients) plain,
+under profiler.profile at the configured interval, with tracemalloc as
+well, and under cProfile, and reports the slowdown of each.
+
+Usage: python benchmarks/bench_profiler.py [events]   (default 2000)
+"""
+import asyncio
+import cProfile
+import json
+import os
+import sys
+import time
+
+HW_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, HW_DIR)
+
+import config
+import profiler
+
+CLIENTS = 100
+ROUNDS = 3
+
+
+class NullWriter:
+    def write(self, data):
+        pass
+
+    async def drain(self):
+        pass
+
+
+async def workload(events):
+    writers = [NullWriter() for _ in range(CLIENTS)]
+    users = [{"username": f"player{n}", "status": "idle"} for n in range(CLIENTS)]
+    start = time.perf_counter()
+    for _ in range(events):
+        message = (json.dumps({"status": "update", "type": "online_users", "data": users}) + '\n').encode()
+        for writer in writers:
+            writer.write(message)
+            await writer.drain()
+        await asyncio.sleep(0)
+    return time.perf_counter() - start
+
+
+async def run_sampled(events, memory):
+    """Profile for as long as the workload runs."""
+    window = asyncio.create_task(profiler.profile(3600, memory, config.PROFILE_INTERVAL))
+    await asyncio.sleep(0)
+    elapsed = await workload(events)
+    window.cancel()
+    return elapsed
+
+
+def main(events):
+    times = {"plain": [], "sampling": [], "sampling + tracemalloc": [], "cProfile": []}
+    for _ in range(ROUNDS):
+        times["plain"].append(asyncio.run(workload(events)))
+        times["sampling"].append(asyncio.run(run_sampled(events, False)))
+        times["sampling + tracemalloc"].append(asyncio.run(run_sampled(events, True)))
+        with cProfile.Profile():
+            times["cProfile"].append(asyncio.run(workload(events)))
+    plain = min(times["plain"])
+    for label, values in times.items():
+        best = min(values)
+        print(f"{label:24} {best * 1000:8.0f} ms  ({(best / plain - 1) * 100:+6.1f}%)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,110 @@
+"""Loopback benchmark: relay throughput and added round-trip latency.
+
+Usage: python benchmarks/bench_relay.py [megabytes] [round_trips]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from relay import RelayServer, open_relay_connection
+
+CHUNK = 64 * 1024
+
+
+async def echo(reader, writer):
+    while True:
+        data = await reader.read(CHUNK)
+        if not data:
+            break
+        writer.write(data)
+        await writer.drain()
+    writer.close()
+
+
+async def sink(reader, total):
+    received = 0
+    while received < total:
+        data = await reader.read(CHUNK)
+        if not data:
+            break
+        received += len(data)
+    return received
+
+
+async def measure_throughput(writer, reader, total):
+    payload = b'x' * CHUNK
+    start = time.perf_counter()
+    receiver = asyncio.create_task(sink(reader, total))
+    sent = 0
+    while sent < total:
+        writer.write(payload)
+        await writer.drain()
+        sent += len(payload)
+    await receiver
+    return total / (time.perf_counter() - start) / (1024 * 1024)
+
+
+async def measure_rtt(reader, writer, round_trips):
+    samples = []
+    for _ in range(round_trips):
+        start = time.perf_counter()
+        writer.write(b'{"move": 4}\n')
+        await writer.drain()
+        await reader.readline()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(samples), sorted(samples)[int(len(samples) * 0.99) - 1]
+
+
+async def direct_pair():
+    accepted = asyncio.get_running_loop().create_future()
+    server = await asyncio.start_server(lambda r, w: accepted.set_result((r, w)), '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    a = await asyncio.open_connection('127.0.0.1', port)
+    b = await accepted
+    return server, a, b
+
+
+async def relay_pair(relay_port, token):
+    a, b = await asyncio.gather(
+        open_relay_connection('127.0.0.1', relay_port, token),
+        open_relay_connection('127.0.0.1', relay_port, token)
+    )
+    return a, b
+
+
+async def main(megabytes, round_trips):
+    total = megabytes * 1024 * 1024
+    relay = RelayServer()
+    relay_srv = await relay.start('127.0.0.1', 0)
+    relay_port = relay_srv.sockets[0].getsockname()[1]
+
+    server, (ra, wa), (rb, wb) = await direct_pair()
+    direct_mbps = await measure_throughput(wa, rb, total)
+    echo_task = asyncio.create_task(echo(rb, wb))
+    direct_rtt = await measure_rtt(ra, wa, round_trips)
+    wa.close()
+    await echo_task
+    server.close()
+
+    (ra, wa), (rb, wb) = await relay_pair(relay_port, 'bench-throughput')
+    relay_mbps = await measure_throughput(wa, rb, total)
+    echo_task = asyncio.create_task(echo(rb, wb))
+    relay_rtt = await measure_rtt(ra, wa, round_trips)
+    wa.close()
+    await echo_task
+    relay_srv.close()
+
+    print(f"payload: {megabytes} MiB, round trips: {round_trips}")
+    print(f"direct: {direct_mbps:8.1f} MiB/s  rtt p50 {direct_rtt[0]:7.1f} us  p99 {direct_rtt[1]:7.1f} us")
+    print(f"relay:  {relay_mbps:8.1f} MiB/s  rtt p50 {relay_rtt[0]:7.1f} us  p99 {relay_rtt[1]:7.1f} us")
+    print(f"added latency p50: {relay_rtt[0] - direct_rtt[0]:.1f} us, relay stats: {relay.stats()}")
+
+
+if __name__ == "__main__":
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    round_trips = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    asyncio.run(main(megabytes, round_trips))
@@ -0,0 +1,132 @@
+"""Replay log: recording cost per move and seek time into a large log.
+
+Part one times a move round trip between two GameConnections over a
+loopback socket with and without the recorder. Part two writes a log of
+many 9-move matches and compares looking one up through the mmap index
+with scanning an equivalent JSON-lines log.
+
+Usage: python benchmarks/bench_replay_log.py [matches]   (default 100000)
+"""
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import sys
+import tempfile
+import time
+
+HW_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, HW_DIR)
+
+import game_transport
+import replay_log
+
+ROUND_TRIPS = 20000
+LOOKUPS = 200
+
+
+async def connection_pair(replay_path):
+    left, right = socket.socketpair()
+    peer_info = {"replay_path": replay_path, "trace_id": "bench", "game_name": "ttt", "role": "host"}
+    a = game_transport.GameConnection(*await asyncio.open_connection(sock=left), dict(peer_info))
+    b = game_transport.GameConnection(*await asyncio.open_connection(sock=right), dict(peer_info, role="client"))
+    return a, b
+
+
+async def round_trips():
+    """Alternate the two setups move by move so machine noise hits both alike."""
+    pairs = {"without recorder": await connection_pair(None), "with recorder": await connection_pair("unused")}
+    samples = {label: [] for label in pairs}
+    for move in range(ROUND_TRIPS):
+        for label, (a, b) in pairs.items():
+            start = time.perf_counter()
+            await a.send({"move": move % 9})
+            await b.receive()
+            await b.send({"move": move % 9})
+            await a.receive()
+            samples[label].append(time.perf_counter() - start)
+    for a, b in pairs.values():
+        a.recorder = b.recorder = None  # nothing to save; only the per-move cost matters
+        await a.close()
+        await b.close()
+    return samples
+
+
+def bench_recording():
+    recorder = replay_log.ReplayRecorder("bench", "ttt", "host")
+    start = time.perf_counter()
+    for move in range(ROUND_TRIPS):
+        recorder.record(replay_log.SENT, move, move % 9)
+    record_ns = (time.perf_counter() - start) / ROUND_TRIPS * 1e9
+    print(f"recorder.record                {record_ns:8.0f} ns/move")
+    for label, times in asyncio.run(round_trips()).items():
+        print(f"loopback round trip {label:17} p50 {statistics.median(times) * 1e6:6.1f} µs"
+              f"  mean {statistics.fmean(times) * 1e6:6.1f} µs  (2 moves, each recorded by both sides)")
+
+
+def write_logs(folder, matches, rng):
+    path = os.path.join(folder, "replays")
+    match_ids = []
+    with open(os.path.join(folder, "replays.jsonl"), 'w') as jsonl:
+        for number in range(matches):
+            recorder = replay_log.ReplayRecorder(f"{number:016x}", "ttt", "host")
+            moves = rng.sample(range(9), 9)
+            for seq, move in enumerate(moves):
+                recorder.record(seq % 2, seq // 2, move)
+            replay_log.append(path, recorder)
+            jsonl.write(json.dumps({"match_id": recorder.match_id, "game": "ttt", "role": "host",
+                                    "moves": [{"elapsed_ms": 0, "seq": seq // 2, "side": seq % 2, "move": move}
+                                              for seq, move in enumerate(moves)]}) + '\n')
+            match_ids.append(recorder.match_id)
+    return path, match_ids
+
+
+def bench_lookup(matches):
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as folder:
+        start = time.perf_counter()
+        path, match_ids = write_logs(folder, matches, rng)
+        print(f"\nwrote {matches} matches in {time.perf_counter() - start:.1f} s: "
+              f"replays.rec+idx {(os.path.getsize(path + '.rec') + os.path.getsize(path + '.idx')) / 1e6:.1f} MB, "
+              f"jsonl {os.path.getsize(os.path.join(folder, 'replays.jsonl')) / 1e6:.1f} MB")
+        wanted = rng.sample(match_ids, LOOKUPS)
+
+        start = time.perf_counter()
+        with replay_log.ReplayReader(path) as reader:
+            opened = time.perf_counter() - start
+            start = time.perf_counter()
+            reader.find(wanted[0])
+            indexed = time.perf_counter() - start
+            start = time.perf_counter()
+            for match_id in wanted:
+                reader.moves(reader.find(match_id)[0])
+            lookup = (time.perf_counter() - start) / LOOKUPS
+            # Entry numbers are known, e.g. from the client's peer_info: no index scan at all.
+            start = time.perf_counter()
+            for number in rng.sample(range(matches), LOOKUPS):
+                reader.moves(number)
+            direct = (time.perf_counter() - start) / LOOKUPS
+        print(f"mmap open {opened * 1e6:.0f} µs, first find (builds match index) {indexed * 1000:.1f} ms")
+        print(f"mmap lookup by match id        {lookup * 1e6:10.1f} µs")
+        print(f"mmap lookup by entry number    {direct * 1e6:10.1f} µs")
+
+        start = time.perf_counter()
+        for match_id in wanted[:5]:
+            with open(os.path.join(folder, "replays.jsonl")) as f:
+                for line in f:
+                    replay = json.loads(line)
+                    if replay["match_id"] == match_id:
+                        break
+        scan = (time.perf_counter() - start) / 5
+        print(f"jsonl scan per lookup          {scan * 1e6:10.1f} µs  ({scan / lookup:.0f}x)")
+
+
+def main(matches):
+    bench_recording()
+    bench_lookup(matches)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,69 @@
+"""RESUME vs LOGIN after a mass disconnect, and lobby delta vs full lobby.
+
+Part one times what the server spends per reconnecting client: verifying a
+password with PBKDF2 (LOGIN) against checking an HMAC resume token
+(RESUME). Part two fills a lobby journal with a large lobby, changes a few
+entries, and compares the size of the delta a resuming client receives
+with the full lobby_info it would get otherwise.
+
+Usage: python benchmarks/bench_resume.py [clients]   (default 200)
+"""
+import json
+import os
+import sys
+import time
+
+HW_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, HW_DIR)
+
+import auth
+from session_resume import LobbyJournal, TokenSigner
+
+LOBBY_USERS = 2000
+LOBBY_ROOMS = 500
+CHANGES = 20
+
+
+def reconnect_storm(clients):
+    stored = auth.hash_password("hunter2")
+    start = time.perf_counter()
+    for _ in range(clients):
+        auth.verify_password(stored, "hunter2")
+    login = time.perf_counter() - start
+
+    signer = TokenSigner()
+    tokens = [signer.issue(f"player{n}", signer.new_session()) for n in range(clients)]
+    start = time.perf_counter()
+    for token in tokens:
+        signer.verify(token)
+    resume = time.perf_counter() - start
+    print(f"{clients} reconnecting clients: LOGIN {login * 1000:.0f} ms, RESUME {resume * 1000:.2f} ms "
+          f"({login / resume:.0f}x less server CPU)")
+
+
+def delta_size():
+    journal = LobbyJournal()
+    users = [{"username": f"player{n}", "status": "idle"} for n in range(LOBBY_USERS)]
+    rooms = [{"room_id": f"room{n}", "creator": f"player{n}", "game_name": "ttt", "status": "Waiting",
+              "host": "127.0.0.1", "type": "public"} for n in range(LOBBY_ROOMS)]
+    journal.record("online_users", users)
+    journal.record("public_rooms", rooms)
+    seen = journal.version
+    for n in range(CHANGES):
+        users[n] = {"username": f"player{n}", "status": "In Game"}
+        journal.record("online_users", users)
+    journal.record("public_rooms", rooms[CHANGES:])
+    full = json.dumps({"status": "lobby_info", "public_rooms": rooms[CHANGES:], "online_users": users,
+                       "version": journal.version})
+    delta = json.dumps({"status": "lobby_delta", "version": journal.version, **journal.since(seen)})
+    print(f"lobby of {LOBBY_USERS} users / {LOBBY_ROOMS} rooms, {CHANGES * 2} changes: "
+          f"full {len(full)} bytes, delta {len(delta)} bytes")
+
+
+def main(clients):
+    reconnect_storm(clients)
+    delta_size()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,148 @@
+"""Matches per second per core on the hosted game session server.
+
+The server runs alone in a child process so its CPU time can be measured.
+The load generator multiplexes many concurrent sessions over a few
+connection pairs and plays scripted ttt/rps matches.
+
+Usage: python benchmarks/bench_session_server.py [matches] [concurrency] [connection_pairs]
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from session_server import SessionServer
+
+TTT_SCRIPT = {"host": [0, 1, 2], "client": [3, 4]}
+RPS_SCRIPT = {"host": ["rock"], "client": ["scissors"]}
+
+
+def run_server(port, conn):
+    async def serve():
+        session_server = SessionServer()
+        await session_server.start('127.0.0.1', port)
+        conn.send("ready")
+        await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+        conn.send((time.process_time(), session_server.stats()))
+    asyncio.run(serve())
+
+
+class LoadConnection(asyncio.Protocol):
+    def __init__(self, generator, seat):
+        self.generator = generator
+        self.seat = seat
+        self.buffer = bytearray()
+        self.outbox = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def send(self, frame):
+        if not self.outbox:
+            asyncio.get_running_loop().call_soon(self.flush)
+        self.outbox.append(json.dumps(frame).encode() + b'\n')
+
+    def flush(self):
+        self.transport.write(b''.join(self.outbox))
+        self.outbox.clear()
+
+    def data_received(self, data):
+        self.buffer += data
+        *lines, rest = self.buffer.split(b'\n')
+        self.buffer = bytearray(rest)
+        for line in lines:
+            self.generator.on_frame(self, json.loads(line))
+
+
+class LoadGenerator:
+    def __init__(self, total, concurrency):
+        self.total = total
+        self.concurrency = concurrency
+        self.started = 0
+        self.finished = 0
+        self.errors = 0
+        self.sessions = {}
+        self.pairs = []
+        self.done = asyncio.get_running_loop().create_future()
+
+    def start_session(self):
+        host_conn, client_conn = self.pairs[self.started % len(self.pairs)]
+        game = "ttt" if self.started % 2 == 0 else "rps"
+        sid = f"bench-{self.started}"
+        self.started += 1
+        script = TTT_SCRIPT if game == "ttt" else RPS_SCRIPT
+        self.sessions[sid] = {"host": list(script["host"]), "client": list(script["client"]), "game": game, "ended": 0}
+        host_conn.send({"op": "join", "sid": sid, "game": game, "role": "host", "mux": True})
+        client_conn.send({"op": "join", "sid": sid, "game": game, "role": "client", "mux": True})
+
+    def play(self, conn, sid):
+        moves = self.sessions[sid][conn.seat]
+        if moves:
+            conn.send({"sid": sid, "move": moves.pop(0)})
+
+    def on_frame(self, conn, frame):
+        sid = frame.get("sid")
+        op = frame.get("op")
+        if op == "start":
+            game = self.sessions[sid]["game"]
+            if conn.seat == "host" or game == "rps":
+                self.play(conn, sid)
+        elif "move" in frame:
+            if self.sessions[sid]["game"] == "ttt":
+                self.play(conn, sid)
+        elif op in ("result", "abort", "error"):
+            if op != "result":
+                self.errors += 1
+            session = self.sessions[sid]
+            session["ended"] += 1
+            if session["ended"] == 2:
+                del self.sessions[sid]
+                self.finished += 1
+                if self.started < self.total:
+                    self.start_session()
+                elif self.finished == self.total and not self.done.done():
+                    self.done.set_result(None)
+
+
+async def drive(port, total, concurrency, connection_pairs):
+    loop = asyncio.get_running_loop()
+    generator = LoadGenerator(total, concurrency)
+    for _ in range(connection_pairs):
+        _, host_conn = await loop.create_connection(lambda: LoadConnection(generator, "host"), '127.0.0.1', port)
+        _, client_conn = await loop.create_connection(lambda: LoadConnection(generator, "client"), '127.0.0.1', port)
+        generator.pairs.append((host_conn, client_conn))
+    start = time.perf_counter()
+    for _ in range(min(concurrency, total)):
+        generator.start_session()
+    await generator.done
+    return time.perf_counter() - start, generator.errors
+
+
+def main(total, concurrency, connection_pairs):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    parent_conn, child_conn = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=run_server, args=(port, child_conn))
+    server.start()
+    parent_conn.recv()
+    elapsed, errors = asyncio.run(drive(port, total, concurrency, connection_pairs))
+    parent_conn.send("stop")
+    server_cpu, stats = parent_conn.recv()
+    server.join()
+    print(f"matches: {total}, concurrency: {concurrency}, connection pairs: {connection_pairs}, errors: {errors}")
+    print(f"wall: {elapsed:.2f} s, {total / elapsed:,.0f} matches/s")
+    print(f"server cpu: {server_cpu:.2f} s, {total / server_cpu:,.0f} matches/s per core")
+    print(f"server stats: {stats}")
+
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    connection_pairs = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    main(total, concurrency, connection_pairs)
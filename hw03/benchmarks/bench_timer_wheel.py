@@ -0,0 +1,72 @@
+"""Timer wheel vs one loop.call_later handle per expiry timer.
+
+Schedules many invite-style timers, reschedules each once (a repeated
+invite), cancels half (accepted invites), then lets the rest come due.
+The call_later side keeps every cancelled handle in the loop's heap until
+it surfaces; the wheel drops it from its bucket at once.
+
+Usage: python benchmarks/bench_timer_wheel.py [timers]   (default 100000)
+"""
+import asyncio
+import os
+import sys
+import time
+
+HW_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, HW_DIR)
+
+from timer_wheel import TimerWheel
+
+DELAY = 120.0
+TICK = 1.0
+
+
+def noop(key):
+    pass
+
+
+async def call_later(timers):
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    handles = {n: loop.call_later(DELAY, noop, n) for n in range(timers)}
+    for n in range(timers):
+        handles[n].cancel()
+        handles[n] = loop.call_later(DELAY + 1, noop, n)
+    for n in range(0, timers, 2):
+        handles.pop(n).cancel()
+    elapsed = time.perf_counter() - start
+    heap = len(loop._scheduled)
+    for handle in handles.values():
+        handle.cancel()
+    return elapsed, heap
+
+
+def wheel(timers):
+    timer_wheel = TimerWheel(TICK, 512)
+    start = time.perf_counter()
+    for n in range(timers):
+        timer_wheel.schedule(n, DELAY, noop, n)
+    for n in range(timers):
+        timer_wheel.schedule(n, DELAY + 1, noop, n)
+    for n in range(0, timers, 2):
+        timer_wheel.cancel(n)
+    elapsed = time.perf_counter() - start
+    pending = len(timer_wheel)
+    start = time.perf_counter()
+    fired = 0
+    for _ in range(int((DELAY + 1) / TICK)):
+        fired += len(timer_wheel.advance())
+    return elapsed, pending, time.perf_counter() - start, fired
+
+
+def main(timers):
+    elapsed, heap = asyncio.run(call_later(timers))
+    print(f"call_later   schedule/reschedule/cancel {elapsed * 1000:7.1f} ms, "
+          f"{heap} handles left in the loop heap for {timers // 2} live timers")
+    elapsed, pending, ticking, fired = wheel(timers)
+    print(f"timer wheel  schedule/reschedule/cancel {elapsed * 1000:7.1f} ms, "
+          f"{pending} entries on the wheel; {int((DELAY + 1) / TICK)} ticks fired {fired} in {ticking * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,79 @@
+"""List-of-strings win check vs bitboard masks, and the cost of the solver.
+
+Usage: python benchmarks/bench_ttt.py [iterations]
+"""
+import os
+import random
+import sys
+import time
+
+HW_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, HW_DIR)
+
+import ttt_engine
+
+
+def check_winner(board, player):
+    # The checker games/ttt.py used before the bitboard engine.
+    win_conditions = [
+        [0,1,2], [3,4,5], [6,7,8],  # rows
+        [0,3,6], [1,4,7], [2,5,8],  # columns
+        [0,4,8], [2,4,6]            # diagonals
+    ]
+    return any(all(board[pos] == player for pos in condition) for condition in win_conditions)
+
+
+def random_positions(count, rng):
+    positions = []
+    for _ in range(count):
+        squares = list(range(9))
+        rng.shuffle(squares)
+        moves = rng.randint(0, 9)
+        x_bits = o_bits = 0
+        board = [' '] * 9
+        for i, square in enumerate(squares[:moves]):
+            if i % 2 == 0:
+                x_bits |= 1 << square
+                board[square] = 'X'
+            else:
+                o_bits |= 1 << square
+                board[square] = 'O'
+        positions.append((board, x_bits, o_bits))
+    return positions
+
+
+def per_call_ns(func, items):
+    start = time.perf_counter()
+    for item in items:
+        func(item)
+    return (time.perf_counter() - start) / len(items) * 1e9
+
+
+def main(iterations):
+    rng = random.Random(1)
+    positions = random_positions(iterations, rng)
+    boards = [board for board, _, _ in positions]
+    x_bits = [x for _, x, _ in positions]
+
+    list_ns = per_call_ns(lambda board: check_winner(board, 'X'), boards)
+    mask_ns = per_call_ns(lambda bits: any(bits & mask == mask for mask in ttt_engine.WIN_MASKS), x_bits)
+    table_ns = per_call_ns(ttt_engine.is_win, x_bits)
+    print(f"win check, {iterations} positions")
+    print(f"  list of strings     {list_ns:8.0f} ns/call")
+    print(f"  bitboard masks      {mask_ns:8.0f} ns/call  ({list_ns / mask_ns:.1f}x)")
+    print(f"  bitboard table      {table_ns:8.0f} ns/call  ({list_ns / table_ns:.1f}x)")
+
+    ttt_engine.transposition.clear()
+    start = time.perf_counter()
+    ttt_engine.solve(0, 0)
+    cold_ms = (time.perf_counter() - start) * 1000
+    print(f"full game tree solve  {cold_ms:8.2f} ms cold, {len(ttt_engine.transposition)} positions in the table")
+
+    playable = [(x, o) for _, x, o in positions
+                if not ttt_engine.is_win(x) and not ttt_engine.is_win(o) and not ttt_engine.is_full(x, o)]
+    move_ns = per_call_ns(lambda position: ttt_engine.best_move(*position, rng=rng), playable)
+    print(f"best_move (warm)      {move_ns / 1000:8.2f} us/call")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -5,28 +5,38 @@ import logging
 import config
 import os
 import hashlib
+import random
+import time
 import aiofiles
 import aiofiles.os
+import game_transport
+import replay_log
+import tracing
+from client_state import StateStore
+from game_loader import GameLoader
+from game_workers import GameWorkerPool
+from logger_setup import setup_logger
 
-logging.basicConfig(
-    filename='client.log',
-    filemode='a',
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    level=logging.DEBUG
-)
+setup_logger(config.CLIENT_LOG_FILE, name=None, console=False, debug_rate=config.LOG_DEBUG_RATE)
 
-peer_info = {
+peer_store = StateStore({
     "role": None,
     "peer_ip": None,
     "peer_port": None,
     "own_port": None,
     "game_name": None
-}
+}, config.PEER_INFO_FLUSH_DELAY, config.PEER_INFO_WRITE_BEHIND)
+# The resume token from the last LOGIN_SUCCESS / RESUME_SUCCESS, saved in the user's folder
+# (readable by the owner only) so `resume <username>` works after a client restart.
+session_store = StateStore({"username": None, "token": None}, config.PEER_INFO_FLUSH_DELAY, mode=0o600)
+# The lobby as last received, so RESUME can ask for just the changes since `version`.
+lobby_view = {"version": None, "online_users": {}, "public_rooms": {}}
 
 COMMAND_ALIASES = {
     "REGISTER": ["REGISTER", "reg", "r"],
     "LOGIN": ["LOGIN", "login"],
     "LOGOUT": ["LOGOUT", "logout"],
+    "RESUME": ["RESUME", "resume"],
     "CREATE_ROOM": ["CREATE_ROOM", "create", "c"],
     "JOIN_ROOM": ["JOIN_ROOM", "join", "j"],
     "INVITE_PLAYER": ["INVITE_PLAYER", "invite", "i"],
@@ -38,12 +48,20 @@ COMMAND_ALIASES = {
     "START_GAME": ["START_GAME", "start", "st"],
     "UPLOAD_GAME": ["UPLOAD_GAME", "upload_game", "ug"],
     "LIST_OWN_GAMES": ["LIST_OWN_GAMES", "list_games", "lg"],
+    "QUEUE": ["QUEUE", "queue", "qu"],
+    "LEAVE_QUEUE": ["LEAVE_QUEUE", "leave_queue", "lq"],
+    "QUEUE_STATS": ["QUEUE_STATS", "queue_stats", "qs"],
+    "STATS": ["STATS", "stats"],
+    "HISTORY": ["HISTORY", "history"],
+    "LEADERBOARD": ["LEADERBOARD", "leaderboard", "lb"],
+    "RANK": ["RANK", "rank"],
 }
 
 COMMANDS = [
     "reg <使用者名稱> <密碼> - 註冊新帳號",
     "login <使用者名稱> <密碼> - 登入帳號",
     "logout - 登出",
+    "resume <使用者名稱> - 以上次儲存的權杖恢復工作階段",
     "create <public/private> <rps/ttt/c4> - 創建房間",
     "join <房間ID> - 加入房間",
     "invite <使用者名稱> <房間ID> - 邀請玩家加入房間",
@@ -52,6 +70,13 @@ COMMANDS = [
     "inv - 查看和管理您的邀請",
     "upload_game <game_name> - 上傳遊戲文件",
     "list_games - 列出自己發布的遊戲",
+    "queue <game_name> - 加入自動配對佇列",
+    "leave_queue - 離開配對佇列",
+    "queue_stats - 顯示配對佇列統計",
+    "stats [使用者名稱] / stats game <game_name> - 顯示玩家或遊戲的勝率統計",
+    "history [使用者名稱] [筆數] - 顯示最近的對戰紀錄",
+    "leaderboard <game_name> [起始名次] [筆數] - 顯示遊戲排行榜",
+    "rank [使用者名稱] [game_name] - 顯示玩家的積分與名次",
     "exit - 離開客戶端",
     "help - 顯示可用指令列表",
     "status - 顯示當前狀態",
@@ -64,14 +89,40 @@ pending_uploads = {}
 pending_upload_confirms = {}
 pending_downloads = {}
 room_info = {}
+game_task = None
+game_loader = GameLoader()
+game_pool = None
+start_requested_at = None
+tracer = tracing.Tracer("client", enabled=config.TRACE_ENABLED)
+trace_write_lock = asyncio.Lock()
+trace_flush_task = None
+
+class LobbyConnection:
+    """Stands in for the lobby StreamWriter; main() swaps in a new writer after a reconnect."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.closing = False
+
+    def __getattr__(self, name):
+        return getattr(self.writer, name)
+
+    def close(self):
+        # Only the user closes the lobby connection on purpose; anything else is a drop to recover from.
+        self.closing = True
+        self.writer.close()
 
 def get_username_hash(username):
     return hashlib.sha256(username.encode()).hexdigest()[:8] 
 
 async def setup_user_directory(username):
-    global user_folder
+    global user_folder, game_loader
     username_hash = get_username_hash(username)
     user_folder = f"games-{username_hash}"
+    game_loader = GameLoader(os.path.join(user_folder, "__gamecache__"))
+    tracer.process = f"client:{username}"
+    tracer.path = os.path.join(user_folder, config.TRACE_FILE)
+    tracer.on_full = schedule_trace_flush
     peer_info_path = os.path.join(user_folder, "peer_info.json")
     try:
         if not await aiofiles.os.path.exists(user_folder):
@@ -82,38 +133,30 @@ async def setup_user_directory(username):
             print(f"資料夾已存在：{user_folder}")
             logging.info(f"資料夾已存在：{user_folder}")
             
-        if not await aiofiles.os.path.exists(peer_info_path):
-            initial_peer_info = {
-                "role": None,
-                "peer_ip": None,
-                "peer_port": None,
-                "own_port": None,
-                "game_name": None
-            }
-            async with aiofiles.open(peer_info_path, 'w') as f:
-                await f.write(json.dumps(initial_peer_info, ensure_ascii=False, indent=4))
+        await session_store.attach(os.path.join(user_folder, config.SESSION_FILE))
+        if await peer_store.attach(peer_info_path):
+            print(f"peer_info.json 文件已存在：{peer_info_path}")
+            logging.info(f"已從 peer_info.json 恢復狀態：{peer_info_path}")
+        else:
             print(f"已創建 peer_info.json 文件。")
             logging.info(f"已創建 peer_info.json 文件：{peer_info_path}")
-        else:
-            print(f"peer_info.json 文件已存在：{peer_info_path}")
-            logging.info(f"peer_info.json 文件已存在：{peer_info_path}")
     except Exception as e:
         print(f"設定用戶資料夾時發生錯誤：{e}")
         logging.error(f"設定用戶資料夾時發生錯誤：{e}")
     return user_folder
 
-def build_command(command, params):
-    return json.dumps({"command": command.upper(), "params": params}) + '\n'
+def build_command(command, params, **extra):
+    return json.dumps({"command": command.upper(), "params": params, **extra}) + '\n'
 
 def build_response(status, message):
     return json.dumps({"status": status, "message": message}) + '\n'
 
-async def send_command(writer, command, params):
+async def send_command(writer, command, params, **extra):
     try:
-        message = build_command(command, params)
+        message = build_command(command, params, **extra)
         writer.write(message.encode())
         await writer.drain()
-        logging.info(f"發送指令: {command} {' '.join(params)}")
+        logging.info("發送指令: %s %s", command, " ".join(params))
     except Exception as e:
         print(f"發送指令時發生錯誤: {e}")
         logging.error(f"發送指令時發生錯誤: {e}")
@@ -124,9 +167,11 @@ async def send_message(writer, message):
         writer.write(data)
         await writer.drain()
     except Exception as e:
-        logging.error(f"發送訊息失敗: {e}")
+        logging.error("發送訊息失敗: %s", e)
 
 async def handle_server_messages(reader, writer, game_in_progress, logged_in):
+    # Returns True when the lobby connection dropped, so main() knows to reconnect.
+    global start_requested_at
     while True:
         try:
             data = await reader.readline()
@@ -134,7 +179,7 @@ async def handle_server_messages(reader, writer, game_in_progress, logged_in):
                 print("\n伺服器已斷線。")
                 logging.info("伺服器已斷線。")
                 game_in_progress.value = False
-                break
+                return True
             message = data.decode().strip()
             if not message:
                 continue
@@ -153,9 +198,22 @@ async def handle_server_messages(reader, writer, game_in_progress, logged_in):
                         if len(parts) >= 2:
                             username = parts[1]
                             await setup_user_directory(username)
+                            session_store.update({"username": username, "token": message_json.get("token")})
+                    elif msg.startswith("RESUME_SUCCESS"):
+                        logged_in.value = True
+                        username = msg.split()[1]
+                        await setup_user_directory(username)
+                        session_store.update({"username": username, "token": message_json.get("token")})
+                        if message_json.get("room_id"):
+                            room_info[message_json["room_id"]] = message_json.get("game_name")
+                            print(f"\n伺服器：已恢復 {username} 的工作階段，狀態：{message_json.get('lobby_status')}，"
+                                  f"房間 ID：{message_json['room_id']}")
+                        else:
+                            print(f"\n伺服器：已恢復 {username} 的工作階段。")
                     elif msg.startswith("LOGOUT_SUCCESS"):
                         print("\n伺服器：登出成功。")
                         logged_in.value = False
+                        session_store.update({"username": None, "token": None})
                     elif msg.startswith("CREATE_ROOM_SUCCESS"):
                         parts = msg.split()
                         room_id = parts[1]
@@ -174,6 +232,33 @@ async def handle_server_messages(reader, writer, game_in_progress, logged_in):
                             pending_upload_confirms[game_name].set_result(True)
                             # del pending_upload_confirms[game_name]
                         # print(f"遊戲 {game_name} 上傳成功。")
+                    elif msg.startswith("QUEUED"):
+                        parts = msg.split()
+                        print(f"\n伺服器：已加入 {parts[1]} 配對佇列，目前順位：{parts[2]}")
+                    elif msg.startswith("QUEUE_MATCHED"):
+                        parts = msg.split()
+                        room_id, game_name, opponent = parts[1], parts[2], parts[3]
+                        room_info[room_id] = game_name
+                        print(f"\n伺服器：配對成功，對手：{opponent}，房間 ID：{room_id}，遊戲：{game_name}")
+                    elif msg.startswith("LEAVE_QUEUE_SUCCESS"):
+                        print("\n伺服器：已離開配對佇列。")
+                    elif msg.startswith("REPORT_PORT_SUCCESS"):
+                        logging.debug("伺服器已收到遊戲端口：%s", msg)
+                    elif msg.startswith("UPLOAD_REPLAY_SUCCESS"):
+                        logging.info(f"伺服器已保存對局紀錄：{msg}")
+                    elif msg.startswith("QUEUE_STATS"):
+                        display_queue_stats(message_json.get("stats", {}))
+                    elif msg.startswith("PLAYER_STATS"):
+                        display_player_stats(message_json.get("stats", {}))
+                    elif msg.startswith("GAME_STATS"):
+                        display_game_stats(message_json.get("stats", {}))
+                    elif msg.startswith("HISTORY"):
+                        display_history(message_json.get("player"), message_json.get("matches", []))
+                    elif msg.startswith("LEADERBOARD"):
+                        display_leaderboard(message_json.get("game"), message_json.get("total", 0),
+                                            message_json.get("entries", []))
+                    elif msg.startswith("RANK"):
+                        display_ranks(message_json.get("player"), message_json.get("ranks", {}))
                     elif 'games' in message_json:
                         logging.info("收到遊戲列表。")
                         # logging.debug(f"遊戲列表：{message_json['games']}")
@@ -186,6 +271,10 @@ async def handle_server_messages(reader, writer, game_in_progress, logged_in):
                         print(f"\n伺服器：{msg}")
                 elif status == "error":
                     print(f"\n錯誤：{msg}")
+                    if message_json.get("command") == "RESUME":
+                        session_store.update({"username": None, "token": None})
+                        logged_in.value = False
+                        print("無法恢復上次的工作階段，請重新登入。")
                 elif status == "broadcast":
                     event = message_json.get("event")
                     if event == "user_login":
@@ -236,9 +325,11 @@ async def handle_server_messages(reader, writer, game_in_progress, logged_in):
                     update_type = message_json.get("type")
                     if update_type == "online_users":
                         online_users = message_json.get("data", [])
+                        replace_lobby_view("online_users", online_users, message_json.get("version"))
                         display_online_users(online_users)
                     elif update_type == "public_rooms":
                         public_rooms = message_json.get("data", [])
+                        replace_lobby_view("public_rooms", public_rooms, message_json.get("version"))
                         display_public_rooms(public_rooms)
                     elif update_type == "room_status":
                         room_id = message_json.get("room_id")
@@ -246,26 +337,74 @@ async def handle_server_messages(reader, writer, game_in_progress, logged_in):
                         print(f"\n房間 {room_id} 狀態更新為 {status_update}")
                 
                 elif status == "p2p_info":
+                    trace_id = message_json.get("trace_id")
+                    tracer.event(trace_id, "client.p2p_info_received", role=message_json.get("role"))
                     new_peer_info = {
                         "role": message_json.get("role"),
                         "peer_ip": message_json.get("peer_ip"),
                         "peer_port": message_json.get("peer_port"),
                         "own_port": message_json.get("own_port"),
-                        "game_name": message_json.get("game_name")
+                        "game_name": message_json.get("game_name"),
+                        "relay_available": message_json.get("relay_available", False),
+                        "relay_host": message_json.get("relay_host"),
+                        "relay_port": message_json.get("relay_port"),
+                        "relay_token": message_json.get("relay_token"),
+                        "session_host": message_json.get("session_host"),
+                        "session_port": message_json.get("session_port"),
+                        "session_id": message_json.get("session_id"),
+                        "start_requested_at": start_requested_at,
+                        "p2p_info_at": time.monotonic(),
+                        "connected_at": None,
+                        "first_move_at": None,
+                        "trace_id": trace_id,
+                        "bot": config.GAME_BOT,
+                        "replay_path": replay_path(),
+                        "replay_entry": None,
+                        "outcome": None
                     }
-                    await update_peer_info(new_peer_info)
-                    peer_info = await read_peer_info()
+                    start_requested_at = None
+                    with tracer.span(trace_id, "client.update_peer_info"):
+                        update_peer_info(new_peer_info)
+                        peer_info = read_peer_info()
                     
-                    logging.debug(f"角色：{peer_info['role']}，對等方 IP：{peer_info['peer_ip']}，對等方 Port：{peer_info['peer_port']}，自身 Port：{peer_info['own_port']}，遊戲類型：{peer_info['game_name']}")
+                    logging.debug("角色：%s，對等方 IP：%s，對等方 Port：%s，自身 Port：%s，遊戲類型：%s", peer_info['role'], peer_info['peer_ip'], peer_info['peer_port'], peer_info['own_port'], peer_info['game_name'])
                     print(f"角色：{peer_info['role']}，對等方 IP：{peer_info['peer_ip']}，對等方 Port：{peer_info['peer_port']}，自身 Port：{peer_info['own_port']}")
                     
-                    if None in [peer_info["role"], peer_info["peer_ip"], peer_info["peer_port"], peer_info["own_port"], peer_info["game_name"]]:
+                    if None in [peer_info.get(field) for field in required_peer_fields(peer_info)]:
                         print("錯誤：收到不完整的 p2p_info 消息。")
                         logging.error("收到不完整的 p2p_info 消息。")
-                        return
-                    asyncio.create_task(initiate_game(peer_info["game_name"], game_in_progress, writer, user_folder))
-                    game_in_progress.value = True
+                        continue
+                    start_game_task(peer_info["game_name"], game_in_progress, writer)
+
+                elif status == "relay_info":
+                    update_peer_info({
+                        "role": message_json.get("role"),
+                        "game_name": message_json.get("game_name"),
+                        "relay_host": message_json.get("relay_host"),
+                        "relay_port": message_json.get("relay_port"),
+                        "relay_token": message_json.get("relay_token"),
+                        "trace_id": message_json.get("trace_id")
+                    })
+                    tracer.event(message_json.get("trace_id"), "client.relay_info_received")
+                    print("\n直接連線失敗，改由中繼伺服器轉送遊戲資料。")
+                    logging.info(f"改用中繼伺服器：{message_json.get('relay_host')}:{message_json.get('relay_port')}")
+                    # The host is still listening for a direct connection; restart it over the relay.
+                    if game_task is not None and not game_task.done():
+                        game_task.cancel()
+                        try:
+                            await game_task
+                        except asyncio.CancelledError:
+                            pass
+                    start_game_task(message_json.get("game_name"), game_in_progress, writer)
                 
+                elif status == "peer_ready":
+                    tracer.event(message_json.get("trace_id"), "client.peer_ready_received")
+                    logging.info(f"主機 {message_json.get('host')} 已在 {message_json.get('port')} 上等待連線")
+                    if game_pool is not None:
+                        game_pool.send_control({"event": "peer_ready"})
+                    else:
+                        game_transport.signal_peer_ready()
+
                 elif status == "host_transfer":
                     new_host = message_json.get("new_host")
                     room_id = message_json.get("room_id")
@@ -298,8 +437,14 @@ async def handle_server_messages(reader, writer, game_in_progress, logged_in):
                 elif status == "lobby_info":
                     public_rooms = message_json.get("public_rooms", [])
                     online_users = message_json.get("online_users", [])
+                    replace_lobby_view("public_rooms", public_rooms, message_json.get("version"))
+                    replace_lobby_view("online_users", online_users, message_json.get("version"))
                     display_public_rooms(public_rooms)
                     display_online_users(online_users)
+                elif status == "lobby_delta":
+                    apply_lobby_delta(message_json)
+                    display_public_rooms(list(lobby_view["public_rooms"].values()))
+                    display_online_users(list(lobby_view["online_users"].values()))
                 else:
                     print(f"\n伺服器：{message}")
             except json.JSONDecodeError:
@@ -309,36 +454,95 @@ async def handle_server_messages(reader, writer, game_in_progress, logged_in):
                 print(f"\n接收伺服器資料時發生錯誤：{e}")
                 logging.error(f"接收伺服器資料時發生錯誤：{e}")
                 game_in_progress.value = False
-            break
+            return isinstance(e, (ConnectionError, asyncio.IncompleteReadError))
 
-async def read_peer_info():
-    global user_folder
-    peer_info_path = os.path.join(user_folder, "peer_info.json")
-    try:
-        async with aiofiles.open(peer_info_path, 'r') as f:
-            content = await f.read()
-            return json.loads(content)
-    except Exception as e:
-        print(f"讀取 peer_info.json 時發生錯誤：{e}")
-        logging.error(f"讀取 peer_info.json 時發生錯誤：{e}")
+def read_peer_info():
+    return peer_store.get()
+
+def update_peer_info(new_info):
+    peer_store.update(new_info)
+    logging.info("更新 peer_info：%s", dict(new_info))
+
+def log_game_start_latency(peer_info, game_started_at):
+    p2p_info_at = peer_info.get("p2p_info_at")
+    first_move_at = peer_info.get("first_move_at")
+    if p2p_info_at is None:
+        return
+    message = f"p2p_info 至遊戲啟動：{(game_started_at - p2p_info_at) * 1000:.1f} ms"
+    connected_at = peer_info.get("connected_at")
+    if connected_at is not None:
+        start_at = peer_info.get("start_requested_at") or p2p_info_at
+        label = "START_GAME" if peer_info.get("start_requested_at") else "p2p_info"
+        message += f"，{label} 至連線建立：{(connected_at - start_at) * 1000:.1f} ms"
+        if peer_info.get("connect_attempts"):
+            message += f"（嘗試 {peer_info['connect_attempts']} 次）"
+    if first_move_at is not None:
+        message += f"，p2p_info 至第一步：{(first_move_at - p2p_info_at) * 1000:.1f} ms"
+    logging.info(message)
+
+def required_peer_fields(peer_info):
+    if peer_info.get("session_id"):
+        return ["role", "game_name", "session_host", "session_port", "session_id"]
+    return ["role", "peer_ip", "peer_port", "own_port", "game_name"]
+
+def replay_path():
+    if not config.REPLAY_ENABLED or user_folder is None:
         return None
+    return os.path.join(user_folder, config.REPLAY_FILE)
 
-async def update_peer_info(new_info):
-    global user_folder
-    peer_info_path = os.path.join(user_folder, "peer_info.json")
+async def upload_replay(writer, peer_info):
+    """Send the match the game just appended to the local replay log to the lobby."""
+    number = peer_info.get("replay_entry")
+    if number is None or not peer_info.get("replay_path"):
+        return
     try:
-        current_info = await read_peer_info()
-        if current_info is None:
-            current_info = {}
-        current_info.update(new_info)
-        async with aiofiles.open(peer_info_path, 'w') as f:
-            await f.write(json.dumps(current_info, ensure_ascii=False, indent=4))
-        logging.info(f"更新 peer_info.json：{new_info}")
-    except Exception as e:
-        print(f"更新 peer_info.json 時發生錯誤：{e}")
-        logging.error(f"更新 peer_info.json 時發生錯誤：{e}")
+        with replay_log.ReplayReader(peer_info["replay_path"]) as reader:
+            entry = reader.entry(number)
+            data = reader.raw(number)
+    except (OSError, IndexError) as e:
+        logging.error(f"讀取對局紀錄失敗：{e}")
+        return
+    count = len(data) // replay_log.RECORD.size
+    # The records follow the command line directly; the lobby reads exactly count records,
+    # even when it rejects the upload, so the count goes first.
+    writer.write(build_command("UPLOAD_REPLAY", [str(count), entry["match_id"], entry["game"], entry["role"] or "",
+                                                 repr(entry["started_at"])]).encode())
+    writer.write(data)
+    await writer.drain()
+    logging.info(f"已上傳對局紀錄 {entry['match_id']}（{count} 步）")
+
+def schedule_trace_flush():
+    # tracer.on_full: the game's spans keep arriving on the loop, so they are written from a task.
+    global trace_flush_task
+    if trace_flush_task is None:
+        trace_flush_task = asyncio.create_task(flush_trace_later())
+
+async def flush_trace_later():
+    global trace_flush_task
+    trace_flush_task = None
+    await flush_trace()
+
+async def flush_trace():
+    async with trace_write_lock:
+        lines = tracer.take()
+        if lines:
+            await asyncio.get_running_loop().run_in_executor(None, tracer.write, lines)
+
+def handle_game_event(event, writer):
+    # The game host is listening; report the port so the lobby can tell the other player.
+    if event.get("event") == "listening":
+        asyncio.create_task(send_command(writer, "REPORT_PORT", [str(event["port"])]))
+    elif event.get("event") == "span":
+        tracer.record(event["span"])
+
+def start_game_task(game_name, game_in_progress, writer):
+    global game_task
+    game_task = asyncio.create_task(initiate_game(game_name, game_in_progress, writer, user_folder))
+    game_in_progress.value = True
 
 async def initiate_game(game_name, game_in_progress, writer, user_folder):
+    report_game_over = True
+    peer_info = {}
     try:
         game_folder = user_folder if user_folder else 'games'  # 確保使用正確的遊戲目錄
         file_path = os.path.join(game_folder, game_name + ".py")
@@ -348,39 +552,163 @@ async def initiate_game(game_name, game_in_progress, writer, user_folder):
             logging.error(f"遊戲檔案 {game_name} 不存在於 {game_folder}。")
             return
 
-        peer_info = await read_peer_info()
-        if peer_info is None:
-            print("錯誤：無法讀取 peer_info。")
-            logging.error("無法讀取 peer_info。")
-            return
-        
-        required_fields = ["role", "peer_ip", "peer_port", "own_port", "game_name"]
-        missing_fields = [field for field in required_fields if peer_info.get(field) is None]
+        peer_info = read_peer_info()
+
+        missing_fields = [field for field in required_peer_fields(peer_info) if peer_info.get(field) is None]
         if missing_fields:
             print(f"錯誤：peer_info 缺少字段：{', '.join(missing_fields)}")
             logging.error(f"peer_info 缺少字段：{', '.join(missing_fields)}")
             return
 
-        game_globals = {}   
-        game_globals['peer_info'] = peer_info
+        trace_id = peer_info.get("trace_id")
+        tracer.event(trace_id, "client.initiate_game", worker=game_pool is not None)
         try:
-            async with aiofiles.open(file_path, 'r') as f:
-                code = await f.read()
-            exec(code, game_globals)
-            if 'main' in game_globals and callable(game_globals['main']):
-                await game_globals['main'](peer_info)
+            game_started_at = time.monotonic()
+            if game_pool is not None:
+                await run_game_in_worker(file_path, peer_info, writer)
             else:
-                print("遊戲腳本不包含 main() 函數。")
-                logging.error("遊戲腳本不包含 main() 函數。")
+                game_transport.set_event_handler(lambda event: handle_game_event(event, writer))
+                with tracer.span(trace_id, "client.load_game"):
+                    game_globals = await game_loader.load(file_path)
+                game_globals['peer_info'] = peer_info
+                if 'main' in game_globals and callable(game_globals['main']):
+                    await game_globals['main'](peer_info)
+                else:
+                    print("遊戲腳本不包含 main() 函數。")
+                    logging.error("遊戲腳本不包含 main() 函數。")
+            log_game_start_latency(peer_info, game_started_at)
+            await upload_replay(writer, peer_info)
+            if peer_info.get("connect_failed") and peer_info.get("relay_available") and not peer_info.get("relay_token"):
+                # Ask the lobby for a relay instead of ending the game.
+                report_game_over = False
+                await send_command(writer, "P2P_FAILED", [])
         except Exception as e:
             print(f"讀取或執行遊戲腳本時發生錯誤：{e}")
             logging.error(f"讀取或執行遊戲腳本時發生錯誤：{e}")
+    except asyncio.CancelledError:
+        report_game_over = False
+        raise
     except Exception as e:
         print(f"遊戲執行時發生錯誤：{e}")
         logging.error(f"遊戲執行時發生錯誤：{e}")
     finally:
-        game_in_progress.value = False
-        await send_command(writer, "GAME_OVER", [])
+        await flush_trace()
+        if report_game_over:
+            game_in_progress.value = False
+            outcome = peer_info.get("outcome")
+            await send_command(writer, "GAME_OVER", [outcome] if outcome else [])
+
+async def run_game_in_worker(file_path, peer_info, writer):
+    result = await game_pool.run(file_path, peer_info, game_loader.cache_dir,
+                                 lambda event: handle_game_event(event, writer))
+    peer_info.update(result.get("peer_info") or {})
+    if result.get("error"):
+        print(f"讀取或執行遊戲腳本時發生錯誤：{result['error']}")
+        logging.error(f"讀取或執行遊戲腳本時發生錯誤：{result['error']}")
+
+def display_queue_stats(stats):
+    print("\n=== 配對佇列統計 ===")
+    games = stats.get("games", {})
+    if not games:
+        print("目前沒有配對紀錄。")
+    for game_name, game_stats in games.items():
+        median = game_stats.get("median_time_to_match")
+        median_text = f"{median:.2f} 秒" if median is not None else "N/A"
+        print(f"遊戲：{game_name} | 佇列人數：{game_stats.get('queue_depth', 0)} | 配對時間中位數：{median_text}")
+    print("=====================")
+
+OUTCOME_LABELS = {"win": "勝", "loss": "敗", "draw": "和", "no_result": "未完成", "disputed": "結果有爭議"}
+
+def display_player_stats(stats):
+    print(f"\n=== {stats.get('player')} 的戰績 ===")
+    print(f"對戰 {stats.get('matches', 0)} 場：勝 {stats.get('wins', 0)}，敗 {stats.get('losses', 0)}，"
+          f"和 {stats.get('draws', 0)}，勝率 {stats.get('win_rate', 0) * 100:.1f}%")
+    for game_name, game in stats.get("games", {}).items():
+        print(f"  {game_name}：{game['matches']} 場，勝 {game['wins']}，敗 {game['losses']}，"
+              f"和 {game['draws']}，勝率 {game['win_rate'] * 100:.1f}%")
+    print("====================")
+
+def display_game_stats(stats):
+    print(f"\n=== 遊戲 {stats.get('game')} 統計 ===")
+    print(f"對戰 {stats.get('matches', 0)} 場，玩家 {stats.get('players', 0)} 人，平均 {stats.get('avg_duration', 0):.1f} 秒")
+    print(f"先手（房主）勝率 {stats.get('first_win_rate', 0) * 100:.1f}%，後手勝率 {stats.get('second_win_rate', 0) * 100:.1f}%，"
+          f"平局 {stats.get('draw_rate', 0) * 100:.1f}%")
+    print(f"未完成 {stats.get('no_result', 0)} 場，結果有爭議 {stats.get('disputed', 0)} 場")
+    print("====================")
+
+def display_history(player, matches):
+    print(f"\n=== {player} 的最近對戰 ===")
+    if not matches:
+        print("沒有對戰紀錄。")
+    for match in matches:
+        ended = time.strftime('%m-%d %H:%M', time.localtime(match['ended_at']))
+        print(f"{ended}  {match['game']:8} 對 {match['opponent']:12} {OUTCOME_LABELS.get(match['result'], match['result'])}"
+              f"（{'房主' if match['role'] == 'host' else '加入者'}，{match['duration']:.0f} 秒）")
+    print("====================")
+
+def display_leaderboard(game_name, total, entries):
+    print(f"\n=== {game_name} 排行榜（共 {total} 名玩家）===")
+    for entry in entries:
+        print(f"{entry['rank']:>5}. {entry['player']:16} {entry['rating']:8.1f}")
+    print("====================")
+
+def display_ranks(player, ranks):
+    print(f"\n=== {player} 的積分 ===")
+    for game_name, rank in ranks.items():
+        print(f"{game_name}：第 {rank['rank']} 名 / {rank['players']} 人，積分 {rank['rating']:.1f}")
+    print("====================")
+
+def replace_lobby_view(kind, items, version):
+    key = "username" if kind == "online_users" else "room_id"
+    lobby_view[kind] = {item[key]: item for item in items}
+    if version is not None:
+        lobby_view["version"] = version
+
+def apply_lobby_delta(delta):
+    for kind, key in (("online_users", "username"), ("public_rooms", "room_id")):
+        changes = delta.get(kind, {})
+        for item in changes.get("changed", []):
+            lobby_view[kind][item[key]] = item
+        for removed in changes.get("removed", []):
+            lobby_view[kind].pop(removed, None)
+    lobby_view["version"] = delta.get("version")
+
+async def load_saved_token(username):
+    path = os.path.join(f"games-{get_username_hash(username)}", config.SESSION_FILE)
+    try:
+        async with aiofiles.open(path, 'r') as f:
+            saved = json.loads(await f.read())
+    except (OSError, json.JSONDecodeError):
+        return None
+    return saved.get("token") if saved.get("username") == username else None
+
+def resume_params(token):
+    params = [token]
+    if lobby_view["version"] is not None:
+        params.append(str(lobby_view["version"]))
+    return params
+
+async def reconnect(connection, server_ip, server_port, logged_in):
+    """Reconnect after the lobby connection dropped and RESUME the session; returns the new reader."""
+    connection.writer.close()
+    delay = config.RECONNECT_BACKOFF_BASE
+    for attempt in range(1, config.RECONNECT_RETRIES + 1):
+        # Jitter keeps clients dropped together from reconnecting in lockstep.
+        await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+        delay = min(delay * 2, config.RECONNECT_BACKOFF_MAX)
+        try:
+            reader, writer = await asyncio.open_connection(server_ip, server_port)
+        except OSError as e:
+            print(f"重新連線失敗（第 {attempt} 次）：{e}")
+            continue
+        connection.writer = writer
+        print("\n已重新連線到大廳伺服器。")
+        logging.info("已重新連線到伺服器 %s:%s", server_ip, server_port)
+        if logged_in.value and session_store.data.get("token"):
+            await send_command(connection, "RESUME", resume_params(session_store.data["token"]))
+        return reader
+    print("無法重新連線到大廳伺服器。")
+    return None
 
 def display_online_users(online_users):
     print("\n=== 在線用戶列表 ===")
@@ -413,7 +741,35 @@ async def get_user_input(prompt):
     loop = asyncio.get_event_loop()
     return await loop.run_in_executor(None, lambda: input(prompt).strip().lower())
 
+async def download_game_file(writer, game_name):
+    if user_folder is None:
+        print("尚未設定用戶專屬資料夾。")
+        logging.error("用戶專屬資料夾未設定。")
+        return False
+    game_folder = user_folder
+    file_path = os.path.join(game_folder, game_name + '.py')
+    logging.debug("遊戲檔案路徑：%s", file_path)
+    if not os.path.exists(file_path):
+        print(f"遊戲檔案 {game_name}.py 不存在，正在從伺服器下載...")
+    else:
+        print(f"遊戲檔案 {game_name}.py 已存在，更新中...")
+    download_future = asyncio.get_event_loop().create_future()
+    pending_downloads[game_name] = download_future
+    await send_command(writer, "DOWNLOAD_GAME_FILE", [game_name])
+    try:
+        await asyncio.wait_for(download_future, timeout=10)
+    except asyncio.TimeoutError:
+        print("下載遊戲檔案超時。")
+        del pending_downloads[game_name]
+        return False
+    except Exception as e:
+        print(f"下載遊戲檔案失敗：{e}")
+        del pending_downloads[game_name]
+        return False
+    return True
+
 async def handle_user_input(reader, writer, game_in_progress, logged_in):
+    global start_requested_at
     while True:
         try:
             if game_in_progress.value:
@@ -466,6 +822,19 @@ async def handle_user_input(reader, writer, game_in_progress, logged_in):
                     continue
                 await send_command(writer, "LOGIN", params)
 
+            elif command == "RESUME":
+                if len(params) != 1:
+                    print("用法：resume <使用者名稱>")
+                    continue
+                if logged_in.value:
+                    print("已經登入。")
+                    continue
+                token = await load_saved_token(params[0])
+                if not token:
+                    print(f"沒有 {params[0]} 可恢復的工作階段，請使用 login 登入。")
+                    continue
+                await send_command(writer, "RESUME", resume_params(token))
+
             elif command == "LOGOUT":
                 if not logged_in.value:
                     print("尚未登入。")
@@ -478,29 +847,7 @@ async def handle_user_input(reader, writer, game_in_progress, logged_in):
                     continue
                 room_type = params[0]
                 game_name = params[1]
-                if user_folder is None:
-                    print("尚未設定用戶專屬資料夾。")
-                    logging.error("用戶專屬資料夾未設定。")
-                    continue
-                game_folder = user_folder
-                file_path = os.path.join(game_folder, game_name + '.py')
-                logging.debug(f"遊戲檔案路徑：{file_path}")
-                if not os.path.exists(file_path):
-                    print(f"遊戲檔案 {game_name}.py 不存在，正在從伺服器下載...")
-                else:
-                    print(f"遊戲檔案 {game_name}.py 已存在，更新中...")
-                download_future = asyncio.get_event_loop().create_future()
-                pending_downloads[game_name] = download_future
-                await send_command(writer, "DOWNLOAD_GAME_FILE", [game_name])
-                try:
-                    await asyncio.wait_for(download_future, timeout=10)
-                except asyncio.TimeoutError:
-                    print("下載遊戲檔案超時。")
-                    del pending_downloads[game_name]
-                    continue
-                except Exception as e:
-                    print(f"下載遊戲檔案失敗：{e}")
-                    del pending_downloads[game_name]
+                if not await download_game_file(writer, game_name):
                     continue
                 await send_command(writer, "CREATE_ROOM", [room_type, game_name])
 
@@ -513,29 +860,7 @@ async def handle_user_input(reader, writer, game_in_progress, logged_in):
                     print("未知的房間ID，請先使用 'status' 指令查看可用房間。")
                     continue
                 game_name = room_info[room_id]
-                if user_folder is None:
-                    print("尚未設定用戶專屬資料夾。")
-                    logging.error("用戶專屬資料夾未設定。")
-                    continue
-                game_folder = user_folder
-                file_path = os.path.join(game_folder, game_name + '.py')
-                logging.debug(f"遊戲檔案路徑：{file_path}")
-                if not os.path.exists(file_path):
-                    print(f"遊戲檔案 {game_name}.py 不存在，正在從伺服器下載...")
-                else:
-                    print(f"遊戲檔案 {game_name}.py 已存在，更新中...")
-                download_future = asyncio.get_event_loop().create_future()
-                pending_downloads[game_name] = download_future
-                await send_command(writer, "DOWNLOAD_GAME_FILE", [game_name])
-                try:
-                    await asyncio.wait_for(download_future, timeout=10)
-                except asyncio.TimeoutError:
-                    print("下載遊戲檔案超時。")
-                    del pending_downloads[game_name]
-                    continue
-                except Exception as e:
-                    print(f"下載遊戲檔案失敗：{e}")
-                    del pending_downloads[game_name]
+                if not await download_game_file(writer, game_name):
                     continue
                 await send_command(writer, "JOIN_ROOM", [room_id])
 
@@ -579,7 +904,10 @@ async def handle_user_input(reader, writer, game_in_progress, logged_in):
                 if not logged_in.value:
                     print("尚未登入。")
                     continue
-                await send_command(writer, "START_GAME", [])
+                start_requested_at = time.monotonic()
+                trace_id = tracing.new_trace_id()
+                tracer.event(trace_id, "client.start_command")
+                await send_command(writer, "START_GAME", [], trace_id=trace_id)
             elif command == "UPLOAD_GAME":
                 if not logged_in.value:
                     print("尚未登入。")
@@ -638,6 +966,65 @@ async def handle_user_input(reader, writer, game_in_progress, logged_in):
                     print("尚未登入。")
                     continue
                 await send_command(writer, "LIST_OWN_GAMES", [])
+            elif command == "QUEUE":
+                if not logged_in.value:
+                    print("尚未登入。")
+                    continue
+                if len(params) != 1:
+                    print("用法：queue <game_name>")
+                    continue
+                game_name = params[0]
+                if not await download_game_file(writer, game_name):
+                    continue
+                await send_command(writer, "QUEUE", [game_name])
+            elif command == "LEAVE_QUEUE":
+                if not logged_in.value:
+                    print("尚未登入。")
+                    continue
+                await send_command(writer, "LEAVE_QUEUE", [])
+            elif command == "QUEUE_STATS":
+                if not logged_in.value:
+                    print("尚未登入。")
+                    continue
+                await send_command(writer, "QUEUE_STATS", [])
+            elif command == "STATS":
+                if not logged_in.value:
+                    print("尚未登入。")
+                    continue
+                if len(params) > 2 or (len(params) == 2 and params[0] != "game"):
+                    print("用法：stats [使用者名稱] 或 stats game <game_name>")
+                    continue
+                await send_command(writer, "STATS", params)
+            elif command == "HISTORY":
+                if not logged_in.value:
+                    print("尚未登入。")
+                    continue
+                if len(params) > 2:
+                    print("用法：history [使用者名稱] [筆數]")
+                    continue
+                await send_command(writer, "HISTORY", params)
+            elif command == "LEADERBOARD":
+                if not logged_in.value:
+                    print("尚未登入。")
+                    continue
+                if not 1 <= len(params) <= 3:
+                    print("用法：leaderboard <game_name> [起始名次] [筆數]")
+                    continue
+                if len(params) > 1:
+                    # Users count places from 1; the lobby takes a 0-based offset.
+                    if not params[1].isdigit() or int(params[1]) < 1:
+                        print("起始名次必須是正整數。")
+                        continue
+                    params[1] = str(int(params[1]) - 1)
+                await send_command(writer, "LEADERBOARD", params)
+            elif command == "RANK":
+                if not logged_in.value:
+                    print("尚未登入。")
+                    continue
+                if len(params) > 2:
+                    print("用法：rank [使用者名稱] [game_name]")
+                    continue
+                await send_command(writer, "RANK", params)
             else:
                 print("未知的指令。請輸入 'help' 查看可用指令。")
         except KeyboardInterrupt:
@@ -681,22 +1068,37 @@ async def main():
 
     game_in_progress = type('', (), {'value': False})()
     logged_in = type('', (), {'value': False})()
+    connection = LobbyConnection(writer)
 
-    asyncio.create_task(handle_server_messages(reader, writer, game_in_progress, logged_in))
-    asyncio.create_task(handle_user_input(reader, writer, game_in_progress, logged_in))
+    input_task = asyncio.create_task(handle_user_input(reader, connection, game_in_progress, logged_in))
 
     print("\n可用的指令：")
     for cmd in COMMANDS:
         print(cmd)
     print("")
 
-    await asyncio.Future()
+    while True:
+        dropped = await handle_server_messages(reader, connection, game_in_progress, logged_in)
+        if connection.closing:
+            break
+        if not dropped:
+            # Reading stopped on an error while the connection is still up; carry on until the user exits.
+            await input_task
+            break
+        reader = await reconnect(connection, server_ip, server_port, logged_in)
+        if reader is None:
+            break
+    await session_store.flush()
 
     print("客戶端已關閉。")
     logging.info("客戶端已關閉。")
     sys.exit()
 
 if __name__ == "__main__":
+    if config.GAME_WORKERS > 0:
+        # Fork the workers before any event loop or executor thread exists.
+        game_pool = GameWorkerPool(config.GAME_WORKERS)
+        game_pool.start()
     try:
         asyncio.run(main())
     except Exception as e:
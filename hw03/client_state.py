@@ -0,0 +1,62 @@
+import asyncio
+import json
+import logging
+import os
+
+import aiofiles
+
+
+class StateStore:
+    """In-memory client session state with optional write-behind persistence.
+
+    Reads and updates never touch the disk. When a path is set, changes are
+    written out ``flush_delay`` seconds after the first unsaved update so a
+    crashed client can pick its last state back up.
+    """
+
+    def __init__(self, initial, flush_delay=1.0, write_behind=True, mode=None):
+        self.data = dict(initial)
+        self.flush_delay = flush_delay
+        self.write_behind = write_behind
+        self.mode = mode  # permissions for a newly created file, e.g. 0o600 for secrets
+        self.path = None
+        self.flush_task = None
+
+    async def attach(self, path):
+        """Persist to path, recovering whatever was saved there before."""
+        self.path = path
+        try:
+            async with aiofiles.open(path, 'r') as f:
+                saved = json.loads(await f.read())
+            self.data.update(saved)
+            return True
+        except FileNotFoundError:
+            await self.flush()
+        except (OSError, json.JSONDecodeError) as e:
+            logging.error(f"讀取 {path} 時發生錯誤：{e}")
+        return False
+
+    def get(self):
+        return dict(self.data)
+
+    def update(self, new_info):
+        self.data.update(new_info)
+        if self.path and self.write_behind and self.flush_task is None:
+            self.flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.flush_delay)
+        finally:
+            self.flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        if not self.path:
+            return
+        try:
+            opener = None if self.mode is None else lambda path, flags: os.open(path, flags, self.mode)
+            async with aiofiles.open(self.path, 'w', opener=opener) as f:
+                await f.write(json.dumps(self.data, ensure_ascii=False, indent=4))
+        except OSError as e:
+            logging.error(f"寫入 {self.path} 時發生錯誤：{e}")
@@ -3,5 +3,124 @@
 HOST = '140.113.235.151'
 PORT = 47298
 LOG_FILE = 'server.log'
+CLIENT_LOG_FILE = 'client.log'
+# Logs are written by a background thread; DEBUG records beyond this many
+# per second from one line of code are dropped (None keeps them all).
+LOG_DEBUG_RATE = 20
 
 P2P_PORT_RANGE = (62838, 63021)
+P2P_LEASE_TTL = 1800
+
+# None disables rating bands: any two queued players are paired in FIFO order.
+MATCHMAKING_RATING_BAND = None
+MATCHMAKING_BAND_GROWTH = 10.0
+# With rating bands on, waiting players are checked against each other again
+# every MATCHMAKING_RESCAN_INTERVAL seconds as their bands widen.
+MATCHMAKING_RESCAN_INTERVAL = 2.0
+
+# 'direct' connects players peer-to-peer and falls back to the relay when the
+# connect fails; 'relay' always routes game traffic through the relay.
+P2P_MODE = 'direct'
+RELAY_ENABLED = True
+RELAY_HOST = HOST
+RELAY_PORT = 47299
+
+# 'p2p' lets the players connect to each other; 'hosted' plays rps/ttt
+# matches on the game session server instead.
+GAME_MODE = 'p2p'
+SESSION_SERVER_IN_PROCESS = True
+SESSION_HOST = HOST
+SESSION_PORT = 47300
+
+# The client keeps peer_info in memory and writes it behind to peer_info.json.
+PEER_INFO_WRITE_BEHIND = True
+PEER_INFO_FLUSH_DELAY = 1.0
+
+# Pre-started processes that run downloaded games; 0 runs games in the client's own event loop.
+GAME_WORKERS = 2
+
+# Game clients retry a refused P2P connect with jittered exponential backoff,
+# and connect at once when the lobby forwards the host's peer_ready.
+P2P_CONNECT_RETRIES = 12
+P2P_BACKOFF_BASE = 0.05
+P2P_BACKOFF_MAX = 2.0
+
+# Game-start trace spans; the server writes TRACE_FILE, each client writes
+# trace.jsonl in its games folder. Merge them with merge_traces.py.
+TRACE_ENABLED = True
+TRACE_FILE = 'trace.jsonl'
+
+# Let the built-in solver play this client's moves (games that support it, e.g. ttt).
+GAME_BOT = False
+
+# Games record every move into <REPLAY_FILE>.rec / .idx (fixed-size records,
+# one index entry per match); clients keep theirs in the games folder and
+# upload each finished match to the lobby. Read them with replay_log.py.
+REPLAY_ENABLED = True
+REPLAY_FILE = 'replays'
+REPLAY_MAX_RECORDS = 4096
+REPLAY_UPLOAD_TIMEOUT = 30  # seconds for a client to send its records
+
+# Finished matches (players, game, outcome, duration) as per-column files in
+# HISTORY_DIR, queried by the STATS and HISTORY commands. New matches are
+# written HISTORY_FLUSH_DELAY seconds after the first unsaved one.
+HISTORY_DIR = 'history'
+HISTORY_FLUSH_DELAY = 1.0
+HISTORY_MAX_LIMIT = 100
+
+# Per-game Elo ratings, updated from every decided match and saved to
+# RATINGS_FILE write-behind; the first LEADERBOARD_TOP places are cached.
+ELO_INITIAL = 1200.0
+ELO_K = 32.0
+LEADERBOARD_TOP = 100
+LEADERBOARD_MAX_LIMIT = 100
+RATINGS_FILE = 'ratings.json'
+RATINGS_FLUSH_DELAY = 1.0
+
+# Prometheus text-format metrics at http://METRICS_HOST:METRICS_PORT/metrics,
+# served from the lobby's event loop. Bound to loopback: scrape it locally.
+METRICS_ENABLED = True
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 47301
+# Threads that run PBKDF2 for REGISTER and LOGIN off the event loop.
+PBKDF2_THREADS = 2
+
+# Event-loop lag monitor: a tick every LOOP_MONITOR_INTERVAL seconds measures
+# scheduling lag (exported as lobby_loop_* metrics over the last
+# LOOP_LAG_WINDOW ticks); a watchdog thread logs the loop thread's stack
+# whenever the loop is stuck for more than LOOP_STALL_THRESHOLD seconds.
+LOOP_MONITOR_ENABLED = True
+LOOP_MONITOR_INTERVAL = 0.05
+LOOP_STALL_THRESHOLD = 0.1
+LOOP_LAG_WINDOW = 1200
+
+# Admin Unix socket (mode 0600) for `python profiler.py [seconds] [--memory]`:
+# samples the lobby's event-loop stack every PROFILE_INTERVAL seconds and
+# returns collapsed stacks for flame graphs, plus a tracemalloc diff.
+ADMIN_ENABLED = True
+ADMIN_SOCKET = 'admin.sock'
+PROFILE_INTERVAL = 0.005
+PROFILE_MAX_SECONDS = 120
+
+# LOGIN_SUCCESS carries a signed resume token. After a dropped connection the
+# client sends RESUME <token> [lobby version] instead of LOGIN, which skips
+# PBKDF2, restores status and room, and gets only the lobby changes of the
+# last LOBBY_JOURNAL_SIZE updates. Clients reconnect with jittered backoff.
+# The token is saved (mode 0600) as SESSION_FILE in the user's own folder and
+# only used after a restart when the user types `resume <username>`.
+RESUME_TOKEN_TTL = 3600
+LOBBY_JOURNAL_SIZE = 1024
+SESSION_FILE = 'session.json'
+RECONNECT_RETRIES = 8
+RECONNECT_BACKOFF_BASE = 0.5
+RECONNECT_BACKOFF_MAX = 15.0
+
+# Expiry timers live on a hashed timer wheel of EXPIRY_SLOTS buckets that
+# ticks every EXPIRY_TICK seconds. Invites lapse after INVITE_TTL, a dropped
+# player keeps their room seat for DISCONNECT_GRACE seconds to RESUME, and a
+# room with no GAME_OVER after GAME_TIMEOUT seconds is closed.
+EXPIRY_TICK = 1.0
+EXPIRY_SLOTS = 512
+INVITE_TTL = 120
+DISCONNECT_GRACE = 60
+GAME_TIMEOUT = 7200
@@ -0,0 +1,89 @@
+import hashlib
+import importlib.util
+import logging
+import marshal
+import os
+
+import aiofiles
+import aiofiles.os
+
+MAGIC = importlib.util.MAGIC_NUMBER
+
+
+class GameLoader:
+    """Compile each downloaded game once per content digest.
+
+    Code objects are kept in memory and marshalled under ``cache_dir`` so a
+    restarted client skips compilation too. The module namespace built by
+    running the code is reused by every match of the same game version.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+        self.code_cache = {}  # digest -> code object
+        self.namespaces = {}  # file_path -> (digest, namespace)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    async def load(self, file_path):
+        async with aiofiles.open(file_path, 'rb') as f:
+            source = await f.read()
+        digest = hashlib.sha256(source).hexdigest()
+        cached = self.namespaces.get(file_path)
+        if cached is not None and cached[0] == digest:
+            self.hits += 1
+            return cached[1]
+        code = await self.get_code(file_path, source, digest)
+        game_name = os.path.splitext(os.path.basename(file_path))[0]
+        namespace = {"__name__": f"game_{game_name}", "__file__": file_path}
+        exec(code, namespace)
+        # An updated download replaces the previous version's namespace.
+        self.namespaces[file_path] = (digest, namespace)
+        return namespace
+
+    async def get_code(self, file_path, source, digest):
+        code = self.code_cache.get(digest)
+        if code is not None:
+            return code
+        cache_path = self.cache_path(file_path, digest)
+        if cache_path and await aiofiles.os.path.exists(cache_path):
+            try:
+                async with aiofiles.open(cache_path, 'rb') as f:
+                    data = await f.read()
+                if data[:len(MAGIC)] == MAGIC:
+                    code = marshal.loads(data[len(MAGIC):])
+                    self.disk_hits += 1
+            except (OSError, ValueError, EOFError, TypeError) as e:
+                logging.warning(f"遊戲快取 {cache_path} 無法讀取：{e}")
+        if code is None:
+            code = compile(source, file_path, 'exec')
+            self.misses += 1
+            if cache_path:
+                await self.write_cache(cache_path, code)
+        self.code_cache[digest] = code
+        return code
+
+    def cache_path(self, file_path, digest):
+        if not self.cache_dir:
+            return None
+        game_name = os.path.splitext(os.path.basename(file_path))[0]
+        return os.path.join(self.cache_dir, f"{game_name}-{digest[:16]}.pyc")
+
+    async def write_cache(self, cache_path, code):
+        tmp_path = cache_path + '.tmp'
+        try:
+            await aiofiles.os.makedirs(self.cache_dir, exist_ok=True)
+            async with aiofiles.open(tmp_path, 'wb') as f:
+                await f.write(MAGIC + marshal.dumps(code))
+            await aiofiles.os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logging.warning(f"寫入遊戲快取 {cache_path} 失敗：{e}")
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "cached_versions": len(self.code_cache)
+        }
@@ -0,0 +1,390 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import deque
+
+import config
+import replay_log
+import tracing
+
+MAX_FRAME = 64 * 1024
+
+event_handler = None  # forwards transport events such as "listening" to the lobby client
+ready_waiters = set()  # one event per connect_peer in progress, set when the lobby says the host is listening
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class FrameDecoder:
+    """Streaming decoder for newline-delimited JSON frames.
+
+    ``feed`` accepts whatever the socket returned: half a frame, several
+    coalesced frames, or both, and yields only complete frames.
+    """
+
+    def __init__(self, max_frame=MAX_FRAME):
+        self.max_frame = max_frame
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer += data
+        frames = []
+        start = 0
+        while True:
+            end = self.buffer.find(b'\n', start)
+            if end < 0:
+                break
+            line = bytes(self.buffer[start:end])
+            start = end + 1
+            if not line.strip():
+                continue
+            try:
+                frame = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                raise ProtocolError(f"Invalid frame: {e}")
+            if not isinstance(frame, dict):
+                raise ProtocolError("Frame is not an object")
+            frames.append(frame)
+        del self.buffer[:start]
+        if len(self.buffer) > self.max_frame:
+            raise ProtocolError("Frame too large")
+        return frames
+
+
+def encode_frame(message):
+    return json.dumps(message).encode() + b'\n'
+
+
+class GameConnection:
+    """Framed, sequenced message channel between two game peers.
+
+    Every frame sent carries a per-sender ``seq``; frames at or below the
+    last sequence number seen are dropped as duplicates. ``queue`` plus
+    ``flush`` (or ``send_many``) put several frames into one write and one
+    drain. With ``replay_path`` in peer_info, move frames in both directions
+    are recorded in memory and appended to the replay log on ``close``. A
+    ``move_clock`` in peer_info (simulate.py) is told about every move frame
+    sent and accepted.
+    """
+
+    def __init__(self, reader, writer, peer_info=None):
+        self.reader = reader
+        self.writer = writer
+        self.peer_info = peer_info
+        self.decoder = FrameDecoder()
+        self.pending = deque()
+        self.outbox = []
+        self.send_seq = 0
+        self.recv_seq = None
+        self.frames_received = 0
+        self.duplicates = 0
+        self.gaps = 0
+        self.protocol_errors = 0
+        self.recorder = None
+        self.move_clock = peer_info.get("move_clock") if peer_info is not None else None
+        if peer_info is not None and peer_info.get("replay_path"):
+            self.recorder = replay_log.ReplayRecorder(peer_info.get("trace_id"), peer_info.get("game_name"),
+                                                      peer_info.get("role"))
+
+    def queue(self, message):
+        frame = dict(message)
+        frame["seq"] = self.send_seq
+        self.send_seq += 1
+        self.outbox.append(encode_frame(frame))
+        if "move" in message:
+            self.mark_first_move()
+            if self.recorder is not None:
+                self.recorder.record(replay_log.SENT, frame["seq"], message["move"])
+            if self.move_clock is not None:
+                self.move_clock.sent(self.peer_info.get("role"))
+
+    async def flush(self):
+        if not self.outbox:
+            return
+        data = b''.join(self.outbox)
+        self.outbox.clear()
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def send(self, message):
+        self.queue(message)
+        await self.flush()
+
+    async def send_many(self, messages):
+        for message in messages:
+            self.queue(message)
+        await self.flush()
+
+    async def send_unsequenced(self, message):
+        """Handshake frames for the relay or session server, not the peer."""
+        self.writer.write(encode_frame(message))
+        await self.writer.drain()
+
+    async def receive(self):
+        """Return the next frame, or None once the peer has disconnected."""
+        while True:
+            while self.pending:
+                frame = self.pending.popleft()
+                if self.accept(frame):
+                    return frame
+            data = await self.reader.read(4096)
+            if not data:
+                return None
+            try:
+                self.pending.extend(self.decoder.feed(data))
+            except ProtocolError:
+                self.protocol_errors += 1
+                raise
+
+    def accept(self, frame):
+        seq = frame.get("seq")
+        if isinstance(seq, int):
+            if self.recv_seq is not None and seq <= self.recv_seq:
+                self.duplicates += 1
+                return False
+            if self.recv_seq is not None and seq != self.recv_seq + 1:
+                self.gaps += 1
+                logging.warning(f"遊戲訊息序號不連續：預期 {self.recv_seq + 1}，收到 {seq}")
+            self.recv_seq = seq
+        if "move" in frame:
+            self.mark_first_move()
+            if self.recorder is not None:
+                self.recorder.record(replay_log.RECEIVED, seq, frame["move"])
+            if self.move_clock is not None:
+                self.move_clock.received(self.peer_info.get("role"))
+        self.frames_received += 1
+        return True
+
+    def mark_first_move(self):
+        if self.peer_info is not None and self.peer_info.get("first_move_at") is None:
+            self.peer_info["first_move_at"] = time.monotonic()
+            trace(self.peer_info, "game.first_move", time.time())
+
+    def report_outcome(self, outcome):
+        """"win", "loss" or "draw" for this player; the lobby client sends it with GAME_OVER."""
+        if self.peer_info is not None:
+            self.peer_info["outcome"] = outcome
+
+    def stats(self):
+        return {
+            "frames_sent": self.send_seq,
+            "frames_received": self.frames_received,
+            "duplicates": self.duplicates,
+            "gaps": self.gaps,
+            "protocol_errors": self.protocol_errors
+        }
+
+    def save_replay(self):
+        """Append the recorded moves, once the game is over, and note the entry for the lobby client."""
+        if self.recorder is None or not self.recorder.count:
+            return
+        recorder, self.recorder = self.recorder, None
+        try:
+            self.peer_info["replay_entry"] = replay_log.append(self.peer_info["replay_path"], recorder)
+        except OSError as e:
+            logging.warning(f"寫入對局紀錄失敗：{e}")
+
+    async def close(self):
+        try:
+            await self.flush()
+        except (ConnectionError, OSError):
+            pass
+        if self.peer_info is not None:
+            self.peer_info["transport_stats"] = self.stats()
+        self.save_replay()
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+
+def set_event_handler(handler):
+    global event_handler
+    event_handler = handler
+
+
+def notify(event):
+    if event_handler is not None:
+        try:
+            event_handler(event)
+        except Exception as e:
+            logging.warning(f"無法通知大廳客戶端：{e}")
+
+
+def trace(peer_info, name, start, duration=0.0, **fields):
+    """Hand a span to the lobby client, which writes it to its trace file."""
+    trace_id = peer_info.get("trace_id") if peer_info else None
+    if trace_id is not None:
+        fields["role"] = peer_info.get("role")
+        notify({"event": "span", "span": tracing.make_span(trace_id, name, "game", start, duration, **fields)})
+
+
+def signal_peer_ready():
+    for ready in ready_waiters:
+        ready.set()
+
+
+def mark_connected(peer_info):
+    if peer_info is not None:
+        peer_info["connected_at"] = time.monotonic()
+
+
+async def accept_peer(own_port, peer_info):
+    """Listen on own_port (0 for any free port) and return the first peer that connects."""
+    loop = asyncio.get_running_loop()
+    accepted = loop.create_future()
+
+    def on_connect(reader, writer):
+        if accepted.done():
+            writer.close()
+        else:
+            accepted.set_result((reader, writer))
+
+    server = await asyncio.start_server(on_connect, '0.0.0.0', own_port)
+    # Port 0 lets the OS pick a free one; the listening event carries the port actually bound.
+    own_port = server.sockets[0].getsockname()[1]
+    logging.info(f"等待客戶端連接於 {own_port} 作為遊戲主機...")
+    print(f"等待客戶端連接於 {own_port} 作為遊戲主機...")
+    notify({"event": "listening", "port": own_port})
+    try:
+        reader, writer = await accepted
+    finally:
+        server.close()
+        await server.wait_closed()
+    print("客戶端已連接。")
+    mark_connected(peer_info)
+    return GameConnection(reader, writer, peer_info)
+
+
+def backoff_delay(attempt, base, cap):
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+async def connect_peer(peer_ip, peer_port, peer_info, max_retries=config.P2P_CONNECT_RETRIES,
+                       base_delay=config.P2P_BACKOFF_BASE, max_delay=config.P2P_BACKOFF_MAX):
+    peer_ready = asyncio.Event()
+    ready_waiters.add(peer_ready)
+    try:
+        for attempt in range(1, max_retries + 1):
+            try:
+                print(f"正在連接到 {peer_ip}:{peer_port} 的主機作為客戶端...（嘗試 {attempt}）")
+                reader, writer = await asyncio.open_connection(peer_ip, peer_port)
+                print("已成功連接到主機。")
+                mark_connected(peer_info)
+                peer_info["connect_attempts"] = attempt
+                return GameConnection(reader, writer, peer_info)
+            except ConnectionRefusedError:
+                if attempt < max_retries:
+                    delay = backoff_delay(attempt - 1, base_delay, max_delay)
+                    print(f"連接被拒絕，{delay:.2f} 秒後重試...")
+                    # Whichever comes first: the backoff timer or the host saying it is listening.
+                    try:
+                        await asyncio.wait_for(peer_ready.wait(), delay)
+                        logging.info("主機已就緒，立即重新連接。")
+                    except asyncio.TimeoutError:
+                        pass
+                    peer_ready.clear()
+            except OSError as e:
+                logging.error(f"連接主機時失敗：{e}")
+                break
+    finally:
+        ready_waiters.discard(peer_ready)
+    logging.error(f"嘗試 {max_retries} 次後連接失敗。")
+    print(f"嘗試 {max_retries} 次後連接失敗。正在退出...")
+    peer_info["connect_failed"] = True
+    return None
+
+
+async def join_relay(peer_info, timeout=30):
+    relay_host = peer_info.get("relay_host")
+    relay_port = peer_info.get("relay_port")
+    print(f"正在透過中繼伺服器 {relay_host}:{relay_port} 連接對手...")
+    reader, writer = await asyncio.open_connection(relay_host, int(relay_port))
+    conn = GameConnection(reader, writer, peer_info)
+    writer.write(f"RELAY {peer_info['relay_token']}\n".encode())
+    await writer.drain()
+    line = await asyncio.wait_for(reader.readline(), timeout)
+    if line.strip() != b"PAIRED":
+        await conn.close()
+        raise ConnectionError(f"中繼伺服器拒絕連線：{line!r}")
+    print("已透過中繼伺服器連接到對手。")
+    mark_connected(peer_info)
+    return conn
+
+
+async def join_session(peer_info, game):
+    session_host = peer_info.get("session_host")
+    session_port = peer_info.get("session_port")
+    print(f"正在連接到遊戲伺服器 {session_host}:{session_port}...")
+    reader, writer = await asyncio.open_connection(session_host, int(session_port))
+    conn = GameConnection(reader, writer, peer_info)
+    await conn.send_unsequenced({"op": "join", "sid": peer_info["session_id"], "game": game, "role": peer_info.get("role")})
+    print("等待對手加入對局...")
+    frame = await conn.receive()
+    if frame is None or frame.get("op") != "start":
+        await conn.close()
+        raise ConnectionError(f"遊戲伺服器拒絕加入：{frame!r}")
+    print("對局開始。")
+    mark_connected(peer_info)
+    return conn
+
+
+async def connect(peer_info, game):
+    """Open the game channel described by peer_info; None if that failed."""
+    start = time.time()
+    started = time.perf_counter()
+    conn = await open_channel(peer_info, game)
+    trace(peer_info, "game.connect", start, time.perf_counter() - started,
+          attempts=peer_info.get("connect_attempts"), ok=conn is not None)
+    return conn
+
+
+async def open_channel(peer_info, game):
+    if peer_info.get("streams") is not None:
+        # Already-connected (reader, writer), e.g. in-memory streams from simulate.py.
+        reader, writer = peer_info["streams"]
+        mark_connected(peer_info)
+        return GameConnection(reader, writer, peer_info)
+    try:
+        if peer_info.get("session_id"):
+            return await join_session(peer_info, game)
+        if peer_info.get("relay_token"):
+            return await join_relay(peer_info)
+    except (OSError, asyncio.TimeoutError, ProtocolError) as e:
+        print(f"無法連接到對手：{e}")
+        logging.error(f"無法連接到對手：{e}")
+        return None
+
+    role = peer_info.get("role")
+    own_port = peer_info.get("own_port")
+    peer_ip = peer_info.get("peer_ip")
+    peer_port = peer_info.get("peer_port")
+    if None in [role, own_port, peer_ip, peer_port]:
+        print("錯誤：缺少必要的 P2P 連接資訊。")
+        logging.error("缺少必要的 P2P 連接資訊。")
+        return None
+    try:
+        own_port = int(own_port)
+        peer_port = int(peer_port)
+    except ValueError:
+        print("錯誤：無效的端口號。")
+        logging.error("無效的端口號。")
+        return None
+
+    if role == "host":
+        try:
+            return await accept_peer(own_port, peer_info)
+        except OSError as e:
+            print(f"無法在 {own_port} 上等待對手：{e}")
+            logging.error(f"無法在 {own_port} 上等待對手：{e}")
+            return None
+    if role == "client":
+        return await connect_peer(peer_ip, peer_port, peer_info)
+    print("無效的角色，無法啟動遊戲")
+    return None
@@ -0,0 +1,253 @@
+import asyncio
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import sys
+import threading
+import time
+from multiprocessing import reduction
+
+import game_transport
+from game_loader import GameLoader
+
+
+def worker_main(conn, stdin_fd):
+    # multiprocessing points sys.stdin at /dev/null; games still read moves from the terminal.
+    if stdin_fd is not None:
+        sys.stdin = os.fdopen(stdin_fd, 'r', closefd=False)
+    loader = GameLoader()
+    # Transport events (the host is listening) go back to the client over the pipe.
+    game_transport.set_event_handler(conn.send)
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+        if "file_path" not in job:
+            # A control message that arrived after its game had already ended.
+            continue
+        conn.send(asyncio.run(run_job(loader, job, conn)))
+
+
+async def run_job(loader, job, conn):
+    loop = asyncio.get_running_loop()
+    peer_info = job["peer_info"]
+    loader.cache_dir = job.get("cache_dir")
+    result = {"event": "result", "error": None, "cancelled": False}
+    try:
+        start = time.time()
+        started = time.perf_counter()
+        namespace = await loader.load(job["file_path"])
+        game_transport.trace(peer_info, "game.load", start, time.perf_counter() - started, worker=True)
+        namespace["peer_info"] = peer_info
+        if not callable(namespace.get("main")):
+            result["error"] = "遊戲腳本不包含 main() 函數。"
+        else:
+            task = asyncio.create_task(namespace["main"](peer_info))
+            loop.add_reader(conn.fileno(), handle_control, conn, task)
+            try:
+                await task
+            except asyncio.CancelledError:
+                result["cancelled"] = True
+            finally:
+                loop.remove_reader(conn.fileno())
+    except Exception as e:
+        result["error"] = str(e)
+    result["peer_info"] = peer_info
+    return result
+
+
+def zygote_main(conn, stdin_fd):
+    # Forked before the client's event loop starts; forks replacement workers on request,
+    # so the client never forks while its loop and executor threads are running.
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)  # the kernel reaps finished workers
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            break
+        if request is None:
+            break
+        parent_conn, child_conn = multiprocessing.Pipe()
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            conn.close()
+            parent_conn.close()
+            try:
+                worker_main(child_conn, stdin_fd)
+            finally:
+                sys.stdout.flush()
+                os._exit(0)
+        child_conn.close()
+        conn.send(pid)
+        reduction.send_handle(conn, parent_conn.fileno(), None)
+        parent_conn.close()
+
+
+class ForkedProcess:
+    """The is_alive()/kill() part of a Process, for a worker the zygote forked."""
+
+    def __init__(self, pid):
+        self.pid = pid
+
+    def is_alive(self):
+        try:
+            os.kill(self.pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def kill(self):
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+def handle_control(conn, task):
+    try:
+        message = conn.recv()
+    except (EOFError, OSError):
+        # The client went away; nobody is left to play for.
+        task.cancel()
+        return
+    if message.get("event") == "cancel":
+        task.cancel()
+    elif message.get("event") == "peer_ready":
+        game_transport.signal_peer_ready()
+
+
+class GameWorkerPool:
+    """Pre-started worker processes that run downloaded games.
+
+    Workers fork before the client starts its event loop, already holding
+    asyncio and the game loader, so a game starts without interpreter
+    start-up and runs on its own event loop. Results come back over a pipe.
+    Replacements for crashed or cancelled workers come from a zygote
+    process forked alongside them, never from the running client.
+    """
+
+    def __init__(self, size):
+        if "fork" in multiprocessing.get_all_start_methods():
+            self.ctx = multiprocessing.get_context("fork")
+        else:
+            self.ctx = multiprocessing.get_context()
+        self.size = size
+        self.idle = []
+        self.busy = []
+        try:
+            self.stdin_fd = sys.stdin.fileno()
+        except (AttributeError, OSError, ValueError):
+            self.stdin_fd = None
+        self.crashed = 0
+        self.zygote = None
+        self.zygote_lock = threading.Lock()
+
+    def start(self):
+        while len(self.idle) < self.size:
+            self.idle.append(self.spawn())
+        if self.zygote is None and self.ctx.get_start_method() == "fork":
+            self.zygote = self.spawn(zygote_main)
+
+    def spawn(self, target=worker_main):
+        parent_conn, child_conn = self.ctx.Pipe()
+        process = self.ctx.Process(target=target, args=(child_conn, self.stdin_fd), daemon=True)
+        process.start()
+        child_conn.close()
+        return {"process": process, "conn": parent_conn}
+
+    def request_worker(self):
+        with self.zygote_lock:
+            conn = self.zygote["conn"]
+            conn.send("spawn")
+            pid = conn.recv()
+            fd = reduction.recv_handle(conn)
+        return {"process": ForkedProcess(pid), "conn": multiprocessing.connection.Connection(fd)}
+
+    async def respawn(self):
+        """A new worker for the running client; None if none could be started."""
+        if self.zygote is None:
+            # Without fork (spawn start method) starting a process copies nothing of the running loop.
+            return self.spawn()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, self.request_worker)
+        except (EOFError, OSError) as e:
+            logging.error(f"無法啟動新的遊戲程序：{e}")
+            return None
+
+    async def run(self, file_path, peer_info, cache_dir=None, on_event=None):
+        worker = self.idle.pop() if self.idle else await self.respawn()
+        if worker is None:
+            return {"event": "result", "error": "無法啟動遊戲程序", "crashed": True}
+        conn = worker["conn"]
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+
+        def on_readable():
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                message = {"event": "result", "error": "遊戲程序異常結束", "crashed": True}
+            if message.get("event") == "result":
+                if not done.done():
+                    done.set_result(message)
+            elif on_event is not None:
+                on_event(message)
+
+        loop.add_reader(conn.fileno(), on_readable)
+        self.busy.append(worker)
+        try:
+            conn.send({"file_path": file_path, "peer_info": peer_info, "cache_dir": cache_dir})
+            try:
+                return await asyncio.shield(done)
+            except asyncio.CancelledError:
+                conn.send({"event": "cancel"})
+                try:
+                    await asyncio.wait_for(done, 5)
+                except (asyncio.TimeoutError, asyncio.CancelledError):
+                    worker["process"].kill()
+                raise
+        except (BrokenPipeError, OSError) as e:
+            logging.error(f"遊戲程序通訊失敗：{e}")
+            return {"event": "result", "error": str(e), "crashed": True}
+        finally:
+            loop.remove_reader(conn.fileno())
+            self.busy.remove(worker)
+            if done.done() and not done.cancelled() and not done.result().get("crashed") and worker["process"].is_alive():
+                self.idle.append(worker)
+            else:
+                self.crashed += 1
+                worker["process"].kill()
+                conn.close()
+                replacement = await self.respawn()
+                if replacement is not None:
+                    self.idle.append(replacement)
+
+    def send_control(self, message):
+        """Pass a lobby event on to the games that are running."""
+        for worker in self.busy:
+            try:
+                worker["conn"].send(message)
+            except OSError as e:
+                logging.warning(f"無法傳送控制訊息給遊戲程序：{e}")
+
+    def close(self):
+        if self.zygote is not None:
+            try:
+                self.zygote["conn"].send(None)
+            except OSError:
+                pass
+            self.zygote = None
+        for worker in self.idle:
+            try:
+                worker["conn"].send(None)
+            except OSError:
+                pass
+        self.idle.clear()
@@ -1,7 +1,8 @@
 import asyncio
-import json
 import logging
 
+import game_transport
+
 ASCII_ART = {
     'rock': '''
         _______
@@ -31,106 +32,43 @@ ASCII_ART = {
 
 VALID_MOVES = ['rock', 'paper', 'scissors']
 
-async def send_message(writer, message):
-    try:
-        data = json.dumps(message) + '\n'
-        writer.write(data.encode())
-        await writer.drain()
-    except Exception as e:
-        logging.error(f"發送消息失敗：{e}")
-
 async def get_user_input(prompt):
     loop = asyncio.get_event_loop()
     return await loop.run_in_executor(None, lambda: input(prompt).strip().lower())
 
 async def main(peer_info):
-    role = peer_info.get("role")
-    own_port = peer_info.get("own_port")
-    peer_ip = peer_info.get("peer_ip")
-    peer_port = peer_info.get("peer_port")
-
-    if None in [role, own_port, peer_ip, peer_port]:
-        print("錯誤：缺少必要的 P2P 連接資訊。")
-        logging.error("缺少必要的 P2P 連接資訊。")
+    conn = await game_transport.connect(peer_info, "rps")
+    if conn is None:
         return
-
+    role = "Host" if peer_info.get("role") == "host" else "Client"
     try:
-        own_port = int(own_port)
-        peer_port = int(peer_port)
-    except ValueError:
-        print("錯誤：無效的端口號。")
-        logging.error("無效的端口號。")
-        return
-
-    if role == "host":
-        await start_rps_game_as_host(own_port, peer_info)
-    elif role == "client":
-        await start_rps_game_as_client(peer_ip, peer_port, peer_info)
-    else:
-        print("無效的角色，無法啟動遊戲")
+        await rps_game_loop(conn, role)
+    except Exception as e:
+        logging.error(f"RPS 遊戲錯誤：{e}")
+    finally:
+        await conn.close()
 
 # -------------------------
 # Rock-Paper-Scissors (RPS) 遊戲函數
 # -------------------------
 
-async def start_rps_game_as_host(own_port, peer_info):
-    server = await asyncio.start_server(lambda r, w: handle_rps_client(r, w, peer_info), '0.0.0.0', own_port)
-    logging.info(f"等待客戶端連接於 {own_port} 作為 RPS 主機...")
-    print(f"等待客戶端連接於 {own_port} 作為 RPS 主機...")
-    
-    global server_close_event
-    server_close_event = asyncio.Event()
-
-    async def stop_server():
-        await server_close_event.wait()
-        server.close()
-        await server.wait_closed()
-        print("遊戲伺服器已關閉。")
-
-    async with server:
-        await asyncio.gather(server.serve_forever(), stop_server())
-
-async def handle_rps_client(reader, writer, peer_info):
+async def receive_rps_move(conn):
+    """Return the opponent's move, "" for an invalid one, or None on disconnect."""
     try:
-        print("RPS 客戶端已連接。")
-        await rps_game_loop(reader, writer, "Host", peer_info)
-    except Exception as e:
-        logging.error(f"RPS 主機錯誤：{e}")
-    finally:
-        writer.close()
-        await writer.wait_closed()
-
-async def start_rps_game_as_client(peer_ip, peer_port, peer_info, max_retries=10, retry_delay=2):
-    writer = None
-    retries = 0
-
-    while retries < max_retries:
-        try:
-            print(f"正在連接到 {peer_ip}:{peer_port} 的 RPS 主機作為客戶端...（嘗試 {retries + 1}）")
-            reader, writer = await asyncio.open_connection(peer_ip, peer_port)
-            print("已成功連接到主機。")
-            await rps_game_loop(reader, writer, "Client", peer_info)
-            break
-
-        except ConnectionRefusedError:
-            retries += 1
-            if retries >= max_retries:
-                logging.error(f"嘗試 {max_retries} 次後連接失敗。")
-                print(f"嘗試 {max_retries} 次後連接失敗。正在退出...")
-                return
-            else:
-                print(f"連接被拒絕，{retry_delay} 秒後重試...")
-                await asyncio.sleep(retry_delay)
-
-        except Exception as e:
-            logging.error(f"啟動 RPS 客戶端模式時失敗：{e}")
-            break
-
-    if writer is not None:
-        writer.close()
-        await writer.wait_closed()
-
-async def rps_game_loop(reader, writer, role, peer_info):
+        message = await conn.receive()
+    except game_transport.ProtocolError:
+        print("收到無效的訊息。")
+        return ""
+    if message is None:
+        print("對手已斷開連接。")
+        return None
+    opponent_move = message.get("move")
+    if opponent_move not in VALID_MOVES:
+        print("收到無效的移動。")
+        return ""
+    return opponent_move
+
+async def rps_game_loop(conn, role):
     my_move = None
     opponent_move = None
     game_over = False
@@ -139,46 +77,28 @@ async def rps_game_loop(reader, writer, role, peer_info):
         if role == "Host":
             # Host move
             my_move = await get_rps_move("Host")
-            await send_message(writer, {"move": my_move})
+            await conn.send({"move": my_move})
             print("等待對手的移動...")
-            data = await reader.read(1024)
-            if not data:
-                print("對手已斷開連接。")
-                game_over = True
+            opponent_move = await receive_rps_move(conn)
+            if opponent_move is None:
                 break
-            try:
-                message = json.loads(data.decode())
-                opponent_move = message.get("move")
-                if opponent_move not in VALID_MOVES:
-                    print("收到無效的移動。")
-                    continue
-            except json.JSONDecodeError:
-                print("收到無效的訊息。")
+            if not opponent_move:
                 continue
         else:
             # Client move
             print("等待對手的移動...")
-            data = await reader.read(1024)
-            if not data:
-                print("對手已斷開連接。")
-                game_over = True
+            opponent_move = await receive_rps_move(conn)
+            if opponent_move is None:
                 break
-            try:
-                message = json.loads(data.decode())
-                opponent_move = message.get("move")
-                if opponent_move not in VALID_MOVES:
-                    print("收到無效的移動。")
-                    continue
-            except json.JSONDecodeError:
-                print("收到無效的訊息。")
+            if not opponent_move:
                 continue
             my_move = await get_rps_move("Client")
-            await send_message(writer, {"move": my_move})
+            await conn.send({"move": my_move})
 
         result = determine_rps_winner(my_move, opponent_move, role)
         display_rps_result(my_move, opponent_move, result, role)
+        conn.report_outcome(rps_outcome(my_move, opponent_move))
         game_over = True
-        server_close_event.set()
 
 async def get_rps_move(player):
     while True:
@@ -190,12 +110,21 @@ async def get_rps_move(player):
         else:
             print("無效的選擇，請再試一次。")
 
-def determine_rps_winner(my_move, opponent_move, role):
+def rps_outcome(my_move, opponent_move):
     if my_move == opponent_move:
-        return "平局"
+        return "draw"
     elif (my_move == 'rock' and opponent_move == 'scissors') or \
          (my_move == 'paper' and opponent_move == 'rock') or \
          (my_move == 'scissors' and opponent_move == 'paper'):
+        return "win"
+    else:
+        return "loss"
+
+def determine_rps_winner(my_move, opponent_move, role):
+    outcome = rps_outcome(my_move, opponent_move)
+    if outcome == "draw":
+        return "平局"
+    elif outcome == "win":
         return f"玩家 {role} 獲勝"
     else:
         return f"玩家 {'Client' if role == 'Host' else 'Host'} 獲勝"
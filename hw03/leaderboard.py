@@ -0,0 +1,202 @@
+"""Per-game Elo ratings kept in rank order.
+
+Every game has a ``Leaderboard``: a dict of ratings plus an indexable skip
+list ordered by (-rating, name), so a rating update, a player's rank and a
+page at any offset each cost O(log n) instead of sorting every player.
+"""
+import random
+
+MAX_LEVEL = 24  # enough for 2**24 players per game at p = 1/2
+
+
+class SkipNode:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        # width[i]: how many places next[i] is ahead of this node (to one past the end when it is None).
+        self.width = [1] * level
+
+
+class IndexableSkipList:
+    """Sorted keys with O(log n) insert, remove, rank and lookup by index."""
+
+    def __init__(self, rng=None):
+        self.head = SkipNode(None, MAX_LEVEL)
+        self.size = 0
+        self.rng = rng or random.Random()
+
+    def __len__(self):
+        return self.size
+
+    def random_level(self):
+        level = 1
+        while level < MAX_LEVEL and self.rng.random() < 0.5:
+            level += 1
+        return level
+
+    def find_before(self, key):
+        """The last node at each level whose key is < key, and its position (head is 0)."""
+        update = [None] * MAX_LEVEL
+        positions = [0] * MAX_LEVEL
+        node = self.head
+        position = 0
+        for level in range(MAX_LEVEL - 1, -1, -1):
+            while node.next[level] is not None and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+            update[level] = node
+            positions[level] = position
+        return update, positions
+
+    def insert(self, key):
+        update, positions = self.find_before(key)
+        new = SkipNode(key, self.random_level())
+        position = positions[0] + 1
+        for level in range(MAX_LEVEL):
+            before = update[level]
+            if level < len(new.next):
+                new.next[level] = before.next[level]
+                before.next[level] = new
+                new.width[level] = positions[level] + before.width[level] + 1 - position
+                before.width[level] = position - positions[level]
+            else:
+                before.width[level] += 1
+        self.size += 1
+
+    def remove(self, key):
+        update, _ = self.find_before(key)
+        node = update[0].next[0]
+        if node is None or node.key != key:
+            raise KeyError(key)
+        for level in range(MAX_LEVEL):
+            before = update[level]
+            if before.next[level] is node:
+                before.width[level] += node.width[level] - 1
+                before.next[level] = node.next[level]
+            else:
+                before.width[level] -= 1
+        self.size -= 1
+
+    def rank(self, key):
+        """0-based index of key, or None if it is not in the list."""
+        node = self.head
+        position = 0
+        for level in range(MAX_LEVEL - 1, -1, -1):
+            while node.next[level] is not None and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+        node = node.next[0]
+        return position if node is not None and node.key == key else None
+
+    def slice(self, offset, limit):
+        """Up to limit keys starting at 0-based index offset."""
+        if offset < 0 or offset >= self.size or limit <= 0:
+            return []
+        node = self.head
+        position = 0
+        for level in range(MAX_LEVEL - 1, -1, -1):
+            while node.next[level] is not None and position + node.width[level] <= offset + 1:
+                position += node.width[level]
+                node = node.next[level]
+        keys = []
+        while node is not None and len(keys) < limit:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+
+def expected_score(rating, opponent):
+    return 1 / (1 + 10 ** ((opponent - rating) / 400))
+
+
+class Leaderboard:
+    """One game's ratings. The first ``top_size`` places are cached and the
+    cache is dropped only by an update that enters, leaves or moves within them."""
+
+    def __init__(self, ratings=None, initial=1200.0, k_factor=32.0, top_size=100):
+        self.initial = initial
+        self.k_factor = k_factor
+        self.top_size = top_size
+        self.ratings = {}
+        self.ranking = IndexableSkipList()
+        self.top = None
+        self.top_rebuilds = 0
+        for player, rating in (ratings or {}).items():
+            self.set_rating(player, rating)
+
+    def __len__(self):
+        return len(self.ratings)
+
+    def set_rating(self, player, rating):
+        old = self.ratings.get(player)
+        if old is not None:
+            self.ranking.remove((-old, player))
+        self.ratings[player] = rating
+        self.ranking.insert((-rating, player))
+        if self.top is not None and (self.in_top(old, player) or self.in_top(rating, player)):
+            self.top = None
+
+    def in_top(self, rating, player):
+        if rating is None:
+            return False
+        if len(self.top) < self.top_size:
+            return True  # a short list means every player is in it
+        last_player, last_rating = self.top[-1]
+        return (-rating, player) <= (-last_rating, last_player)
+
+    def record(self, first, second, first_score):
+        """Elo update for one match; first_score is 1, 0.5 or 0 from the first player's side."""
+        first_rating = self.ratings.get(first, self.initial)
+        second_rating = self.ratings.get(second, self.initial)
+        change = self.k_factor * (first_score - expected_score(first_rating, second_rating))
+        self.set_rating(first, round(first_rating + change, 2))
+        self.set_rating(second, round(second_rating - change, 2))
+
+    def rank(self, player):
+        """1-based rank, or None for a player without a rating."""
+        rating = self.ratings.get(player)
+        if rating is None:
+            return None
+        return self.ranking.rank((-rating, player)) + 1
+
+    def page(self, offset=0, limit=10):
+        """[(rank, player, rating)] for places offset + 1 .. offset + limit."""
+        if offset + limit <= self.top_size:
+            if self.top is None:
+                self.top = [(player, -negative) for negative, player in self.ranking.slice(0, self.top_size)]
+                self.top_rebuilds += 1
+            entries = self.top[offset:offset + limit]
+        else:
+            entries = [(player, -negative) for negative, player in self.ranking.slice(offset, limit)]
+        return [(offset + number + 1, player, rating) for number, (player, rating) in enumerate(entries)]
+
+
+class Ratings:
+    """Leaderboards for every game, loaded from and saved as {game: {player: rating}}."""
+
+    def __init__(self, initial=1200.0, k_factor=32.0, top_size=100):
+        self.initial = initial
+        self.k_factor = k_factor
+        self.top_size = top_size
+        self.boards = {}
+
+    def board(self, game):
+        board = self.boards.get(game)
+        if board is None:
+            board = self.boards[game] = Leaderboard(None, self.initial, self.k_factor, self.top_size)
+        return board
+
+    def load(self, saved):
+        for game, ratings in saved.items():
+            self.boards[game] = Leaderboard(ratings, self.initial, self.k_factor, self.top_size)
+
+    def record(self, game, first, second, first_score):
+        board = self.board(game)
+        board.record(first, second, first_score)
+        return board
+
+    def ranks(self, player):
+        return {game: {"rank": board.rank(player), "rating": board.ratings[player], "players": len(board)}
+                for game, board in self.boards.items() if player in board.ratings}
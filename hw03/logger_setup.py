@@ -1,20 +1,112 @@
+import atexit
 import logging
+import logging.handlers
+import os
+import queue
 
-def setup_logger(log_file):
-    logger = logging.getLogger("LobbyServer")
+FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# (logger, queue handler, listener) for every logger set up here.
+pipelines = []
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queues records without formatting them; the listener thread does that.
+
+    The stock QueueHandler merges msg and args on the calling thread. Here
+    only a traceback is rendered up front, so callers should log with
+    ``%``-style arguments that will not change afterwards (strings, numbers).
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class DebugSampler(logging.Filter):
+    """Passes at most ``rate`` DEBUG records per second from each call site.
+
+    The first record let through after a drop says how many were skipped.
+    Records above DEBUG always pass.
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+        self.sites = {}  # (pathname, lineno) -> [window start, passed, dropped]
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        site = (record.pathname, record.lineno)
+        window = self.sites.get(site)
+        if window is None or record.created - window[0] >= 1.0:
+            dropped = window[2] if window else 0
+            window = self.sites[site] = [record.created, 0, 0]
+            if dropped:
+                record.msg = f"{record.msg} (略過 {dropped} 筆同位置的 DEBUG 紀錄)"
+        if window[1] >= self.rate:
+            window[2] += 1
+            return False
+        window[1] += 1
+        return True
+
+
+def setup_logger(log_file, name="LobbyServer", console=True, debug_rate=None):
+    """Log to log_file (DEBUG) and the console (INFO) from a background thread.
+
+    The event loop only appends records to a queue; a QueueListener thread
+    formats them and does the file and terminal writes. With debug_rate set,
+    DEBUG records are sampled per call site before they are queued.
+    """
+    logger = logging.getLogger(name)
     logger.setLevel(logging.DEBUG)
-    
+
+    formatter = logging.Formatter(FORMAT)
+    handlers = []
     fh = logging.FileHandler(log_file)
     fh.setLevel(logging.DEBUG)
-    
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.INFO)
-    
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    fh.setFormatter(formatter)
-    ch.setFormatter(formatter)
-    
-    logger.addHandler(fh)
-    logger.addHandler(ch)
-    
+    handlers.append(fh)
+    if console:
+        ch = logging.StreamHandler()
+        ch.setLevel(logging.INFO)
+        handlers.append(ch)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records = queue.SimpleQueue()
+    qh = DeferredQueueHandler(records)
+    if debug_rate is not None:
+        qh.addFilter(DebugSampler(debug_rate))
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    logger.addHandler(qh)
+    pipelines.append((logger, qh, listener))
+
     return logger
+
+
+def stop_logging():
+    """Write out everything still queued and stop the listener threads."""
+    while pipelines:
+        logger, qh, listener = pipelines.pop()
+        listener.stop()
+        logger.removeHandler(qh)
+        for handler in listener.handlers:
+            handler.close()
+
+
+def log_directly_after_fork():
+    # A forked child (a game worker) has the queue but not the listener thread.
+    for logger, qh, listener in pipelines:
+        logger.removeHandler(qh)
+        for handler in listener.handlers:
+            logger.addHandler(handler)
+    pipelines.clear()
+
+
+atexit.register(stop_logging)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=log_directly_after_fork)
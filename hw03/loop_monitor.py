@@ -0,0 +1,98 @@
+"""Event-loop lag monitor with a watchdog thread that captures stalls.
+
+A task on the loop sleeps ``interval`` seconds at a time and records how
+late it wakes up: that is the scheduling lag every other callback sees.
+A watchdog thread checks the same heartbeat; when the loop has not come
+back for longer than ``threshold`` it grabs the loop thread's current
+stack with ``sys._current_frames`` and logs it, so the blocking call
+(a PBKDF2 hash, a large ``json.dumps``, a sync file call) is named while
+it is still running.
+"""
+import asyncio
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+
+QUANTILES = (0.5, 0.9, 0.99)
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+
+class LoopMonitor:
+    def __init__(self, interval=0.05, threshold=0.1, window=1200, logger=None):
+        self.interval = interval
+        self.threshold = threshold
+        self.samples = collections.deque(maxlen=window)  # the last `window` lags, for quantiles
+        self.logger = logger or logging.getLogger("LobbyServer")
+        self.stacks = collections.deque(maxlen=20)  # (unix time, seconds blocked so far, stack text)
+        self.slow_callbacks = 0
+        self.captures = 0
+        self.max_lag = 0.0
+        self.beat = None
+        self.thread_id = None
+        self.task = None
+        self.watchdog = None
+        self.stopped = threading.Event()
+        self.lag_histogram = None
+
+    async def start(self):
+        self.thread_id = threading.get_ident()
+        self.beat = time.perf_counter()
+        self.stopped.clear()
+        self.task = asyncio.create_task(self.tick())
+        self.watchdog = threading.Thread(target=self.watch, name="loop-watchdog", daemon=True)
+        self.watchdog.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def tick(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            self.beat = now
+            lag = max(0.0, now - start - self.interval)
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.threshold:
+                self.slow_callbacks += 1
+            if self.lag_histogram is not None:
+                self.lag_histogram.observe(lag)
+
+    def watch(self):
+        captured_beat = None
+        # Polling at half the threshold catches a stall at most 1.5 thresholds in.
+        while not self.stopped.wait(self.threshold / 2):
+            beat = self.beat
+            blocked = time.perf_counter() - beat - self.interval
+            if blocked <= self.threshold or beat == captured_beat:
+                continue
+            captured_beat = beat  # one capture per stall
+            frame = sys._current_frames().get(self.thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "(loop thread gone)\n"
+            del frame
+            self.captures += 1
+            self.stacks.append((time.time(), blocked, stack))
+            self.logger.warning("事件迴圈已阻塞 %.0f ms，迴圈執行緒目前的堆疊：\n%s", blocked * 1000, stack.rstrip())
+
+    def quantiles(self):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES}
+
+    def register_metrics(self, registry, prefix="lobby_loop"):
+        self.lag_histogram = registry.histogram(f"{prefix}_lag_seconds", "Event-loop scheduling lag", LAG_BUCKETS)
+        registry.gauge(f"{prefix}_lag_quantile_seconds", f"Lag quantiles over the last {self.samples.maxlen} samples",
+                       ("quantile",), callback=lambda: {(str(q),): lag for q, lag in self.quantiles().items()})
+        registry.gauge(f"{prefix}_lag_max_seconds", "Largest lag since start", callback=lambda: self.max_lag)
+        registry.counter(f"{prefix}_slow_callbacks_total", f"Ticks that woke up more than {self.threshold} s late",
+                         callback=lambda: self.slow_callbacks)
+        registry.counter(f"{prefix}_stack_captures_total", "Stalls whose stack the watchdog captured",
+                         callback=lambda: self.captures)
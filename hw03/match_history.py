@@ -0,0 +1,242 @@
+"""Columnar store of finished matches with NumPy stats queries.
+
+Every match is one row across parallel arrays (first player, second
+player, game, outcome, duration, end time); names are interned to small
+integer ids. Rows are appended in memory and each column is appended to
+its own file in the history folder, so loading is one ``np.fromfile`` per
+column. A query compares whole columns once to pick its rows and
+aggregates those with bincount instead of looping over matches.
+"""
+import json
+import logging
+import os
+
+import numpy as np
+
+# The batch_eval result numbering; NO_RESULT when nobody reported an outcome,
+# DISPUTED when the two players' reports disagree.
+NO_RESULT, FIRST_WINS, SECOND_WINS, DRAW, DISPUTED = 0, 1, 2, 3, 4
+OUTCOME_NAMES = ("no_result", "first_wins", "second_wins", "draw", "disputed")
+
+COLUMNS = (
+    ("first", np.int32),      # player id of the host (first to move)
+    ("second", np.int32),     # player id of the other player
+    ("game", np.int16),       # game id
+    ("outcome", np.int8),
+    ("duration", np.float32),  # seconds from START_GAME to the first GAME_OVER
+    ("ended_at", np.float64),  # unix time
+)
+INITIAL_CAPACITY = 1024
+
+
+def outcome_from_reports(first_report, second_report):
+    """Combine the players' own "win" / "loss" / "draw" reports; None means no report."""
+    as_first = {"win": FIRST_WINS, "loss": SECOND_WINS, "draw": DRAW}
+    as_second = {"win": SECOND_WINS, "loss": FIRST_WINS, "draw": DRAW}
+    first = as_first.get(first_report)
+    second = as_second.get(second_report)
+    if first is None or second is None:
+        return first or second or NO_RESULT
+    return first if first == second else DISPUTED
+
+
+def rate(part, whole):
+    return round(float(part) / whole, 4) if whole else 0.0
+
+
+class MatchHistory:
+    def __init__(self, folder=None):
+        self.folder = folder
+        self.players = []
+        self.player_ids = {}
+        self.games = []
+        self.game_ids = {}
+        self.size = 0
+        self.columns = {name: np.empty(INITIAL_CAPACITY, dtype=dtype) for name, dtype in COLUMNS}
+        self.flushed = 0
+        self.names_dirty = False
+
+    def __len__(self):
+        return self.size
+
+    def column(self, name):
+        return self.columns[name][:self.size]
+
+    def intern(self, name, names, ids):
+        key = ids.get(name)
+        if key is None:
+            key = ids[name] = len(names)
+            names.append(name)
+            self.names_dirty = True
+        return key
+
+    def reserve(self, extra):
+        capacity = len(self.columns["first"])
+        if self.size + extra <= capacity:
+            return
+        while capacity < self.size + extra:
+            capacity *= 2
+        for name, array in self.columns.items():
+            grown = np.empty(capacity, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            self.columns[name] = grown
+
+    def append(self, first, second, game, outcome, duration, ended_at):
+        self.reserve(1)
+        row = self.size
+        self.columns["first"][row] = self.intern(first, self.players, self.player_ids)
+        self.columns["second"][row] = self.intern(second, self.players, self.player_ids)
+        self.columns["game"][row] = self.intern(game, self.games, self.game_ids)
+        self.columns["outcome"][row] = outcome
+        self.columns["duration"][row] = duration
+        self.columns["ended_at"][row] = ended_at
+        self.size += 1
+
+    def extend(self, columns):
+        """Append many rows at once; columns maps each column name to an array of ids or values."""
+        count = len(columns["first"])
+        self.reserve(count)
+        for name, array in self.columns.items():
+            array[self.size:self.size + count] = columns[name]
+        self.size += count
+
+    # -- persistence --------------------------------------------------------
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+    def load(self):
+        if self.folder is None or not os.path.exists(self.path("names.json")):
+            return
+        with open(self.path("names.json")) as f:
+            names = json.load(f)
+        self.players = names.get("players", [])
+        self.games = names.get("games", [])
+        self.player_ids = {name: key for key, name in enumerate(self.players)}
+        self.game_ids = {name: key for key, name in enumerate(self.games)}
+        loaded = {}
+        for name, dtype in COLUMNS:
+            file_path = self.path(name + ".bin")
+            loaded[name] = np.fromfile(file_path, dtype=dtype) if os.path.exists(file_path) else np.empty(0, dtype)
+        # A crash in the middle of a flush leaves some columns a row ahead; drop the partial row.
+        rows = min(len(array) for array in loaded.values())
+        for name, dtype in COLUMNS:
+            if len(loaded[name]) != rows:
+                with open(self.path(name + ".bin"), 'r+b') as f:
+                    f.truncate(rows * np.dtype(dtype).itemsize)
+        self.size = 0
+        self.extend({name: array[:rows] for name, array in loaded.items()})
+        self.flushed = self.size
+        self.names_dirty = False
+
+    def flush(self):
+        """Append the rows added since the last flush to the column files."""
+        pending = self.take_pending()
+        if pending is not None:
+            self.write_pending(pending)
+
+    def take_pending(self):
+        """Copy what flush() would write, so the files can be written off the event loop."""
+        if self.folder is None or self.flushed == self.size:
+            return None
+        names = {"players": list(self.players), "games": list(self.games)} if self.names_dirty else None
+        rows = {name: self.columns[name][self.flushed:self.size].copy() for name, _ in COLUMNS}
+        self.flushed = self.size
+        self.names_dirty = False
+        return names, rows
+
+    def write_pending(self, pending):
+        names, rows = pending
+        os.makedirs(self.folder, exist_ok=True)
+        if names is not None:
+            # Names go first so every id in the column files can be resolved.
+            temp_path = self.path("names.json.tmp")
+            with open(temp_path, 'w') as f:
+                json.dump(names, f, ensure_ascii=False)
+            os.replace(temp_path, self.path("names.json"))
+        for name, _ in COLUMNS:
+            with open(self.path(name + ".bin"), 'ab') as f:
+                rows[name].tofile(f)
+
+    # -- queries ------------------------------------------------------------
+
+    def player_stats(self, player):
+        key = self.player_ids.get(player)
+        if key is None:
+            return None
+        # Two comparisons over the full columns; everything after works on the player's rows only.
+        rows = np.flatnonzero((self.column("first") == key) | (self.column("second") == key))
+        first = self.columns["first"][rows] == key
+        outcome = self.columns["outcome"][rows]
+        wins = np.where(first, outcome == FIRST_WINS, outcome == SECOND_WINS)
+        losses = np.where(first, outcome == SECOND_WINS, outcome == FIRST_WINS)
+        draws = outcome == DRAW
+        game = self.columns["game"][rows]
+        per_game = [np.bincount(game, minlength=len(self.games))] + \
+            [np.bincount(game[mask], minlength=len(self.games)) for mask in (wins, losses, draws)]
+        games = {}
+        for game_id in np.flatnonzero(per_game[0]):
+            matches, won, lost, drawn = (int(counts[game_id]) for counts in per_game)
+            games[self.games[game_id]] = {"matches": matches, "wins": won, "losses": lost, "draws": drawn,
+                                          "win_rate": rate(won, won + lost + drawn)}
+        matches, won, lost, drawn = len(rows), int(wins.sum()), int(losses.sum()), int(draws.sum())
+        return {"player": player, "matches": matches, "wins": won, "losses": lost, "draws": drawn,
+                "win_rate": rate(won, won + lost + drawn), "games": games}
+
+    def game_stats(self, game):
+        key = self.game_ids.get(game)
+        if key is None:
+            return None
+        rows = np.flatnonzero(self.column("game") == key)
+        outcome = self.columns["outcome"][rows]
+        counts = np.bincount(outcome, minlength=len(OUTCOME_NAMES))
+        decided = int(counts[FIRST_WINS] + counts[SECOND_WINS] + counts[DRAW])
+        finished = self.columns["duration"][rows][outcome != NO_RESULT]
+        seen = np.zeros(len(self.players), dtype=bool)
+        seen[self.columns["first"][rows]] = True
+        seen[self.columns["second"][rows]] = True
+        stats = {name: int(count) for name, count in zip(OUTCOME_NAMES, counts)}
+        stats.update({
+            "game": game,
+            "matches": len(rows),
+            "first_win_rate": rate(counts[FIRST_WINS], decided),
+            "second_win_rate": rate(counts[SECOND_WINS], decided),
+            "draw_rate": rate(counts[DRAW], decided),
+            "players": int(seen.sum()),
+            "avg_duration": round(float(finished.mean()), 2) if len(finished) else 0.0
+        })
+        return stats
+
+    def history(self, player, limit=10):
+        """The player's last ``limit`` matches, newest first, from their point of view."""
+        key = self.player_ids.get(player)
+        if key is None:
+            return None
+        rows = np.flatnonzero((self.column("first") == key) | (self.column("second") == key))[-limit:][::-1]
+        results = []
+        for row in rows.tolist():
+            first = self.columns["first"][row] == key
+            opponent = self.columns["second" if first else "first"][row]
+            outcome = int(self.columns["outcome"][row])
+            if outcome in (FIRST_WINS, SECOND_WINS):
+                result = "win" if (outcome == FIRST_WINS) == first else "loss"
+            else:
+                result = OUTCOME_NAMES[outcome]
+            results.append({
+                "opponent": self.players[opponent],
+                "game": self.games[self.columns["game"][row]],
+                "role": "host" if first else "client",
+                "result": result,
+                "duration": round(float(self.columns["duration"][row]), 1),
+                "ended_at": float(self.columns["ended_at"][row])
+            })
+        return results
+
+
+def open_history(folder):
+    history = MatchHistory(folder)
+    try:
+        history.load()
+    except (OSError, ValueError) as e:
+        logging.getLogger("LobbyServer").error(f"讀取對戰紀錄失敗：{e}")
+    return history
@@ -0,0 +1,105 @@
+import statistics
+import time
+from collections import OrderedDict, deque
+
+
+class Matchmaker:
+    """Per-game FIFO matchmaking queues with optional rating bands.
+
+    With ``rating_band`` set to None any two queued players match. Otherwise a
+    waiting player accepts opponents within ``rating_band`` points, widened by
+    ``band_growth`` points for every second already spent in the queue.
+    """
+
+    def __init__(self, rating_band=None, band_growth=0.0, history=1000):
+        self.rating_band = rating_band
+        self.band_growth = band_growth
+        self.queues = {}  # game_name -> OrderedDict(username -> entry)
+        self.queued_game = {}  # username -> game_name
+        self.wait_times = {}  # game_name -> deque of recent time-to-match
+        self.history = history
+        self.total_matched = 0
+
+    def _compatible(self, waiting, entry, now):
+        if self.rating_band is None:
+            return True
+        band = self.rating_band + self.band_growth * (now - waiting["queued_at"])
+        return abs(waiting["rating"] - entry["rating"]) <= band
+
+    def enqueue(self, game_name, username, rating=0):
+        """Queue a player; return the (earlier, later) pair if a match was made."""
+        if username in self.queued_game:
+            return None
+        now = time.monotonic()
+        entry = {"username": username, "rating": rating, "queued_at": now}
+        queue = self.queues.setdefault(game_name, OrderedDict())
+        for waiting in queue.values():
+            if self._compatible(waiting, entry, now):
+                del queue[waiting["username"]]
+                del self.queued_game[waiting["username"]]
+                waits = self.wait_times.setdefault(game_name, deque(maxlen=self.history))
+                # Only the player who waited; the arriving one was matched on arrival.
+                waits.append(now - waiting["queued_at"])
+                self.total_matched += 1
+                return waiting["username"], username
+        queue[username] = entry
+        self.queued_game[username] = game_name
+        return None
+
+    def rematch(self):
+        """Pair players whose bands have widened enough since they queued.
+
+        enqueue only compares an arriving player against the queue, so two
+        waiting players are checked again here. Returns (game_name, earlier,
+        later) for each pair made, oldest waiter first.
+        """
+        now = time.monotonic()
+        pairs = []
+        for game_name, queue in self.queues.items():
+            waiting = list(queue.values())
+            matched = set()
+            for i, earlier in enumerate(waiting):
+                if earlier["username"] in matched:
+                    continue
+                for later in waiting[i + 1:]:
+                    if later["username"] in matched or not self._compatible(earlier, later, now):
+                        continue
+                    matched.update((earlier["username"], later["username"]))
+                    waits = self.wait_times.setdefault(game_name, deque(maxlen=self.history))
+                    waits.extend((now - earlier["queued_at"], now - later["queued_at"]))
+                    self.total_matched += 1
+                    pairs.append((game_name, earlier["username"], later["username"]))
+                    break
+            for username in matched:
+                del queue[username]
+                del self.queued_game[username]
+        return pairs
+
+    def remove(self, username):
+        game_name = self.queued_game.pop(username, None)
+        if game_name is None:
+            return None
+        del self.queues[game_name][username]
+        return game_name
+
+    def position(self, username):
+        game_name = self.queued_game.get(username)
+        if game_name is None:
+            return None
+        return list(self.queues[game_name]).index(username) + 1
+
+    def stats(self):
+        games = set(self.queues) | set(self.wait_times)
+        return {
+            "total_matched": self.total_matched,
+            "games": {
+                game_name: {
+                    "queue_depth": len(self.queues.get(game_name, ())),
+                    "median_time_to_match": (
+                        statistics.median(self.wait_times[game_name])
+                        if self.wait_times.get(game_name) else None
+                    )
+                }
+                for game_name in sorted(games)
+            }
+        }
@@ -0,0 +1,101 @@
+"""Merge game-start trace files into a per-phase latency breakdown.
+
+Usage: python merge_traces.py [--each] trace.jsonl games-*/trace.jsonl ...
+
+Spans from the server, both clients and their games are grouped by
+trace_id. Every span is placed at its offset from the first span of its
+trace; the summary gives the median and p95 offset and duration of each
+phase over all traces, in the order the phases usually happen.
+"""
+import json
+import statistics
+import sys
+from collections import defaultdict
+
+
+def load_spans(paths):
+    traces = defaultdict(list)
+    for path in paths:
+        with open(path) as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    span = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"{path}:{line_number}: 略過無效的紀錄", file=sys.stderr)
+                    continue
+                traces[span["trace_id"]].append(span)
+    for spans in traces.values():
+        spans.sort(key=lambda span: span["start"])
+    return traces
+
+
+def phase_name(span):
+    role = span.get("role")
+    return f"{span['name']} ({role})" if role else span["name"]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def breakdown(traces):
+    offsets = defaultdict(list)
+    durations = defaultdict(list)
+    for spans in traces.values():
+        origin = spans[0]["start"]
+        for span in spans:
+            name = phase_name(span)
+            offsets[name].append((span["start"] - origin) * 1000)
+            durations[name].append(span["duration"] * 1000)
+    rows = []
+    for name in offsets:
+        rows.append({
+            "phase": name,
+            "count": len(offsets[name]),
+            "offset_p50": statistics.median(offsets[name]),
+            "offset_p95": percentile(offsets[name], 0.95),
+            "duration_p50": statistics.median(durations[name]),
+            "duration_p95": percentile(durations[name], 0.95)
+        })
+    rows.sort(key=lambda row: row["offset_p50"])
+    return rows
+
+
+def print_trace(trace_id, spans):
+    origin = spans[0]["start"]
+    print(f"\n追蹤 {trace_id}")
+    for span in spans:
+        offset = (span["start"] - origin) * 1000
+        print(f"  +{offset:9.1f} ms  {span['duration'] * 1000:9.1f} ms  {span['process']:<18} {phase_name(span)}")
+
+
+def print_breakdown(rows, trace_count):
+    print(f"\n{trace_count} 筆追蹤的各階段延遲 (ms)")
+    print(f"{'phase':<38}{'n':>6}{'start p50':>12}{'start p95':>12}{'dur p50':>12}{'dur p95':>12}")
+    for row in rows:
+        print(f"{row['phase']:<38}{row['count']:>6}{row['offset_p50']:>12.1f}{row['offset_p95']:>12.1f}"
+              f"{row['duration_p50']:>12.1f}{row['duration_p95']:>12.1f}")
+
+
+def main(argv):
+    show_each = "--each" in argv
+    paths = [arg for arg in argv if arg != "--each"]
+    if not paths:
+        print(__doc__)
+        return 1
+    traces = load_spans(paths)
+    if not traces:
+        print("沒有追蹤資料。")
+        return 1
+    if show_each:
+        for trace_id, spans in sorted(traces.items(), key=lambda item: item[1][0]["start"]):
+            print_trace(trace_id, spans)
+    print_breakdown(breakdown(traces), len(traces))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
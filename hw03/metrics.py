@@ -0,0 +1,240 @@
+"""Counters, gauges and histograms served in the Prometheus text format.
+
+Metrics are plain objects updated in place from the event loop, so an
+update is a dict lookup and an addition. Values that already live in the
+server's own structures (users online, rooms, write buffers) are read by a
+callback when the endpoint is scraped instead of being tracked on every
+change. ``MetricsServer`` answers ``GET /metrics`` on its own port from the
+same event loop; scrape it with Prometheus or ``curl``.
+"""
+import asyncio
+import bisect
+import logging
+import math
+import time
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        return Timer(self)
+
+
+class Timer:
+    """``with histogram.time():`` observes the seconds spent in the block."""
+
+    def __init__(self, target):
+        self.target = target
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.target.observe(time.perf_counter() - self.start)
+
+
+class Metric:
+    """Base for all metrics. With ``callback`` the value is computed at
+    scrape time: a number, or {label values tuple: number} with labels."""
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labels=(), callback=None):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.callback = callback
+        self.children = {}
+        if not self.label_names:
+            self.children[()] = self.new_value()
+
+    def new_value(self):
+        return Value()
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} takes labels {self.label_names}")
+            values = tuple(str(value) for value in values)
+            child = self.children.get(values)
+            if child is None:
+                child = self.children[values] = self.new_value()
+        return child
+
+    # Shortcuts for metrics without labels.
+    def inc(self, amount=1):
+        self.children[()].inc(amount)
+
+    def dec(self, amount=1):
+        self.children[()].dec(amount)
+
+    def set(self, value):
+        self.children[()].set(value)
+
+    def samples(self):
+        if self.callback is not None:
+            result = self.callback()
+            if not self.label_names:
+                yield self.name, "", result
+                return
+            for values, value in result.items():
+                yield self.name, format_labels(self.label_names, values), value
+            return
+        for values, child in self.children.items():
+            yield self.name, format_labels(self.label_names, values), child.value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name}{labels} {format_value(value)}" for name, labels, value in self.samples())
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets, labels=()):
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        super().__init__(name, help_text, labels)
+
+    def new_value(self):
+        return HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.children[()].observe(value)
+
+    def time(self):
+        return self.children[()].time()
+
+    def samples(self):
+        for values, child in self.children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, child.counts):
+                cumulative += count
+                labels = format_labels(self.label_names, values, [("le", format_value(bound))])
+                yield self.name + "_bucket", labels, cumulative
+            labels = format_labels(self.label_names, values)
+            yield self.name + "_sum", labels, child.sum
+            yield self.name + "_count", labels, child.count
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labels=(), callback=None):
+        return self.register(Counter(name, help_text, labels, callback))
+
+    def gauge(self, name, help_text, labels=(), callback=None):
+        return self.register(Gauge(name, help_text, labels, callback))
+
+    def histogram(self, name, help_text, buckets, labels=()):
+        return self.register(Histogram(name, help_text, buckets, labels))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # One broken callback should not take the whole scrape down.
+                logging.getLogger("LobbyServer").error(f"Metric {metric.name} failed: {e}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Minimal HTTP/1.0 server answering ``GET /metrics``."""
+
+    def __init__(self, registry, timeout=5):
+        self.registry = registry
+        self.timeout = timeout
+        self.scrapes = 0
+        self.server = None
+
+    async def start(self, host, port):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    async def handle(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.timeout)
+            method, path, *_ = head.decode('latin-1').split('\r\n', 1)[0].split(' ')
+            if method != "GET":
+                await self.respond(writer, "405 Method Not Allowed", "Only GET is supported\n")
+            elif path.split('?', 1)[0] != "/metrics":
+                await self.respond(writer, "404 Not Found", "Try /metrics\n")
+            else:
+                self.scrapes += 1
+                await self.respond(writer, "200 OK", self.registry.render(), CONTENT_TYPE)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ValueError,
+                ConnectionError):
+            pass  # a half-sent or malformed request gets no answer
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, body, content_type="text/plain; charset=utf-8"):
+        body = body.encode()
+        writer.write(f"HTTP/1.0 {status}\r\nContent-Type: {content_type}\r\n"
+                     f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        await writer.drain()
@@ -0,0 +1,92 @@
+import random
+import time
+
+
+class PortAllocator:
+    """Lease P2P ports per host IP so concurrent games never share a port."""
+
+    def __init__(self, port_range, lease_ttl):
+        self.low, self.high = port_range
+        self.lease_ttl = lease_ttl
+        # host_ip -> {port: {"owner", "room_id", "expires", "reported"}}
+        self.leases = {}
+        self.total_leased = 0
+        self.total_expired = 0
+        self.total_exhausted = 0
+
+    @property
+    def pool_size(self):
+        return self.high - self.low + 1
+
+    def acquire(self, host_ip, owner, room_id=None):
+        self.expire()
+        in_use = self.leases.setdefault(host_ip, {})
+        # A new game replaces the owner's earlier leases on this host, as in adopt.
+        for p in [p for p, l in in_use.items() if l["owner"] == owner]:
+            del in_use[p]
+        in_range = sum(1 for port in in_use if self.low <= port <= self.high)
+        if in_range >= self.pool_size:
+            self.total_exhausted += 1
+            return None
+        # Start from a random port like before, then probe for a free one.
+        port = random.randint(self.low, self.high)
+        while port in in_use:
+            port = self.low if port == self.high else port + 1
+        self._lease(host_ip, port, owner, room_id, reported=False)
+        return port
+
+    def adopt(self, host_ip, port, owner, room_id=None):
+        """Record a port the client bound itself (e.g. an OS-chosen port)."""
+        in_use = self.leases.setdefault(host_ip, {})
+        lease = in_use.get(port)
+        if lease is not None and lease["owner"] != owner:
+            return False
+        # The reported port replaces whatever the owner was handed out before.
+        for p in [p for p, l in in_use.items() if l["owner"] == owner and p != port]:
+            del in_use[p]
+        self._lease(host_ip, port, owner, room_id, reported=True)
+        return True
+
+    def _lease(self, host_ip, port, owner, room_id, reported):
+        self.leases[host_ip][port] = {
+            "owner": owner,
+            "room_id": room_id,
+            "expires": time.monotonic() + self.lease_ttl,
+            "reported": reported
+        }
+        self.total_leased += 1
+
+    def release(self, owner):
+        released = []
+        for host_ip, in_use in list(self.leases.items()):
+            for port in [p for p, l in in_use.items() if l["owner"] == owner]:
+                del in_use[port]
+                released.append((host_ip, port))
+            if not in_use:
+                del self.leases[host_ip]
+        return released
+
+    def expire(self):
+        now = time.monotonic()
+        expired = 0
+        for host_ip, in_use in list(self.leases.items()):
+            for port in [p for p, l in in_use.items() if l["expires"] <= now]:
+                del in_use[port]
+                expired += 1
+            if not in_use:
+                del self.leases[host_ip]
+        self.total_expired += expired
+        return expired
+
+    def stats(self):
+        hosts = {host_ip: len(in_use) for host_ip, in_use in self.leases.items()}
+        busiest = max(hosts.values(), default=0)
+        return {
+            "pool_size": self.pool_size,
+            "leased": sum(hosts.values()),
+            "hosts": hosts,
+            "utilization": busiest / self.pool_size,
+            "total_leased": self.total_leased,
+            "total_expired": self.total_expired,
+            "total_exhausted": self.total_exhausted
+        }
@@ -0,0 +1,203 @@
+"""On-demand sampling profiler for the running lobby server.
+
+The server listens on an admin Unix socket (config.ADMIN_SOCKET, mode 0600,
+so only the account running the server can use it). A ``PROFILE`` request
+starts a thread that samples the event-loop thread's stack every
+``interval`` seconds for the requested time and answers with collapsed
+stacks (``frame;frame;frame count`` per line), the input format of
+flamegraph.pl and speedscope. With ``memory`` it also diffs two tracemalloc
+snapshots taken at the start and end of the window; tracing every
+allocation slows allocation-heavy code several times over, so keep those
+windows short. Tracing stops again when the window ends.
+
+Usage: python profiler.py [seconds] [--memory] [-o out.folded]   (default 10 s)
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+import config
+
+MEMORY_TOP = 25
+TRACEMALLOC_FRAMES = 1  # growth is grouped by the allocating line only
+
+
+class SamplingProfiler:
+    """Counts the stacks seen on one thread, sampled from a background thread."""
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = {}
+        self.samples = 0
+        self.labels = {}  # code object -> frame label
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def label(self, code):
+        label = self.labels.get(code)
+        if label is None:
+            label = self.labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="sampling-profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                stack.append(self.label(frame.f_code))
+                frame = frame.f_back
+            key = ";".join(reversed(stack))
+            self.counts[key] = self.counts.get(key, 0) + 1
+            self.samples += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.counts.items()))
+
+
+def memory_growth(before, after, top=MEMORY_TOP):
+    # Leave out the profiler's own bookkeeping.
+    ignore = [tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, tracemalloc.__file__)]
+    before, after = before.filter_traces(ignore), after.filter_traces(ignore)
+    lines = []
+    for stat in after.compare_to(before, 'lineno')[:top]:
+        frame = stat.traceback[0]
+        lines.append(f"{frame.filename}:{frame.lineno}: {stat.size_diff / 1024:+.1f} KiB "
+                     f"({stat.count_diff:+d} blocks), now {stat.size / 1024:.1f} KiB")
+    return lines
+
+
+async def profile(seconds, memory=False, interval=0.005):
+    """Sample the calling event loop's thread for ``seconds``; the loop keeps running meanwhile."""
+    profiler = SamplingProfiler(threading.get_ident(), interval)
+    started_tracing = memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    before = tracemalloc.take_snapshot() if memory else None
+    start = time.perf_counter()
+    profiler.start()
+    try:
+        await asyncio.sleep(seconds)
+        profiler.stop()
+        result = {
+            "seconds": round(time.perf_counter() - start, 3),
+            "samples": profiler.samples,
+            "collapsed": profiler.collapsed()
+        }
+        if memory:
+            result["memory"] = memory_growth(before, tracemalloc.take_snapshot())
+        return result
+    finally:
+        profiler.stop()
+        if started_tracing:
+            tracemalloc.stop()
+
+
+class AdminServer:
+    """Line-based admin requests on a Unix socket: ``PROFILE <seconds> [memory]``."""
+
+    def __init__(self, max_seconds=120, interval=0.005):
+        self.max_seconds = max_seconds
+        self.interval = interval
+        self.lock = asyncio.Lock()
+        self.server = None
+        self.path = None
+
+    async def start(self, path):
+        if os.path.exists(path):
+            os.unlink(path)  # left behind by a server that did not shut down cleanly
+        old_umask = os.umask(0o177)
+        try:
+            self.server = await asyncio.start_unix_server(self.handle, path)
+        finally:
+            os.umask(old_umask)
+        self.path = path
+        return self.server
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+        if self.path and os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def handle(self, reader, writer):
+        try:
+            parts = (await reader.readline()).decode().split()
+            response = await self.dispatch(parts)
+            writer.write((json.dumps(response) + '\n').encode())
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, parts):
+        if not parts or parts[0].upper() != "PROFILE":
+            return {"status": "error", "message": "Usage: PROFILE <seconds> [memory]"}
+        try:
+            seconds = float(parts[1]) if len(parts) > 1 else 10.0
+        except ValueError:
+            return {"status": "error", "message": "Invalid PROFILE duration"}
+        if not 0 < seconds <= self.max_seconds:
+            return {"status": "error", "message": f"PROFILE duration must be in (0, {self.max_seconds}]"}
+        if self.lock.locked():
+            return {"status": "error", "message": "A profile is already running"}
+        async with self.lock:
+            result = await profile(seconds, "memory" in (part.lower() for part in parts[2:]), self.interval)
+        return {"status": "success", "message": "PROFILE_DONE", **result}
+
+
+async def request_profile(path, seconds, memory):
+    reader, writer = await asyncio.open_unix_connection(path, limit=2 ** 26)
+    writer.write(f"PROFILE {seconds}{' memory' if memory else ''}\n".encode())
+    await writer.drain()
+    line = await reader.readline()
+    writer.close()
+    return json.loads(line)
+
+
+def main(args):
+    memory = "--memory" in args
+    output = None
+    if "-o" in args:
+        output = args[args.index("-o") + 1]
+        args = args[:args.index("-o")] + args[args.index("-o") + 2:]
+    numbers = [arg for arg in args if not arg.startswith("-")]
+    seconds = float(numbers[0]) if numbers else 10.0
+    try:
+        result = asyncio.run(request_profile(config.ADMIN_SOCKET, seconds, memory))
+    except (OSError, ValueError) as e:
+        print(f"無法連線到管理介面 {config.ADMIN_SOCKET}：{e}")
+        return 1
+    if result.get("status") != "success":
+        print(f"錯誤：{result.get('message')}")
+        return 1
+    if output:
+        with open(output, 'w') as f:
+            f.write(result["collapsed"])
+        print(f"已取樣 {result['samples']} 次（{result['seconds']} 秒），折疊堆疊已寫入 {output}")
+    else:
+        sys.stdout.write(result["collapsed"])
+    for line in result.get("memory", []):
+        print(line, file=sys.stderr if not output else sys.stdout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+
+MAX_HANDSHAKE = 256
+
+
+class RelayProtocol(asyncio.Protocol):
+    """One side of a relayed game connection.
+
+    The first line a peer sends is ``RELAY <token>``. Once the second peer
+    with the same token arrives both sides get ``PAIRED`` and every chunk
+    received afterwards is handed straight to the other transport.
+    """
+
+    def __init__(self, relay):
+        self.relay = relay
+        self.transport = None
+        self.peer = None
+        self.token = None
+        self.buffer = bytearray()
+        self.timeout_handle = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        loop = asyncio.get_running_loop()
+        self.timeout_handle = loop.call_later(self.relay.pair_timeout, self.transport.close)
+
+    def data_received(self, data):
+        if self.peer is not None:
+            self.peer.transport.write(data)
+            self.relay.bytes_relayed += len(data)
+            return
+        self.buffer += data
+        if self.token is not None:
+            return
+        if b'\n' not in self.buffer:
+            if len(self.buffer) > MAX_HANDSHAKE:
+                self.transport.close()
+            return
+        line, _, rest = bytes(self.buffer).partition(b'\n')
+        self.buffer = bytearray(rest)
+        parts = line.decode(errors='replace').split()
+        if len(parts) != 2 or parts[0] != "RELAY":
+            self.transport.write(b"ERROR\n")
+            self.transport.close()
+            return
+        self.token = parts[1]
+        self.relay.register(self)
+
+    def pair(self, peer):
+        self.peer = peer
+        if self.timeout_handle is not None:
+            self.timeout_handle.cancel()
+            self.timeout_handle = None
+        self.transport.write(b"PAIRED\n")
+
+    def flush(self):
+        # Anything the peer sent before pairing completed.
+        if self.buffer:
+            self.peer.transport.write(bytes(self.buffer))
+            self.relay.bytes_relayed += len(self.buffer)
+            self.buffer.clear()
+
+    def pause_writing(self):
+        if self.peer is not None:
+            self.peer.transport.pause_reading()
+
+    def resume_writing(self):
+        if self.peer is not None:
+            self.peer.transport.resume_reading()
+
+    def connection_lost(self, exc):
+        if self.timeout_handle is not None:
+            self.timeout_handle.cancel()
+        self.relay.unregister(self)
+        if self.peer is not None:
+            self.peer.transport.close()
+
+
+class RelayServer:
+    def __init__(self, pair_timeout=60):
+        self.pair_timeout = pair_timeout
+        self.waiting = {}  # token -> RelayProtocol
+        self.active_pairs = 0
+        self.total_pairs = 0
+        self.bytes_relayed = 0
+        self.server = None
+
+    async def start(self, host, port):
+        loop = asyncio.get_running_loop()
+        self.server = await loop.create_server(lambda: RelayProtocol(self), host, port)
+        return self.server
+
+    def register(self, protocol):
+        waiting = self.waiting.pop(protocol.token, None)
+        if waiting is None:
+            self.waiting[protocol.token] = protocol
+            return
+        waiting.pair(protocol)
+        protocol.pair(waiting)
+        waiting.flush()
+        protocol.flush()
+        self.active_pairs += 1
+        self.total_pairs += 1
+        logging.getLogger("LobbyServer").info(f"Relay paired session {protocol.token}")
+
+    def unregister(self, protocol):
+        if self.waiting.get(protocol.token) is protocol:
+            del self.waiting[protocol.token]
+        elif protocol.peer is not None and protocol.peer.peer is protocol:
+            # Only the first side to go away ends the pair.
+            protocol.peer.peer = None
+            self.active_pairs -= 1
+
+    def stats(self):
+        return {
+            "waiting": len(self.waiting),
+            "active_pairs": self.active_pairs,
+            "total_pairs": self.total_pairs,
+            "bytes_relayed": self.bytes_relayed
+        }
+
+
+async def open_relay_connection(host, port, token, timeout=30):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"RELAY {token}\n".encode())
+    await writer.drain()
+    line = await asyncio.wait_for(reader.readline(), timeout)
+    if line.strip() != b"PAIRED":
+        writer.close()
+        raise ConnectionError(f"Relay refused session: {line!r}")
+    return reader, writer
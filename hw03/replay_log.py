@@ -0,0 +1,194 @@
+"""Append-only binary replay log for game moves.
+
+A log is two files: ``<path>.rec`` holds one fixed-size record per move and
+``<path>.idx`` one fixed-size entry per match pointing at its first record.
+Both are only ever appended to, and a reader maps them with mmap, so any
+match is a slice at ``offset * RECORD.size`` without parsing the rest.
+
+Usage: python replay_log.py <path> [match_id]   (lists matches, or prints one)
+"""
+import mmap
+import struct
+import sys
+import time
+
+# elapsed ms since the match started, seq, side, payload kind, 8-byte payload
+RECORD = struct.Struct("<IHBB8s")
+RECORD_INT = struct.Struct("<IHBBq")
+# match id, game, player, role, started_at (unix time), first record, record count
+INDEX = struct.Struct("<16s8s16sB3xdQI")
+
+SENT, RECEIVED = 0, 1
+KIND_INT, KIND_TEXT = 0, 1
+ROLES = {"host": 0, "client": 1}
+ROLE_NAMES = {code: role for role, code in ROLES.items()}
+UNKNOWN_ROLE = 255
+CHUNK_SIZE = 64 * 1024
+
+
+def fixed(text, size):
+    return (text or "").encode()[:size]
+
+
+def unfixed(data):
+    return data.rstrip(b'\0').decode(errors='replace')
+
+
+class ReplayRecorder:
+    """Collects one player's view of a match in memory.
+
+    ``record`` only appends a tuple, so a move costs a few hundred
+    nanoseconds; packing and the disk write happen once, in ``append``,
+    after the game is over.
+    """
+
+    def __init__(self, match_id, game, role):
+        self.match_id = match_id
+        self.game = game
+        self.role = role
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.moves = []
+
+    @property
+    def count(self):
+        return len(self.moves)
+
+    def record(self, side, seq, move):
+        self.moves.append((time.perf_counter(), seq, side, move))
+
+    def pack(self):
+        data = bytearray()
+        for at, seq, side, move in self.moves:
+            elapsed = int((at - self.started) * 1000) & 0xFFFFFFFF
+            seq = (seq or 0) & 0xFFFF
+            if type(move) is int and -2 ** 63 <= move < 2 ** 63:
+                data += RECORD_INT.pack(elapsed, seq, side, KIND_INT, move)
+            else:
+                # Text moves (rps) keep their first 8 bytes; anything else is stored as its str().
+                data += RECORD.pack(elapsed, seq, side, KIND_TEXT, fixed(str(move), 8))
+        return data
+
+
+def pack_entry(match_id, game, player, role, started_at, offset, count):
+    return INDEX.pack(fixed(match_id, 16), fixed(game, 8), fixed(player, 16),
+                      ROLES.get(role, UNKNOWN_ROLE), started_at, offset, count)
+
+
+def append(path, recorder, player=""):
+    """Write a finished match; returns its entry number in the index."""
+    with open(path + '.rec', 'ab') as f:
+        offset = f.tell() // RECORD.size
+        f.write(recorder.pack())
+    # Records go first, so a crash in between leaves unreferenced records, never a dangling entry.
+    with open(path + '.idx', 'ab') as f:
+        number = f.tell() // INDEX.size
+        f.write(pack_entry(recorder.match_id, recorder.game, player, recorder.role,
+                           recorder.started_at, offset, recorder.count))
+    return number
+
+
+def map_file(path):
+    try:
+        with open(path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):
+        # Missing or empty: mmap cannot map zero bytes.
+        return b''
+
+
+def decode_record(elapsed, seq, side, kind, payload):
+    if kind == KIND_INT:
+        move = int.from_bytes(payload, 'little', signed=True)
+    else:
+        move = unfixed(payload)
+    return {"elapsed_ms": elapsed, "seq": seq, "side": side, "move": move}
+
+
+class ReplayReader:
+    """Memory-mapped view of a replay log as it was when opened."""
+
+    def __init__(self, path):
+        self.path = path
+        self.records = map_file(path + '.rec')
+        self.index = map_file(path + '.idx')
+        self.by_match = None
+
+    def __len__(self):
+        return len(self.index) // INDEX.size
+
+    def entry(self, number):
+        if not 0 <= number < len(self):
+            raise IndexError(number)
+        match_id, game, player, role, started_at, offset, count = \
+            INDEX.unpack_from(self.index, number * INDEX.size)
+        return {
+            "number": number,
+            "match_id": unfixed(match_id),
+            "game": unfixed(game),
+            "player": unfixed(player),
+            "role": ROLE_NAMES.get(role),
+            "started_at": started_at,
+            "offset": offset,
+            "count": count
+        }
+
+    def entries(self):
+        return [self.entry(number) for number in range(len(self))]
+
+    def find(self, match_id):
+        """Entry numbers recorded for match_id, one per player that saved or uploaded it."""
+        if self.by_match is None:
+            self.by_match = {}
+            for number, fields in enumerate(INDEX.iter_unpack(self.index[:len(self) * INDEX.size])):
+                self.by_match.setdefault(unfixed(fields[0]), []).append(number)
+        return self.by_match.get(match_id, [])
+
+    def raw(self, number):
+        """The match's records as bytes, exactly as stored."""
+        entry = self.entry(number)
+        start = entry["offset"] * RECORD.size
+        end = min(start + entry["count"] * RECORD.size, len(self.records) // RECORD.size * RECORD.size)
+        return self.records[start:max(start, end)]
+
+    def moves(self, number):
+        return [decode_record(*fields) for fields in RECORD.iter_unpack(self.raw(number))]
+
+    def close(self):
+        for mapped in (self.records, self.index):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(args):
+    if not args:
+        print(__doc__)
+        return 1
+    with ReplayReader(args[0]) as reader:
+        if len(args) == 1:
+            for entry in reader.entries():
+                started = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry["started_at"]))
+                print(f"{entry['number']:6}  {entry['match_id']:16}  {entry['game']:8}  {entry['player'] or '-':16}"
+                      f"  {entry['role'] or '-':6}  {started}  {entry['count']} 步")
+            return 0
+        numbers = reader.find(args[1])
+        if not numbers:
+            print(f"找不到對局 {args[1]}")
+            return 1
+        for number in numbers:
+            entry = reader.entry(number)
+            print(f"\n{entry['player'] or '本機'}（{entry['role']}）的紀錄，{entry['game']}：")
+            for move in reader.moves(number):
+                side = "送出" if move["side"] == SENT else "收到"
+                print(f"  {move['elapsed_ms']:8} ms  #{move['seq']:<4} {side}  {move['move']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,10 +1,25 @@
 import asyncio
+import concurrent.futures
 import json
+import time
 import uuid
 import config
 from logger_setup import setup_logger
 from auth import hash_password, verify_password
-import random
+from port_allocator import PortAllocator
+from matchmaking import Matchmaker
+from relay import RelayServer
+from session_server import SessionServer, RULES as SESSION_RULES
+from client_state import StateStore
+from leaderboard import Ratings
+from loop_monitor import LoopMonitor
+from profiler import AdminServer
+from session_resume import LobbyJournal, TokenSigner
+from timer_wheel import TimerWheel
+import match_history
+import metrics
+import replay_log
+import tracing
 import json
 import os
 import aiofiles
@@ -15,7 +30,7 @@ GAMES_FILE = 'games.json'
 games = {}
 games_lock = asyncio.Lock()
 
-logger = setup_logger(config.LOG_FILE)
+logger = setup_logger(config.LOG_FILE, debug_rate=config.LOG_DEBUG_RATE)
 
 users = {}
 users_lock = asyncio.Lock()
@@ -23,6 +38,81 @@ online_users = {}
 online_users_lock = asyncio.Lock()
 game_rooms = {}
 game_rooms_lock = asyncio.Lock()
+port_allocator = PortAllocator(config.P2P_PORT_RANGE, config.P2P_LEASE_TTL)
+matchmaker = Matchmaker(config.MATCHMAKING_RATING_BAND, config.MATCHMAKING_BAND_GROWTH)
+relay_server = RelayServer()
+session_server = SessionServer()
+tracer = tracing.Tracer("server", config.TRACE_FILE, config.TRACE_ENABLED)
+trace_write_lock = asyncio.Lock()
+trace_flush_task = None
+replay_lock = asyncio.Lock()
+history = match_history.MatchHistory(config.HISTORY_DIR)
+history_write_lock = asyncio.Lock()
+history_flush_task = None
+ratings = Ratings(config.ELO_INITIAL, config.ELO_K, config.LEADERBOARD_TOP)
+ratings_store = StateStore({}, config.RATINGS_FLUSH_DELAY)
+ELO_SCORES = {match_history.FIRST_WINS: 1.0, match_history.SECOND_WINS: 0.0, match_history.DRAW: 0.5}
+# PBKDF2 releases the GIL, so password hashes run on threads instead of blocking the loop.
+hash_executor = concurrent.futures.ThreadPoolExecutor(config.PBKDF2_THREADS, thread_name_prefix="pbkdf2")
+connections = set()  # writers of every open lobby connection, logged in or not
+token_signer = TokenSigner(ttl=config.RESUME_TOKEN_TTL)
+sessions = {}  # username -> id of the login its resume tokens belong to
+suspended = {}  # username -> {"status", "room_id", "until"} for dropped connections that may RESUME
+lobby_journal = LobbyJournal(config.LOBBY_JOURNAL_SIZE)
+expiry_wheel = TimerWheel(config.EXPIRY_TICK, config.EXPIRY_SLOTS, logger)
+
+registry = metrics.Registry()
+bytes_received = registry.counter("lobby_bytes_received_total", "Bytes read from lobby clients")
+bytes_sent = registry.counter("lobby_bytes_sent_total", "Bytes written to lobby clients")
+broadcast_fanout = registry.histogram("lobby_broadcast_fanout", "Recipients of each broadcast",
+                                      (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000))
+pbkdf2_queue = registry.gauge("lobby_pbkdf2_queue_depth", "Password hashes queued or running on the hash threads")
+file_transfer_bytes = registry.counter("lobby_file_transfer_bytes_total",
+                                       "Game and replay file bytes transferred", ("direction", "kind"))
+file_transfer_seconds = registry.counter("lobby_file_transfer_seconds_total",
+                                         "Seconds spent transferring game and replay files", ("direction", "kind"))
+save_seconds = registry.histogram("lobby_save_seconds", "Time to write a state file",
+                                  (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1), ("file",))
+
+
+def count_by(items, *keys):
+    counts = {}
+    for item in items:
+        key = tuple(item[name] for name in keys)
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+def write_buffer_sizes():
+    return [writer.transport.get_write_buffer_size() for writer in connections if not writer.transport.is_closing()]
+
+registry.gauge("lobby_connected_clients", "Open lobby connections", callback=lambda: len(connections))
+registry.gauge("lobby_online_users", "Logged-in users by status", ("status",),
+               callback=lambda: count_by(online_users.values(), "status"))
+registry.gauge("lobby_rooms", "Game rooms by status and type", ("status", "type"),
+               callback=lambda: count_by(game_rooms.values(), "status", "type"))
+registry.gauge("lobby_outbound_buffer_bytes", "Bytes waiting in lobby connection write buffers",
+               callback=lambda: sum(write_buffer_sizes()))
+registry.gauge("lobby_outbound_buffer_max_bytes", "Largest single lobby connection write buffer",
+               callback=lambda: max(write_buffer_sizes(), default=0))
+registry.gauge("lobby_matchmaking_queue_depth", "Players waiting in matchmaking by game", ("game",),
+               callback=lambda: {(game,): len(queue) for game, queue in matchmaker.queues.items()})
+registry.gauge("lobby_p2p_ports_leased", "P2P ports currently leased", callback=lambda: port_allocator.stats()["leased"])
+registry.gauge("lobby_relay_active_pairs", "Relayed game connections", callback=lambda: relay_server.active_pairs)
+registry.gauge("lobby_relay_bytes", "Bytes forwarded by the relay", callback=lambda: relay_server.bytes_relayed)
+reclaimed = registry.counter("lobby_reclaimed_total", "Stale lobby entries removed by expiry timers", ("kind",))
+expiry_wheel.register_metrics(registry)
+metrics_server = metrics.MetricsServer(registry)
+loop_monitor = LoopMonitor(config.LOOP_MONITOR_INTERVAL, config.LOOP_STALL_THRESHOLD, config.LOOP_LAG_WINDOW, logger)
+loop_monitor.register_metrics(registry)
+admin_server = AdminServer(config.PROFILE_MAX_SECONDS, config.PROFILE_INTERVAL)
+
+
+async def run_pbkdf2(func, *args):
+    pbkdf2_queue.inc()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(hash_executor, func, *args)
+    finally:
+        pbkdf2_queue.dec()
 
 
 async def load_games():
@@ -44,10 +134,11 @@ async def load_games():
 
 async def save_games():
     global games
-    async with aiofiles.open(GAMES_FILE, 'w') as f:
-        data = json.dumps(games, indent=4)
-        await f.write(data)
-        logger.debug(f"Saved games: {data}")
+    with save_seconds.labels("games").time():
+        async with aiofiles.open(GAMES_FILE, 'w') as f:
+            data = json.dumps(games, indent=4)
+            await f.write(data)
+    logger.debug("Saved %d games to %s", len(games), GAMES_FILE)
 
 async def handle_upload_game(params, username, reader, writer):
     global games
@@ -69,7 +160,11 @@ async def handle_upload_game(params, username, reader, writer):
             await send_message(writer, build_response("error", "No file size provided"))
             return
         file_size = int(message_json['file_size'])
+        started = time.perf_counter()
         file_content = await reader.readexactly(file_size)
+        file_transfer_seconds.labels("upload", "game").inc(time.perf_counter() - started)
+        file_transfer_bytes.labels("upload", "game").inc(file_size)
+        bytes_received.inc(len(data) + file_size)
         if not os.path.exists('games-server'):
             os.makedirs('games-server')
         file_path = os.path.join('games-server', game_name + '.py')
@@ -111,7 +206,7 @@ async def handle_list_own_games(username, writer):
         }
         await send_message(writer, json.dumps(response) + '\n')
         logger.info(f"Sent list of own games to {username}")
-        logger.debug(f"Own games: {games_list}")
+        logger.debug("Own games: %s", ", ".join(game["name"] for game in games_list))
     except Exception as e:
         logger.error(f"Error while handling LIST_OWN_GAMES: {e}")
         await send_message(writer, build_response("error", "Failed to list own games"))
@@ -135,16 +230,81 @@ async def handle_download_game_file(params, writer):
         }
         await send_message(writer, json.dumps(file_transfer_message) + '\n')
         await writer.drain()
+        started = time.perf_counter()
         async with aiofiles.open(file_path, 'rb') as f:
             file_content = await f.read()
             writer.write(file_content)
             await writer.drain()
+        file_transfer_seconds.labels("download", "game").inc(time.perf_counter() - started)
+        file_transfer_bytes.labels("download", "game").inc(len(file_content))
+        bytes_sent.inc(len(file_content))
         logger.info(f"Sent game file {game_name}")
     except Exception as e:
         logger.error(f"Error while handling DOWNLOAD_GAME_FILE: {e}")
         await send_message(writer, build_response("error", "Failed to download game file"))
 
 
+async def skip_replay_records(params, reader):
+    # The records follow the UPLOAD_REPLAY line however it is answered; consume them
+    # so the next command line is read from the right place.
+    try:
+        remaining = max(0, int(params[0])) * replay_log.RECORD.size if params else 0
+    except ValueError:
+        return
+    while remaining:
+        remaining -= len(await reader.readexactly(min(remaining, replay_log.CHUNK_SIZE)))
+
+async def handle_upload_replay(params, username, reader, writer):
+    # params: record count, match_id, game, role, started_at; the records follow the command line.
+    # The count comes first so that every error path can still skip the records.
+    try:
+        if len(params) != 5:
+            raise ValueError(len(params))
+        count = int(params[0])
+        match_id, game_name, role = params[1], params[2], params[3]
+        started_at = float(params[4])
+        if count < 0:
+            raise ValueError(count)
+    except ValueError:
+        await skip_replay_records(params, reader)
+        await send_message(writer, build_response("error", "Invalid UPLOAD_REPLAY command"))
+        return
+    remaining = count * replay_log.RECORD.size
+    if count > config.REPLAY_MAX_RECORDS:
+        await skip_replay_records(params, reader)
+        await send_message(writer, build_response("error", "Replay too long"))
+        return
+    # At most REPLAY_MAX_RECORDS records: read them whole before taking the lock, so a slow
+    # sender only holds up its own connection.
+    started = time.perf_counter()
+    try:
+        data = await asyncio.wait_for(reader.readexactly(remaining), config.REPLAY_UPLOAD_TIMEOUT)
+    except asyncio.IncompleteReadError:
+        logger.warning(f"User {username} disconnected during replay upload {match_id}")
+        raise
+    except asyncio.TimeoutError:
+        # Part of the records may already be read; the command stream cannot be trusted any more.
+        logger.warning(f"User {username} timed out during replay upload {match_id}")
+        await send_message(writer, build_response("error", "Replay upload timed out"))
+        writer.close()
+        return
+    finally:
+        file_transfer_seconds.labels("upload", "replay").inc(time.perf_counter() - started)
+    bytes_received.inc(len(data))
+    file_transfer_bytes.labels("upload", "replay").inc(len(data))
+    # One append at a time keeps each match's records contiguous in the log.
+    async with replay_lock:
+        async with aiofiles.open(config.REPLAY_FILE + '.rec', 'ab') as f:
+            start = await f.tell()
+            await f.write(data)
+        entry = replay_log.pack_entry(match_id, game_name, username, role, started_at,
+                                      start // replay_log.RECORD.size, count)
+        async with aiofiles.open(config.REPLAY_FILE + '.idx', 'ab') as f:
+            await f.write(entry)
+    await send_message(writer, build_response("success", f"UPLOAD_REPLAY_SUCCESS {match_id}"))
+    logger.info(f"User {username} uploaded replay {match_id} ({count} moves)")
+
+
 async def load_users():
     users_data = {}
     if not os.path.exists(USERS_FILE):
@@ -162,10 +322,11 @@ async def load_users():
     return users_data
 
 async def save_users():
-    async with aiofiles.open(USERS_FILE, 'w') as f:
-        data = json.dumps(users, indent=4)
-        await f.write(data)
-        logger.debug(f"Saved users: {data}")
+    with save_seconds.labels("users").time():
+        async with aiofiles.open(USERS_FILE, 'w') as f:
+            data = json.dumps(users, indent=4)
+            await f.write(data)
+    logger.debug("Saved %d users to %s", len(users), USERS_FILE)
 
 # def build_response(status, message):
 #     return json.dumps({"status": status, "message": message}) + '\n'
@@ -177,17 +338,40 @@ def build_response(status, message, **kwargs):
 
 async def send_message(writer, message):
     try:
-        writer.write(message.encode())
+        data = message.encode()
+        writer.write(data)
+        bytes_sent.inc(len(data))
         await writer.drain()
     except Exception as e:
-        logger.error(f"發送訊息失敗: {e}")
+        logger.error("發送訊息失敗: %s", e)
 
 async def broadcast(message):
     async with online_users_lock:
         writers = [info["writer"] for info in online_users.values()]
+    broadcast_fanout.observe(len(writers))
     for writer in writers:
         await send_message(writer, message)
 
+async def broadcast_update(message):
+    # Full online_users / public_rooms lists pass through the journal so RESUME can send deltas.
+    message["version"] = lobby_journal.record(message["type"], message["data"])
+    await broadcast(json.dumps(message) + '\n')
+
+async def broadcast_public_rooms():
+    async with game_rooms_lock:
+        public_rooms_data = [
+            {
+                "room_id": r_id,
+                "creator": room["creator"],
+                "game_name": room["game_name"],
+                "status": room["status"],
+                "host": room["host"],
+                "type": room["type"]
+            }
+            for r_id, room in game_rooms.items()
+        ]
+    await broadcast_update({"status": "update", "type": "public_rooms", "data": public_rooms_data})
+
 async def broadcast_lobby_info():
     lobby_info = await get_lobby_info()
     message = json.dumps(lobby_info) + '\n'
@@ -215,10 +399,12 @@ async def get_lobby_info():
             # if room["type"] == "public"
         ]
     
+    lobby_journal.record("online_users", users_data)
     lobby_info = {
         "status": "lobby_info",
         "public_rooms": public_rooms_data,
-        "online_users": users_data
+        "online_users": users_data,
+        "version": lobby_journal.record("public_rooms", public_rooms_data)
     }
     return lobby_info
 
@@ -245,15 +431,17 @@ async def send_lobby_info(writer):
                 # if room["type"] == "public"
             ]
         
+        lobby_journal.record("online_users", users_data)
         lobby_info = {
             "status": "lobby_info",
             "public_rooms": public_rooms_data,
-            "online_users": users_data
+            "online_users": users_data,
+            "version": lobby_journal.record("public_rooms", public_rooms_data)
         }
         await send_message(writer, json.dumps(lobby_info) + '\n')
         logger.info("發送 SHOW_STATUS 訊息給用戶。")
     except Exception as e:
-        logger.error(f"發送大廳信息失敗: {e}")
+        logger.error("發送大廳信息失敗: %s", e)
 
 
 async def handle_register(params, writer):
@@ -264,13 +452,19 @@ async def handle_register(params, writer):
     username_reg, password_reg = params
     if username_reg in users:
         await send_message(writer, build_response("error", "Username already exists"))
-    else:
-        hashed_password = hash_password(password_reg)
-        async with users_lock:
+        return
+    hashed_password = await run_pbkdf2(hash_password, password_reg)
+    async with users_lock:
+        # Someone else may have taken the name while the hash was computed.
+        registered = username_reg not in users
+        if registered:
             users[username_reg] = hashed_password
             await save_users()
+    if registered:
         await send_message(writer, build_response("success", "REGISTER_SUCCESS"))
-        logger.info(f"用戶註冊成功: {username_reg}")
+        logger.info("用戶註冊成功: %s", username_reg)
+    else:
+        await send_message(writer, build_response("error", "Username already exists"))
 
 async def handle_login(params, reader, writer):
     global users
@@ -279,51 +473,185 @@ async def handle_login(params, reader, writer):
         return
     username_login, password_login = params
     async with users_lock:
-        if username_login not in users:
-            await send_message(writer, build_response("error", "User does not exist"))
-            return
-        stored_password = users[username_login]
-        if verify_password(stored_password, password_login):
-            async with online_users_lock:
-                if username_login in online_users:
-                    await send_message(writer, build_response("error", "User already logged in"))
-                    logger.warning(f"重複登入嘗試: {username_login}")
-                    return
-                else:
-                    
-                    client_ip, client_port = writer.get_extra_info('peername')
-                    online_users[username_login] = {
-                        "reader": reader,
-                        "writer": writer,
-                        "status": "idle",
-                        "ip": client_ip,
-                        "port": client_port
-                    }
-            # await send_message(writer, build_response("success", "LOGIN_SUCCESS"))
-            await send_message(writer, build_response("success", f"LOGIN_SUCCESS {username_login}"))
-            await send_lobby_info(writer)
-            async with online_users_lock:
-                users_data = [
-                    {"username": user, "status": info["status"]}
-                    for user, info in online_users.items()
-                ]
-            login_message = {
-                "status": "broadcast",
-                "event": "user_login",
-                "username": username_login
-            }
-            online_users_message = {
-                "status": "update",
-                "type": "online_users",
-                "data": users_data
-            }
-            await broadcast(json.dumps(online_users_message) + '\n')
-            await broadcast(json.dumps(login_message) + '\n')
-            logger.info(f"用戶登錄成功: {username_login}")
+        stored_password = users.get(username_login)
+    if stored_password is None:
+        await send_message(writer, build_response("error", "User does not exist"))
+        return
+    if await run_pbkdf2(verify_password, stored_password, password_login):
+        async with online_users_lock:
+            if username_login in online_users:
+                await send_message(writer, build_response("error", "User already logged in"))
+                logger.warning("重複登入嘗試: %s", username_login)
+                return
+            else:
+                
+                client_ip, client_port = writer.get_extra_info('peername')
+                online_users[username_login] = {
+                    "reader": reader,
+                    "writer": writer,
+                    "status": "idle",
+                    "ip": client_ip,
+                    "port": client_port
+                }
+        suspended.pop(username_login, None)
+        if expiry_wheel.cancel(("disconnect", username_login)):
+            # A new LOGIN starts over; only RESUME gets the dropped connection's room seat back.
+            await release_user(username_login)
+        session_id = sessions[username_login] = token_signer.new_session()
+        # await send_message(writer, build_response("success", "LOGIN_SUCCESS"))
+        await send_message(writer, build_response("success", f"LOGIN_SUCCESS {username_login}",
+                                                  token=token_signer.issue(username_login, session_id)))
+        await send_lobby_info(writer)
+        async with online_users_lock:
+            users_data = [
+                {"username": user, "status": info["status"]}
+                for user, info in online_users.items()
+            ]
+        login_message = {
+            "status": "broadcast",
+            "event": "user_login",
+            "username": username_login
+        }
+        online_users_message = {
+            "status": "update",
+            "type": "online_users",
+            "data": users_data
+        }
+        await broadcast_update(online_users_message)
+        await broadcast(json.dumps(login_message) + '\n')
+        logger.info("用戶登錄成功: %s", username_login)
+    else:
+        await send_message(writer, build_response("error", "Incorrect password"))
+
+def suspend_session(username, status):
+    # Keep what RESUME restores; the room itself still lists the player.
+    room_id = next((r_id for r_id, room in game_rooms.items() if username in room["players"]), None)
+    suspended[username] = {"status": status, "room_id": room_id, "until": time.time() + config.RESUME_TOKEN_TTL}
+
+async def handle_resume(params, reader, writer):
+    # RESUME <token> [last seen lobby version]; returns the username on success.
+    if not 1 <= len(params) <= 2:
+        await send_message(writer, build_response("error", "Invalid RESUME command", command="RESUME"))
+        return None
+    claims = token_signer.verify(params[0])
+    if claims is None or sessions.get(claims[0]) != claims[1]:
+        await send_message(writer, build_response("error", "Resume token is invalid or expired", command="RESUME"))
+        return None
+    username = claims[0]
+    status, room_id, game_name = "idle", None, None
+    async with online_users_lock:
+        previous = online_users.get(username)
+        if previous is not None:
+            # The client saw its connection drop before the server did: take the old entry over.
+            status = previous["status"]
+            room_id = next((r_id for r_id, room in game_rooms.items() if username in room["players"]), None)
+            if room_id is not None:
+                game_name = game_rooms[room_id]["game_name"]
         else:
-            await send_message(writer, build_response("error", "Incorrect password"))
+            saved = suspended.get(username)
+            if saved is not None and saved["until"] > time.time() and saved["room_id"] is not None:
+                room = game_rooms.get(saved["room_id"])
+                if room is not None and username in room["players"]:
+                    status, room_id, game_name = saved["status"], saved["room_id"], room["game_name"]
+        client_ip, client_port = writer.get_extra_info('peername')
+        online_users[username] = {"reader": reader, "writer": writer, "status": status,
+                                  "ip": client_ip, "port": client_port}
+    expiry_wheel.cancel(("disconnect", username))
+    suspended.pop(username, None)
+    if previous is not None:
+        # Its handle_client sees the entry is no longer its own and leaves it alone.
+        previous["writer"].close()
+    session_id = sessions[username] = token_signer.new_session()
+    await send_message(writer, build_response("success", f"RESUME_SUCCESS {username}",
+                                              token=token_signer.issue(username, session_id),
+                                              lobby_status=status, room_id=room_id, game_name=game_name))
+    async with online_users_lock:
+        users_data = [{"username": user, "status": info["status"]} for user, info in online_users.items()]
+    # Broadcast first so the journal already has this user back when the delta is taken.
+    await broadcast_update({"status": "update", "type": "online_users", "data": users_data})
+    delta = None
+    if len(params) == 2 and params[1].isdigit():
+        delta = lobby_journal.since(int(params[1]))
+    if delta is None:
+        await send_lobby_info(writer)
+    else:
+        await send_message(writer, json.dumps({"status": "lobby_delta", "version": lobby_journal.version,
+                                               **delta}) + '\n')
+    logger.info("用戶恢復連線: %s (%s)", username, status)
+    return username
+
+async def release_user(username):
+    """Free the room seat and invites of a user who is gone for good."""
+    async with game_rooms_lock:
+        in_room = any(username in room["players"] for room in game_rooms.values())
+        invited_to = [r_id for r_id, room in game_rooms.items() if username in room["invited_users"]]
+    for room_id in invited_to:
+        await expire_invite(room_id, username)
+    if in_room:
+        await handle_leave_room(username)
+        reclaimed.labels("seat").inc()
+
+async def expire_disconnect(username):
+    # The dropped user did not RESUME within DISCONNECT_GRACE.
+    async with online_users_lock:
+        if username in online_users:
+            return
+    if suspended.pop(username, None) is not None:
+        reclaimed.labels("session").inc()
+    await release_user(username)
+    logger.info("斷線用戶 %s 未在時限內恢復，已釋放其房間與邀請", username)
+
+async def expire_invite(room_id, username):
+    expiry_wheel.cancel(("invite", room_id, username))
+    room_deleted = False
+    pending_match = None
+    async with game_rooms_lock:
+        room = game_rooms.get(room_id)
+        if room is None or username not in room["invited_users"]:
+            return
+        room["invited_users"].remove(username)
+        if not room["players"] and not room["invited_users"]:
+            pending_match = delete_room(room_id)
+            room_deleted = True
+    if pending_match is not None:
+        record_match(pending_match)
+    reclaimed.labels("invite").inc()
+    if room_deleted:
+        reclaimed.labels("room").inc()
+        logger.info("Room %s has been deleted: no players and no pending invites.", room_id)
+        await broadcast_public_rooms()
+
+async def expire_game(room_id):
+    # Nobody sent GAME_OVER within GAME_TIMEOUT: the players crashed or walked away mid-game.
+    async with game_rooms_lock:
+        room = game_rooms.get(room_id)
+        if room is None or room["status"] != "In Game":
+            return
+        pending_match = delete_room(room_id)
+    if pending_match is not None:
+        record_match(pending_match)
+    async with online_users_lock:
+        for player in room["players"]:
+            port_allocator.release(player)
+            if player in online_users and online_users[player]["status"] == "in_game":
+                online_users[player]["status"] = "idle"
+                await send_message(online_users[player]["writer"],
+                                   build_response("info", f"Game in room {room_id} timed out and the room was closed"))
+        users_data = [{"username": user, "status": info["status"]} for user, info in online_users.items()]
+    reclaimed.labels("game").inc()
+    logger.warning("Room %s closed: no GAME_OVER within %s s.", room_id, config.GAME_TIMEOUT)
+    await broadcast_update({"status": "update", "type": "online_users", "data": users_data})
+    await broadcast_public_rooms()
 
 async def handle_logout(username, writer):
+    port_allocator.release(username)
+    matchmaker.remove(username)
+    sessions.pop(username, None)
+    suspended.pop(username, None)
+    async with game_rooms_lock:
+        invited_to = [r_id for r_id, room in game_rooms.items() if username in room["invited_users"]]
+    for room_id in invited_to:
+        await expire_invite(room_id, username)
     user_removed = False
     async with online_users_lock:
         if username in online_users:
@@ -355,8 +683,8 @@ async def handle_logout(username, writer):
                 "type": "online_users",
                 "data": users_data
             }
-            await broadcast(json.dumps(online_users_message) + '\n')
-            logger.info(f"User logged out: {username}")
+            await broadcast_update(online_users_message)
+            logger.info("User logged out: %s", username)
         except Exception as e:
             logger.error(f"Failed to broadcast updated online users list after logout: {e}")
     else:
@@ -384,6 +712,7 @@ async def handle_create_room(params, username, writer):
                 await send_message(writer, build_response("error", "You are already in a room"))
                 return
             online_users[username]["status"] = "in_room"
+    matchmaker.remove(username)
     room_id = str(uuid.uuid4())
     async with game_rooms_lock:
         game_rooms[room_id] = {
@@ -417,7 +746,7 @@ async def handle_create_room(params, username, writer):
         "type": "public_rooms",
         "data": public_rooms_data
     }
-    await broadcast(json.dumps(public_rooms_message) + '\n')
+    await broadcast_update(public_rooms_message)
     room_message = {
         "status": "broadcast",
         "event": "room_created",
@@ -432,8 +761,10 @@ async def handle_create_room(params, username, writer):
     if game_name in ['rock_paper_scissors', 'tictactoe', 'connectfour']:
         logger.info(f"等待第二位玩家加入 {game_name.capitalize()} 房間: {room_id}")
 
-async def handle_leave_room(username, writer):
+async def handle_leave_room(username, writer=None):
+    # Without a writer this is a disconnected user's seat being freed by an expiry timer.
     room_to_delete = None
+    pending_match = None
     async with game_rooms_lock:
         for room_id, room in game_rooms.items():
             if username in room["players"]:
@@ -466,14 +797,17 @@ async def handle_leave_room(username, writer):
                                 await send_message(player_writer, build_response("info", f"Player {username} has left the room"))
                 break
         if room_to_delete:
-            del game_rooms[room_to_delete]
+            pending_match = delete_room(room_to_delete)
             logger.info(f"Room {room_to_delete} has been deleted.")
+    if pending_match is not None:
+        record_match(pending_match)
 
     async with online_users_lock:
         if username in online_users:
             online_users[username]['status'] = 'idle'
     
-    await send_message(writer, build_response("success", "LEAVE_ROOM_SUCCESS"))
+    if writer is not None:
+        await send_message(writer, build_response("success", "LEAVE_ROOM_SUCCESS"))
     
     async with online_users_lock:
         users_data = [
@@ -485,7 +819,7 @@ async def handle_leave_room(username, writer):
         "type": "online_users",
         "data": users_data
     }
-    await broadcast(json.dumps(online_users_message) + '\n')
+    await broadcast_update(online_users_message)
 
     async with game_rooms_lock:
         public_rooms_data = [
@@ -505,13 +839,10 @@ async def handle_leave_room(username, writer):
         "type": "public_rooms",
         "data": public_rooms_data
     }
-    await broadcast(json.dumps(public_rooms_message) + '\n')
+    await broadcast_update(public_rooms_message)
 
     logger.info(f"User {username} has left the room and is now idle.")
 
-def get_random_p2p_port():
-    return random.randint(config.P2P_PORT_RANGE[0], config.P2P_PORT_RANGE[1])
-
 async def handle_join_room(params, username, writer):
     if len(params) != 1:
         await send_message(writer, build_response("error", "Invalid JOIN_ROOM command"))
@@ -539,6 +870,7 @@ async def handle_join_room(params, username, writer):
     async with online_users_lock:
         if username in online_users:
             online_users[username]["status"] = "in_room"
+    matchmaker.remove(username)
     await send_message(writer, build_response("success", f"JOIN_ROOM_SUCCESS {room_id} {room['game_name']}"))
 
     async with game_rooms_lock:
@@ -560,7 +892,7 @@ async def handle_join_room(params, username, writer):
         "type": "public_rooms",
         "data": public_rooms_data
     }
-    await broadcast(json.dumps(public_rooms_message) + '\n')
+    await broadcast_update(public_rooms_message)
     logger.info(f"用戶 {username} 加入房間: {room_id}")
 
 async def handle_invite_player(params, username, writer):
@@ -598,6 +930,8 @@ async def handle_invite_player(params, username, writer):
             await send_message(writer, build_response("error", f"{target_username} is already in the room"))
             return
         room['invited_users'].append(target_username)
+        expiry_wheel.schedule(("invite", room_id, target_username), config.INVITE_TTL,
+                              expire_invite, room_id, target_username)
     
     try:
         invite_message = {
@@ -643,11 +977,13 @@ async def handle_accept_invite(params, username, writer):
             return
         
         room['invited_users'].remove(username)
+        expiry_wheel.cancel(("invite", room_id, username))
         room['players'].append(username)
 
     async with online_users_lock:
         if username in online_users:
             online_users[username]["status"] = "in_room"
+    matchmaker.remove(username)
     await send_message(writer, build_response("success", f"JOIN_ROOM_SUCCESS {room_id} {room['game_name']}"))
 
     async with game_rooms_lock:
@@ -669,10 +1005,16 @@ async def handle_accept_invite(params, username, writer):
         "type": "public_rooms",
         "data": public_rooms_data
     }
-    await broadcast(json.dumps(public_rooms_message) + '\n')
+    await broadcast_update(public_rooms_message)
     logger.info(f"User {username} accepted invite to join room: {room_id}")
 
-async def handle_start_game(username, writer):
+async def handle_start_game(username, writer, trace_id=None):
+    # The host's client sends its trace id with START_GAME; queue matches start a new trace.
+    trace_id = trace_id or tracing.new_trace_id()
+    with tracer.span(trace_id, "server.start_game", host=username):
+        await start_game(username, writer, trace_id)
+
+async def start_game(username, writer, trace_id):
     async with game_rooms_lock:
         room_found = False
         for room_id, room in game_rooms.items():
@@ -684,7 +1026,16 @@ async def handle_start_game(username, writer):
                 if len(room["players"]) < room['capacity']:
                     await send_message(writer, build_response("error", "Cannot start game: the room is not full"))
                     return
+                # A dropped player keeps their seat for DISCONNECT_GRACE but is not online to play.
+                async with online_users_lock:
+                    offline = [player for player in room["players"] if player not in online_users]
+                if offline:
+                    await send_message(writer, build_response(
+                        "error", f"Opponent disconnected, waiting for RESUME: {', '.join(offline)}"))
+                    return
                 room['status'] = 'In Game'
+                room['trace_id'] = trace_id
+                expiry_wheel.schedule(("game", room_id), config.GAME_TIMEOUT, expire_game, room_id)
                 game_name = room['game_name']
                 host_player = username
                 other_player = None
@@ -696,22 +1047,37 @@ async def handle_start_game(username, writer):
                     await send_message(writer, build_response("error", "No other player in room"))
                     return
 
+                if config.GAME_MODE == 'hosted' and game_name in SESSION_RULES:
+                    begin_match(room, host_player, other_player)
+                    await start_hosted_session(room_id, room, host_player, other_player)
+                    break
+
                 async with online_users_lock:
+                    host_info = online_users[host_player]
+                    other_info = online_users[other_player]
+                    host_port = port_allocator.acquire(host_info["ip"], host_player, room_id)
+                    other_port = port_allocator.acquire(other_info["ip"], other_player, room_id)
+                    if host_port is None or other_port is None:
+                        port_allocator.release(host_player)
+                        port_allocator.release(other_player)
+                        room['status'] = 'Waiting'
+                        await send_message(writer, build_response("error", "No free P2P port, try again later"))
+                        logger.warning(f"P2P port pool exhausted: {port_allocator.stats()}")
+                        return
+
                     for player in room['players']:
                         if player in online_users:
                             online_users[player]["status"] = "in_game"
 
-                    host_info = online_users[host_player]
-                    other_info = online_users[other_player]
-                    host_port = get_random_p2p_port()
-                    other_port = get_random_p2p_port()
                     host_message = {
                         "status": "p2p_info",
                         "role": "host",
                         "peer_ip": other_info["ip"],
                         "peer_port": other_port,
                         "own_port": host_port,
-                        "game_name": game_name
+                        "game_name": game_name,
+                        "relay_available": config.RELAY_ENABLED,
+                        "trace_id": trace_id
                     }
                     other_message = {
                         "status": "p2p_info",
@@ -719,15 +1085,318 @@ async def handle_start_game(username, writer):
                         "peer_ip": host_info["ip"],
                         "peer_port": host_port,
                         "own_port": other_port,
-                        "game_name": game_name
+                        "game_name": game_name,
+                        "relay_available": config.RELAY_ENABLED,
+                        "trace_id": trace_id
                     }
+                    if config.RELAY_ENABLED and config.P2P_MODE == 'relay':
+                        relay_info = build_relay_info(room)
+                        host_message.update(relay_info)
+                        other_message.update(relay_info)
                     await send_message(host_info["writer"], json.dumps(host_message) + '\n')
                     await send_message(other_info["writer"], json.dumps(other_message) + '\n')
+                begin_match(room, host_player, other_player)
                 logger.info(f"Game server info sent to players in room: {room_id}")
+                logger.debug("P2P port pool: %s", port_allocator.stats())
                 break
         if not room_found:
             await send_message(writer, build_response("error", "You are not in a room"))
 
+def begin_match(room, host_player, other_player):
+    if room.get('match') is not None:
+        # Someone never sent GAME_OVER for the last game in this room; keep what was reported.
+        record_match(room.pop('match'))
+    room['match'] = {
+        "players": [host_player, other_player],
+        "game": room['game_name'],
+        "started_at": time.time(),
+        "reports": {}
+    }
+
+def delete_room(room_id):
+    """Remove a room; returns the match it still had pending, for the caller to record."""
+    return game_rooms.pop(room_id).pop('match', None)
+
+def report_match_result(room, username, outcome):
+    """Note one player's GAME_OVER; returns the match once every player has reported."""
+    match = room.get('match')
+    if match is None or username not in match["players"] or username in match["reports"]:
+        return None
+    match["reports"][username] = outcome
+    match.setdefault("ended_at", time.time())
+    if len(match["reports"]) < len(match["players"]):
+        return None
+    return room.pop('match')
+
+def record_match(match):
+    first, second = match["players"]
+    outcome = match_history.outcome_from_reports(match["reports"].get(first), match["reports"].get(second))
+    ended_at = match.get("ended_at", time.time())
+    history.append(first, second, match["game"], outcome, ended_at - match["started_at"], ended_at)
+    schedule_history_flush()
+    logger.info("Match %s vs %s (%s): %s", first, second, match["game"], match_history.OUTCOME_NAMES[outcome])
+    if outcome in ELO_SCORES:
+        board = ratings.record(match["game"], first, second, ELO_SCORES[outcome])
+        # The store holds the board's own dict; the write-behind flush saves its current state.
+        ratings_store.update({match["game"]: board.ratings})
+
+def schedule_history_flush():
+    # Write-behind like ratings_store: matches finished within HISTORY_FLUSH_DELAY share one write.
+    global history_flush_task
+    if history_flush_task is None:
+        history_flush_task = asyncio.create_task(flush_history_later())
+
+async def flush_history_later():
+    global history_flush_task
+    try:
+        await asyncio.sleep(config.HISTORY_FLUSH_DELAY)
+    finally:
+        history_flush_task = None
+    await flush_history()
+
+async def flush_history():
+    # The rows are copied on the loop and written in the executor, one write at a time.
+    async with history_write_lock:
+        pending = history.take_pending()
+        if pending is None:
+            return
+        try:
+            with save_seconds.labels("history").time():
+                await asyncio.get_running_loop().run_in_executor(None, history.write_pending, pending)
+        except OSError as e:
+            logger.error(f"Failed to save match history: {e}")
+
+def schedule_trace_flush():
+    # tracer.on_full: record() only appends, the full buffer is written from a task.
+    global trace_flush_task
+    if trace_flush_task is None:
+        trace_flush_task = asyncio.create_task(flush_trace_later())
+
+async def flush_trace_later():
+    global trace_flush_task
+    trace_flush_task = None
+    await flush_trace()
+
+async def flush_trace():
+    # Like flush_history: spans are taken on the loop and appended in the executor, in order.
+    async with trace_write_lock:
+        lines = tracer.take()
+        if lines:
+            await asyncio.get_running_loop().run_in_executor(None, tracer.write, lines)
+
+async def load_ratings():
+    await ratings_store.attach(config.RATINGS_FILE)
+    ratings.load(ratings_store.data)
+    ratings_store.data.update({game: board.ratings for game, board in ratings.boards.items()})
+
+async def handle_leaderboard(params, writer):
+    # LEADERBOARD <game> [offset] [limit]
+    if not 1 <= len(params) <= 3:
+        await send_message(writer, build_response("error", "Invalid LEADERBOARD command"))
+        return
+    try:
+        offset = int(params[1]) if len(params) > 1 else 0
+        limit = int(params[2]) if len(params) > 2 else 10
+    except ValueError:
+        await send_message(writer, build_response("error", "Invalid LEADERBOARD command"))
+        return
+    board = ratings.boards.get(params[0])
+    if board is None:
+        await send_message(writer, build_response("error", "No rated matches for this game"))
+        return
+    offset = max(0, offset)
+    limit = max(1, min(limit, config.LEADERBOARD_MAX_LIMIT))
+    entries = [{"rank": rank, "player": player, "rating": rating} for rank, player, rating in board.page(offset, limit)]
+    await send_message(writer, build_response("success", "LEADERBOARD", game=params[0], total=len(board),
+                                              entries=entries))
+
+async def handle_rank(params, username, writer):
+    # RANK [username] [game]
+    if len(params) > 2:
+        await send_message(writer, build_response("error", "Invalid RANK command"))
+        return
+    player = params[0] if params else username
+    ranks = ratings.ranks(player)
+    if len(params) == 2:
+        ranks = {game: rank for game, rank in ranks.items() if game == params[1]}
+    if not ranks:
+        await send_message(writer, build_response("error", "No rating for this player"))
+        return
+    await send_message(writer, build_response("success", "RANK", player=player, ranks=ranks))
+
+async def handle_stats(params, username, writer):
+    # STATS [username] | STATS game <game_name>
+    if len(params) == 2 and params[0] == "game":
+        stats = history.game_stats(params[1])
+        if stats is None:
+            await send_message(writer, build_response("error", "No matches recorded for this game"))
+            return
+        await send_message(writer, build_response("success", "GAME_STATS", stats=stats))
+        return
+    if len(params) > 1:
+        await send_message(writer, build_response("error", "Invalid STATS command"))
+        return
+    player = params[0] if params else username
+    stats = history.player_stats(player)
+    if stats is None:
+        await send_message(writer, build_response("error", "No matches recorded for this player"))
+        return
+    await send_message(writer, build_response("success", "PLAYER_STATS", stats=stats))
+
+async def handle_history(params, username, writer):
+    # HISTORY [username] [limit]
+    if len(params) > 2:
+        await send_message(writer, build_response("error", "Invalid HISTORY command"))
+        return
+    player = params[0] if params else username
+    try:
+        limit = int(params[1]) if len(params) > 1 else 10
+    except ValueError:
+        await send_message(writer, build_response("error", "Invalid HISTORY command"))
+        return
+    limit = max(1, min(limit, config.HISTORY_MAX_LIMIT))
+    matches = history.history(player, limit)
+    if matches is None:
+        await send_message(writer, build_response("error", "No matches recorded for this player"))
+        return
+    await send_message(writer, build_response("success", "HISTORY", player=player, matches=matches))
+
+async def handle_queue(params, username, writer):
+    if len(params) != 1:
+        await send_message(writer, build_response("error", "Invalid QUEUE command"))
+        return
+    game_name = params[0]
+    async with games_lock:
+        if game_name not in games:
+            await send_message(writer, build_response("error", "Game does not exist"))
+            return
+    async with online_users_lock:
+        if username not in online_users:
+            return
+        if online_users[username]["status"] != "idle":
+            await send_message(writer, build_response("error", "You must be idle to join the queue"))
+            return
+        online_users[username]["status"] = "queued"
+    # Queue status changes are not broadcast; only the matched pair hears about them.
+    rating = ratings.board(game_name).ratings.get(username, config.ELO_INITIAL)
+    pair = matchmaker.enqueue(game_name, username, rating)
+    if pair is None:
+        position = matchmaker.position(username)
+        await send_message(writer, build_response("success", f"QUEUED {game_name} {position}"))
+        logger.info(f"User {username} queued for {game_name} at position {position}")
+        return
+    await start_queued_match(game_name, *pair)
+
+async def start_queued_match(game_name, host_player, other_player):
+    pair = (host_player, other_player)
+    room_id = str(uuid.uuid4())
+    async with game_rooms_lock:
+        game_rooms[room_id] = {
+            'creator': host_player,
+            'host': host_player,
+            'type': 'private',
+            'game_name': game_name,
+            'status': 'Waiting',
+            'players': [host_player, other_player],
+            'invited_users': [],
+            'capacity': 2
+        }
+    async with online_users_lock:
+        writers = {}
+        for player in pair:
+            if player in online_users:
+                online_users[player]["status"] = "in_room"
+                writers[player] = online_users[player]["writer"]
+    for player, opponent in [(host_player, other_player), (other_player, host_player)]:
+        if player in writers:
+            await send_message(writers[player], build_response("success", f"QUEUE_MATCHED {room_id} {game_name} {opponent}"))
+    logger.info(f"Matched {host_player} and {other_player} for {game_name} in room {room_id}")
+    if host_player in writers:
+        await handle_start_game(host_player, writers[host_player])
+
+async def rescan_queues():
+    # Bands widen while players wait; pair those who now accept each other.
+    expiry_wheel.schedule(("matchmaking",), config.MATCHMAKING_RESCAN_INTERVAL, rescan_queues)
+    for game_name, host_player, other_player in matchmaker.rematch():
+        await start_queued_match(game_name, host_player, other_player)
+
+async def handle_leave_queue(username, writer):
+    game_name = matchmaker.remove(username)
+    if game_name is None:
+        await send_message(writer, build_response("error", "You are not in a queue"))
+        return
+    async with online_users_lock:
+        if username in online_users and online_users[username]["status"] == "queued":
+            online_users[username]["status"] = "idle"
+    await send_message(writer, build_response("success", f"LEAVE_QUEUE_SUCCESS {game_name}"))
+    logger.info(f"User {username} left the {game_name} queue")
+
+async def handle_queue_stats(writer):
+    await send_message(writer, build_response("success", "QUEUE_STATS", stats=matchmaker.stats()))
+
+async def start_hosted_session(room_id, room, host_player, other_player):
+    session_id = uuid.uuid4().hex
+    async with online_users_lock:
+        for player in room['players']:
+            if player in online_users:
+                online_users[player]["status"] = "in_game"
+        for player, role in [(host_player, "host"), (other_player, "client")]:
+            if player not in online_users:
+                continue
+            session_message = {
+                "status": "p2p_info",
+                "role": role,
+                "game_name": room['game_name'],
+                "session_host": config.SESSION_HOST,
+                "session_port": config.SESSION_PORT,
+                "session_id": session_id,
+                "trace_id": room.get('trace_id')
+            }
+            await send_message(online_users[player]["writer"], json.dumps(session_message) + '\n')
+    logger.info(f"Hosted session {session_id} assigned to room: {room_id}")
+
+def build_relay_info(room):
+    if 'relay_token' not in room:
+        room['relay_token'] = uuid.uuid4().hex
+    return {
+        "relay_host": config.RELAY_HOST,
+        "relay_port": config.RELAY_PORT,
+        "relay_token": room['relay_token']
+    }
+
+async def handle_p2p_failed(username, writer):
+    if not config.RELAY_ENABLED:
+        await send_message(writer, build_response("error", "Relay is not available"))
+        return
+    async with game_rooms_lock:
+        room = None
+        for r_id, r in game_rooms.items():
+            if username in r["players"] and r["status"] == "In Game":
+                room_id, room = r_id, r
+                break
+        if room is None:
+            await send_message(writer, build_response("error", "You are not in a game"))
+            return
+        if 'relay_token' in room:
+            # The other player already asked for the relay.
+            return
+        relay_info = build_relay_info(room)
+        relay_info["trace_id"] = room.get("trace_id")
+        players = list(room["players"])
+        game_name = room["game_name"]
+        host = room["host"]
+    async with online_users_lock:
+        for player in players:
+            if player in online_users:
+                relay_message = {
+                    "status": "relay_info",
+                    "role": "host" if player == host else "client",
+                    "game_name": game_name
+                }
+                relay_message.update(relay_info)
+                await send_message(online_users[player]["writer"], json.dumps(relay_message) + '\n')
+    logger.info(f"Direct connect failed for {username}, relaying room {room_id}")
+
 async def handle_decline_invite(params, username, writer):
     if len(params) != 2:
         await send_message(writer, build_response("error", "Invalid DECLINE_INVITE command"))
@@ -751,6 +1420,7 @@ async def handle_decline_invite(params, username, writer):
             room = game_rooms[room_id]
             if username in room['invited_users']:
                 room['invited_users'].remove(username)
+                expiry_wheel.cancel(("invite", room_id, username))
     await send_message(writer, build_response("success", f"DECLINE_INVITE_SUCCESS {room_id}"))
 
 async def handle_show_status(writer):
@@ -762,24 +1432,82 @@ async def handle_show_status(writer):
         await send_message(writer, build_response("error", "Failed to retrieve status"))
 
 
-async def handle_game_over(username):
+async def handle_report_port(params, username, writer):
+    if len(params) != 1:
+        await send_message(writer, build_response("error", "Invalid REPORT_PORT command"))
+        return
+    try:
+        port = int(params[0])
+    except ValueError:
+        await send_message(writer, build_response("error", "Invalid port"))
+        return
+    if not 0 < port < 65536:
+        await send_message(writer, build_response("error", "Invalid port"))
+        return
+    async with online_users_lock:
+        if username not in online_users:
+            return
+        host_ip = online_users[username]["ip"]
+    room_id = None
+    trace_id = None
+    waiting_peers = []
+    async with game_rooms_lock:
+        for r_id, room in game_rooms.items():
+            if username in room["players"]:
+                room_id = r_id
+                if room["status"] == "In Game" and room["host"] == username:
+                    trace_id = room.get("trace_id")
+                    waiting_peers = [player for player in room["players"] if player != username]
+                break
+    if not port_allocator.adopt(host_ip, port, username, room_id):
+        await send_message(writer, build_response("error", "Port is leased by another player"))
+        logger.warning(f"User {username} reported port {port} already leased on {host_ip}")
+        return
+    await send_message(writer, build_response("success", f"REPORT_PORT_SUCCESS {port}"))
+    logger.info(f"User {username} reported bound P2P port {port}")
+    # A game host reports its port once it is listening; let the client connect right away.
+    ready_message = {
+        "status": "peer_ready",
+        "room_id": room_id,
+        "host": username,
+        "port": port,
+        "trace_id": trace_id
+    }
+    async with online_users_lock:
+        for player in waiting_peers:
+            if player in online_users:
+                await send_message(online_users[player]["writer"], json.dumps(ready_message) + '\n')
+    if waiting_peers:
+        tracer.event(trace_id, "server.peer_ready_forwarded", host=username)
+        logger.debug("Forwarded peer_ready for room %s to %s", room_id, ", ".join(waiting_peers))
+
+async def handle_game_over(params, username):
+    # The client reports its own result: "win", "loss" or "draw"; nothing if the game did not finish.
+    outcome = params[0] if params and params[0] in ("win", "loss", "draw") else None
+    port_allocator.release(username)
     async with online_users_lock:
         if username in online_users:
             online_users[username]["status"] = "idle"
 
     room_to_delete = None
+    finished_match = None
     async with game_rooms_lock:
         for room_id, room in game_rooms.items():
             if username in room["players"]:
+                finished_match = report_match_result(room, username, outcome)
                 room["players"].remove(username)
                 if len(room["players"]) == 0:
                     room_to_delete = room_id
                 else:
                     # If room still has players, update its status to "Waiting"
                     room["status"] = "Waiting"
+                    room.pop("relay_token", None)
                 break
         if room_to_delete:
-            del game_rooms[room_to_delete]
+            # The last player out: a partner who never reported still leaves a match behind.
+            finished_match = delete_room(room_to_delete) or finished_match
+    if finished_match is not None:
+        record_match(finished_match)
 
     async with online_users_lock:
         users_data = [
@@ -791,7 +1519,7 @@ async def handle_game_over(username):
         "type": "online_users",
         "data": users_data
     }
-    await broadcast(json.dumps(online_users_message) + '\n')
+    await broadcast_update(online_users_message)
 
     async with game_rooms_lock:
         public_rooms_data = [
@@ -812,20 +1540,24 @@ async def handle_game_over(username):
         "type": "public_rooms",
         "data": public_rooms_data
     }
-    await broadcast(json.dumps(public_rooms_message) + '\n')
+    await broadcast_update(public_rooms_message)
 
+    # Spans of a finished game are written now rather than at the next full buffer.
+    await flush_trace()
     logger.info(f"User {username} has ended the game and is now idle.")
 
 async def handle_client(reader, writer):
     addr = writer.get_extra_info('peername')
-    logger.info(f"來自 {addr} 的新連接")
+    logger.info("來自 %s 的新連接", addr)
     username = None
+    connections.add(writer)
     try:
         while True:
             data = await reader.readline()
             if not data:
                 # Client disconnected
                 break
+            bytes_received.inc(len(data))
             try:
                 message = data.decode().strip()
                 if not message:
@@ -842,6 +1574,12 @@ async def handle_client(reader, writer):
                     if len(params) >= 1:
                         username = params[0]
 
+                elif command == "RESUME":
+                    if username and online_users.get(username, {}).get("writer") is writer:
+                        await send_message(writer, build_response("error", "Already logged in", command="RESUME"))
+                    else:
+                        username = await handle_resume(params, reader, writer) or username
+
                 elif command == "LOGOUT":
                     if username:
                         await handle_logout(username, writer)
@@ -881,7 +1619,61 @@ async def handle_client(reader, writer):
 
                 elif command == "GAME_OVER":
                     if username:
-                        await handle_game_over(username)
+                        await handle_game_over(params, username)
+                    else:
+                        await send_message(writer, build_response("error", "Not logged in"))
+                
+                elif command == "QUEUE":
+                    if username:
+                        await handle_queue(params, username, writer)
+                    else:
+                        await send_message(writer, build_response("error", "Not logged in"))
+
+                elif command == "LEAVE_QUEUE":
+                    if username:
+                        await handle_leave_queue(username, writer)
+                    else:
+                        await send_message(writer, build_response("error", "Not logged in"))
+
+                elif command == "QUEUE_STATS":
+                    if username:
+                        await handle_queue_stats(writer)
+                    else:
+                        await send_message(writer, build_response("error", "Not logged in"))
+
+                elif command == "STATS":
+                    if username:
+                        await handle_stats(params, username, writer)
+                    else:
+                        await send_message(writer, build_response("error", "Not logged in"))
+
+                elif command == "HISTORY":
+                    if username:
+                        await handle_history(params, username, writer)
+                    else:
+                        await send_message(writer, build_response("error", "Not logged in"))
+
+                elif command == "LEADERBOARD":
+                    if username:
+                        await handle_leaderboard(params, writer)
+                    else:
+                        await send_message(writer, build_response("error", "Not logged in"))
+
+                elif command == "RANK":
+                    if username:
+                        await handle_rank(params, username, writer)
+                    else:
+                        await send_message(writer, build_response("error", "Not logged in"))
+
+                elif command == "P2P_FAILED":
+                    if username:
+                        await handle_p2p_failed(username, writer)
+                    else:
+                        await send_message(writer, build_response("error", "Not logged in"))
+
+                elif command == "REPORT_PORT":
+                    if username:
+                        await handle_report_port(params, username, writer)
                     else:
                         await send_message(writer, build_response("error", "Not logged in"))
                 
@@ -899,7 +1691,7 @@ async def handle_client(reader, writer):
                 
                 elif command == "START_GAME":
                     if username:
-                        await handle_start_game(username, writer)
+                        await handle_start_game(username, writer, message_json.get("trace_id"))
                     else:
                         await send_message(writer, build_response("error", "Not logged in"))
 
@@ -908,6 +1700,12 @@ async def handle_client(reader, writer):
                         await handle_upload_game(params, username, reader, writer)
                     else:
                         await send_message(writer, build_response("error", "Not logged in"))
+                elif command == "UPLOAD_REPLAY":
+                    if username:
+                        await handle_upload_replay(params, username, reader, writer)
+                    else:
+                        await skip_replay_records(params, reader)
+                        await send_message(writer, build_response("error", "Not logged in"))
                 elif command == "LIST_OWN_GAMES":
                     if username:
                         await handle_list_own_games(username, writer)
@@ -925,18 +1723,29 @@ async def handle_client(reader, writer):
             except json.JSONDecodeError:
                 await send_message(writer, build_response("error", "Invalid message format"))
             except Exception as e:
-                logger.error(f"處理訊息時發生錯誤: {e}")
+                logger.error("處理訊息時發生錯誤: %s", e)
                 await send_message(writer, build_response("error", "Server error"))
     except Exception as e:
         logger.error(f"處理客戶端 {addr} 時發生錯誤: {e}")
     finally:
+        connections.discard(writer)
         if username:
             user_removed = False
             async with online_users_lock:
-                if username in online_users:
+                # Only this connection's own login: a failed LOGIN also sets username,
+                # and a RESUME on a new connection takes the entry over.
+                info = online_users.get(username)
+                if info is not None and info["writer"] is writer:
                     del online_users[username]
                     user_removed = True
             if user_removed:
+                port_allocator.release(username)
+                matchmaker.remove(username)
+                if username in sessions:
+                    suspend_session(username, info["status"])
+                # Hold the room seat and invites open for a RESUME, then free them.
+                expiry_wheel.schedule(("disconnect", username), config.DISCONNECT_GRACE,
+                                      expire_disconnect, username)
                 try:
                     async with online_users_lock:
                         users_data = [
@@ -948,8 +1757,8 @@ async def handle_client(reader, writer):
                         "type": "online_users",
                         "data": users_data
                     }
-                    await broadcast(json.dumps(online_users_message) + '\n')
-                    logger.info(f"User disconnected: {username}")
+                    await broadcast_update(online_users_message)
+                    logger.info("User disconnected: %s", username)
                 except Exception as e:
                     logger.error(f"Failed to broadcast updated online users list after disconnection: {e}")
         try:
@@ -964,9 +1773,30 @@ async def main():
     users = await load_users()
     global games
     games = await load_games()
+    global history
+    history = match_history.open_history(config.HISTORY_DIR)
+    await load_ratings()
+    tracer.on_full = schedule_trace_flush
+    if config.LOOP_MONITOR_ENABLED:
+        await loop_monitor.start()
+    expiry_wheel.start()
+    if config.MATCHMAKING_RATING_BAND is not None:
+        expiry_wheel.schedule(("matchmaking",), config.MATCHMAKING_RESCAN_INTERVAL, rescan_queues)
     server = await asyncio.start_server(handle_client, config.HOST, config.PORT)
     addr = server.sockets[0].getsockname()
     logger.info(f"Lobby Server 正在運行在 {addr}")
+    if config.RELAY_ENABLED:
+        await relay_server.start(config.HOST, config.RELAY_PORT)
+        logger.info(f"Relay server 正在運行在 {config.HOST}:{config.RELAY_PORT}")
+    if config.GAME_MODE == 'hosted' and config.SESSION_SERVER_IN_PROCESS:
+        await session_server.start(config.HOST, config.SESSION_PORT)
+        logger.info(f"Game session server 正在運行在 {config.HOST}:{config.SESSION_PORT}")
+    if config.METRICS_ENABLED:
+        await metrics_server.start(config.METRICS_HOST, config.METRICS_PORT)
+        logger.info(f"Metrics 端點正在運行在 http://{config.METRICS_HOST}:{config.METRICS_PORT}/metrics")
+    if config.ADMIN_ENABLED and hasattr(asyncio, "start_unix_server"):
+        await admin_server.start(config.ADMIN_SOCKET)
+        logger.info(f"管理介面正在運行在 {config.ADMIN_SOCKET}")
 
     async with server:
         try:
@@ -976,6 +1806,18 @@ async def main():
         finally:
             server.close()
             await server.wait_closed()
+            if relay_server.server is not None:
+                relay_server.server.close()
+            if session_server.server is not None:
+                session_server.server.close()
+            if metrics_server.server is not None:
+                metrics_server.server.close()
+            loop_monitor.stop()
+            expiry_wheel.stop()
+            admin_server.close()
+            await flush_trace()
+            await ratings_store.flush()
+            await flush_history()
             logger.info("伺服器已關閉。")
 
 if __name__ == "__main__":
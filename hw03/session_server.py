@@ -0,0 +1,249 @@
+import asyncio
+import json
+import logging
+import time
+
+import config
+
+logger = logging.getLogger("LobbyServer")
+
+MAX_FRAME = 64 * 1024
+
+
+class TicTacToeRules:
+    WIN_CONDITIONS = (
+        (0, 1, 2), (3, 4, 5), (6, 7, 8),  # rows
+        (0, 3, 6), (1, 4, 7), (2, 5, 8),  # columns
+        (0, 4, 8), (2, 4, 6)              # diagonals
+    )
+
+    def __init__(self):
+        self.board = [' '] * 9
+        self.turn = "host"
+
+    def apply(self, seat, move):
+        """Return (error, result); result is None while the match goes on."""
+        if seat != self.turn:
+            return "Not your turn", None
+        if not isinstance(move, int) or not 0 <= move <= 8 or self.board[move] != ' ':
+            return "Invalid move", None
+        symbol = 'X' if seat == "host" else 'O'
+        self.board[move] = symbol
+        if any(all(self.board[pos] == symbol for pos in condition) for condition in self.WIN_CONDITIONS):
+            return None, seat
+        if ' ' not in self.board:
+            return None, "draw"
+        self.turn = "client" if seat == "host" else "host"
+        return None, None
+
+
+class RockPaperScissorsRules:
+    BEATS = {'rock': 'scissors', 'paper': 'rock', 'scissors': 'paper'}
+
+    def __init__(self):
+        self.moves = {}
+
+    def apply(self, seat, move):
+        if seat in self.moves:
+            return "Move already made", None
+        if move not in self.BEATS:
+            return "Invalid move", None
+        self.moves[seat] = move
+        if len(self.moves) < 2:
+            return None, None
+        host_move, client_move = self.moves["host"], self.moves["client"]
+        if host_move == client_move:
+            return None, "draw"
+        return None, "host" if self.BEATS[host_move] == client_move else "client"
+
+
+RULES = {
+    "ttt": TicTacToeRules,
+    "rps": RockPaperScissorsRules
+}
+
+
+class SessionConnection(asyncio.Protocol):
+    """A connection that may carry any number of sessions.
+
+    Frames are newline-delimited JSON tagged with ``sid``. A connection that
+    joined a single session may leave ``sid`` out, which lets the shipped
+    games talk to the server without knowing about multiplexing. Only
+    connections that join with ``"mux": true`` get result/abort frames;
+    single-session connections are closed when their match ends.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.buffer = bytearray()
+        self.outbox = []
+        self.seats = {}  # sid -> seat
+        self.mux = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.server.connections += 1
+
+    def data_received(self, data):
+        self.buffer += data
+        start = 0
+        while True:
+            end = self.buffer.find(b'\n', start)
+            if end < 0:
+                break
+            line = bytes(self.buffer[start:end])
+            start = end + 1
+            if line.strip():
+                self.server.handle_frame(self, line)
+        del self.buffer[:start]
+        if len(self.buffer) > MAX_FRAME:
+            self.transport.close()
+
+    def send(self, frame):
+        # Frames produced while handling one read are written in a single call.
+        if not self.outbox:
+            asyncio.get_running_loop().call_soon(self.flush)
+        self.outbox.append(json.dumps(frame).encode() + b'\n')
+
+    def flush(self):
+        if self.outbox and not self.transport.is_closing():
+            self.transport.write(b''.join(self.outbox))
+        self.outbox.clear()
+
+    def close(self):
+        self.flush()
+        self.transport.close()
+
+    def connection_lost(self, exc):
+        self.server.connections -= 1
+        for sid in list(self.seats):
+            self.server.abort(sid, self)
+
+
+class SessionServer:
+    def __init__(self, join_timeout=60):
+        self.join_timeout = join_timeout
+        self.sessions = {}
+        self.connections = 0
+        self.completed = 0
+        self.aborted = 0
+        self.server = None
+
+    async def start(self, host, port):
+        loop = asyncio.get_running_loop()
+        self.server = await loop.create_server(lambda: SessionConnection(self), host, port)
+        return self.server
+
+    def handle_frame(self, conn, line):
+        try:
+            frame = json.loads(line)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            conn.send({"op": "error", "message": "Invalid frame"})
+            return
+        if frame.get("op") == "join":
+            self.join(conn, frame)
+            return
+        sid = frame.get("sid")
+        if sid is None and len(conn.seats) == 1:
+            sid = next(iter(conn.seats))
+        session = self.sessions.get(sid)
+        seat = conn.seats.get(sid)
+        if session is None or seat is None or "move" not in frame:
+            conn.send({"sid": sid, "op": "error", "message": "Unknown session or frame"})
+            return
+        if len(session["seats"]) < 2:
+            conn.send({"sid": sid, "op": "error", "message": "Opponent has not joined"})
+            return
+        error, result = session["rules"].apply(seat, frame["move"])
+        if error:
+            conn.send({"sid": sid, "op": "error", "message": error})
+            return
+        opponent = session["seats"]["client" if seat == "host" else "host"]
+        forwarded = {"sid": sid, "move": frame["move"]}
+        if "seq" in frame:
+            forwarded["seq"] = frame["seq"]
+        opponent.send(forwarded)
+        if result is not None:
+            self.finish(sid, result)
+
+    def join(self, conn, frame):
+        sid = frame.get("sid")
+        seat = frame.get("role")
+        game = frame.get("game")
+        if not sid or seat not in ("host", "client") or game not in RULES:
+            conn.send({"sid": sid, "op": "error", "message": "Invalid join"})
+            return
+        session = self.sessions.get(sid)
+        if session is None:
+            loop = asyncio.get_running_loop()
+            session = self.sessions[sid] = {
+                "game": game,
+                "rules": RULES[game](),
+                "seats": {},
+                "started": None,
+                "timeout": loop.call_later(self.join_timeout, self.abort, sid, None)
+            }
+        if session["game"] != game or seat in session["seats"]:
+            conn.send({"sid": sid, "op": "error", "message": "Seat is taken"})
+            return
+        conn.mux = conn.mux or bool(frame.get("mux"))
+        conn.seats[sid] = seat
+        session["seats"][seat] = conn
+        if len(session["seats"]) == 2:
+            session["timeout"].cancel()
+            session["started"] = time.monotonic()
+            for each in session["seats"].values():
+                each.send({"sid": sid, "op": "start"})
+
+    def _end(self, sid):
+        session = self.sessions.pop(sid, None)
+        if session is None:
+            return None
+        session["timeout"].cancel()
+        for conn in session["seats"].values():
+            conn.seats.pop(sid, None)
+        return session
+
+    def finish(self, sid, result):
+        session = self._end(sid)
+        self.completed += 1
+        for conn in session["seats"].values():
+            if conn.mux:
+                conn.send({"sid": sid, "op": "result", "winner": result})
+            elif not conn.seats:
+                conn.close()
+
+    def abort(self, sid, lost_conn):
+        session = self._end(sid)
+        if session is None:
+            return
+        self.aborted += 1
+        for conn in session["seats"].values():
+            if conn is lost_conn:
+                continue
+            if conn.mux:
+                conn.send({"sid": sid, "op": "abort"})
+            elif not conn.seats:
+                conn.close()
+
+    def stats(self):
+        return {
+            "connections": self.connections,
+            "active_sessions": len(self.sessions),
+            "completed": self.completed,
+            "aborted": self.aborted
+        }
+
+
+async def main():
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+    session_server = SessionServer()
+    server = await session_server.start(config.SESSION_HOST, config.SESSION_PORT)
+    logger.info(f"Game session server 正在運行在 {config.SESSION_HOST}:{config.SESSION_PORT}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
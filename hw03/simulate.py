@@ -0,0 +1,361 @@
+"""Headless bot-vs-bot matches for a game module.
+
+Usage: python simulate.py <game.py> [--matches N] [--workers N] [--concurrency N]
+                          [--strategy random|fuzz|bot|module:factory]
+                          [--transport memory|loopback] [--timeout SECONDS] [--seed N]
+
+Both players of every match load their own copy of the game, with
+get_user_input replaced by a strategy, and play each other over in-memory
+streams or real loopback sockets. Matches are spread over a process pool.
+The report gives matches per second, failed and timed-out matches,
+protocol errors and per-move latency; the exit status is non-zero if any
+match misbehaved, so the harness can qualify an uploaded game before it
+goes live. With NumPy installed, the final boards of in-memory ttt matches
+are replayed from the frames on the wire and checked in one batch: every
+match must end in a win or a draw.
+"""
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import importlib
+import logging
+import os
+import random
+import re
+import statistics
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import game_transport
+
+try:
+    import numpy as np
+    import batch_eval
+except ImportError:
+    batch_eval = None
+
+RANGE_PATTERN = re.compile(r"\((\d+)\s*-\s*(\d+)\)")
+WORD_PATTERN = re.compile(r"[a-z_]+")
+
+
+def choices_from_prompt(prompt):
+    """Valid-looking answers to a prompt: a "(1-9)" range or the ASCII words it lists."""
+    match = RANGE_PATTERN.search(prompt)
+    if match:
+        low, high = int(match.group(1)), int(match.group(2))
+        return [str(value) for value in range(low, high + 1)]
+    words = WORD_PATTERN.findall(prompt.lower())
+    return words or ["1"]
+
+
+class RandomStrategy:
+    """Answers every prompt with one of the choices it offers."""
+
+    peer_fields = {}
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    async def __call__(self, prompt):
+        return self.rng.choice(choices_from_prompt(prompt))
+
+
+class FuzzStrategy(RandomStrategy):
+    """Mostly valid answers, with garbage mixed in to exercise input validation."""
+
+    GARBAGE = ["", "0", "-1", "99", "abc", "1 2", "一", "9" * 40]
+
+    async def __call__(self, prompt):
+        if self.rng.random() < 0.3:
+            return self.rng.choice(self.GARBAGE)
+        return await super().__call__(prompt)
+
+
+class BotStrategy(RandomStrategy):
+    """Lets games with a built-in bot (peer_info["bot"]) pick their own moves."""
+
+    peer_fields = {"bot": True}
+
+
+STRATEGIES = {
+    "random": RandomStrategy,
+    "fuzz": FuzzStrategy,
+    "bot": BotStrategy
+}
+
+
+def load_strategy(name):
+    if name in STRATEGIES:
+        return STRATEGIES[name]
+    module_name, _, attr = name.partition(':')
+    return getattr(importlib.import_module(module_name), attr)
+
+
+class MemoryWriter:
+    """StreamWriter stand-in that feeds the other side's StreamReader directly."""
+
+    def __init__(self, peer_reader, wire=None, side=None):
+        self.peer_reader = peer_reader
+        self.wire = wire
+        self.side = side
+        self.closing = False
+
+    def write(self, data):
+        if not self.closing:
+            if self.wire is not None:
+                self.wire.append((self.side, data))
+            self.peer_reader.feed_data(data)
+
+    async def drain(self):
+        await asyncio.sleep(0)
+
+    def is_closing(self):
+        return self.closing
+
+    def close(self):
+        if not self.closing:
+            self.closing = True
+            self.peer_reader.feed_eof()
+
+    async def wait_closed(self):
+        pass
+
+
+def memory_streams(wire=None):
+    host_reader, client_reader = asyncio.StreamReader(), asyncio.StreamReader()
+    return (host_reader, MemoryWriter(client_reader, wire, "host")), (client_reader, MemoryWriter(host_reader, wire, "client"))
+
+
+def replay_ttt(wire):
+    """Final board of a ttt match from its frames in wire order (host X = 1, client O = 2), None if unreadable."""
+    decoders = {"host": game_transport.FrameDecoder(), "client": game_transport.FrameDecoder()}
+    cells = [0] * 9
+    try:
+        for side, data in wire:
+            for frame in decoders[side].feed(data):
+                move = frame.get("move")
+                if not isinstance(move, int) or not 0 <= move <= 8 or cells[move]:
+                    return None
+                cells[move] = 1 if side == "host" else 2
+    except game_transport.ProtocolError:
+        return None
+    return cells
+
+
+# Games whose final positions can be rebuilt from the wire and checked by batch_eval.
+AUDITORS = {"ttt": (replay_ttt, lambda boards: batch_eval.ttt_results(*batch_eval.ttt_pack(boards)))}
+
+
+# The loopback host of the match running in this task; its "listening" event resolves it with the port.
+host_listening = contextvars.ContextVar("host_listening", default=None)
+
+
+def on_transport_event(event):
+    # notify() runs in the host's task, which inherited its match's host_listening.
+    listening = host_listening.get()
+    if event.get("event") == "listening" and listening is not None and not listening.done():
+        listening.set_result(event["port"])
+
+
+async def connect_after_host(player, peer_info, listening):
+    # The host binds port 0, so the client learns the port only once the host is listening.
+    port = await listening
+    peer_info.update(own_port=port, peer_port=port)
+    await player["main"](peer_info)
+
+
+class MoveClock:
+    """Time from one player sending a move frame to the other accepting it.
+
+    Both GameConnections of a match share the clock through peer_info, so
+    re-prompts after a rejected answer are not counted and games that pick
+    their own moves (--strategy bot) are. Each direction is in order: the
+    n-th move accepted is the n-th move the other side sent.
+    """
+
+    def __init__(self, latencies):
+        self.latencies = latencies
+        self.in_flight = {"host": deque(), "client": deque()}
+
+    def sent(self, role):
+        self.in_flight[role].append(time.perf_counter())
+
+    def received(self, role):
+        in_flight = self.in_flight["client" if role == "host" else "host"]
+        if in_flight:
+            self.latencies.append(time.perf_counter() - in_flight.popleft())
+
+
+class ErrorCounter(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+def new_player(code, strategy):
+    namespace = {"__name__": "game_simulated"}
+    exec(code, namespace)
+    namespace["get_user_input"] = strategy
+    return namespace
+
+
+async def play_match(code, game, strategy_factory, transport, rng, timeout, latencies, wire=None):
+    clock = MoveClock(latencies)
+    host_info = {"role": "host", "game_name": game, "move_clock": clock}
+    client_info = {"role": "client", "game_name": game, "move_clock": clock}
+    listening = None
+    if transport == "memory":
+        host_info["streams"], client_info["streams"] = memory_streams(wire)
+    else:
+        listening = asyncio.get_running_loop().create_future()
+        host_listening.set(listening)
+        host_info.update(own_port=0, peer_ip="127.0.0.1", peer_port=0)
+        client_info.update(peer_ip="127.0.0.1")
+    players = []
+    for peer_info in (host_info, client_info):
+        strategy = strategy_factory(random.Random(rng.random()))
+        peer_info.update(strategy.peer_fields)
+        player = new_player(code, strategy)
+        if listening is not None and peer_info is client_info:
+            players.append(connect_after_host(player, peer_info, listening))
+        else:
+            players.append(player["main"](peer_info))
+    try:
+        await asyncio.wait_for(asyncio.gather(*players), timeout)
+    except asyncio.TimeoutError:
+        return "timeout", {}
+    except Exception as e:
+        return "failed", {"exception": repr(e)}
+    host_stats = host_info.get("transport_stats")
+    client_stats = client_info.get("transport_stats")
+    if host_stats is None or client_stats is None:
+        return "failed", {"exception": "a player never connected"}
+    problems = {
+        "protocol_errors": host_stats["protocol_errors"] + client_stats["protocol_errors"],
+        "duplicates": host_stats["duplicates"] + client_stats["duplicates"],
+        "gaps": host_stats["gaps"] + client_stats["gaps"],
+        # Every frame one side sent should have been read by the other before the match ended.
+        "unread_frames": abs(host_stats["frames_sent"] - client_stats["frames_received"])
+                         + abs(client_stats["frames_sent"] - host_stats["frames_received"])
+    }
+    return "ok", problems
+
+
+async def run_matches(file_path, count, concurrency, strategy_name, transport, seed, timeout):
+    with open(file_path, 'rb') as f:
+        code = compile(f.read(), file_path, 'exec')
+    game = os.path.splitext(os.path.basename(file_path))[0]
+    strategy_factory = load_strategy(strategy_name)
+    rng = random.Random(seed)
+    semaphore = asyncio.Semaphore(concurrency)
+    auditor = AUDITORS.get(game) if batch_eval is not None and transport == "memory" else None
+    game_transport.set_event_handler(on_transport_event)
+    final_boards = []
+    result = {"matches": count, "ok": 0, "failed": 0, "timeout": 0, "protocol_errors": 0,
+              "duplicates": 0, "gaps": 0, "unread_frames": 0, "audited": 0, "audit_failures": 0,
+              "exceptions": [], "latencies": []}
+
+    async def one():
+        wire = [] if auditor is not None else None
+        async with semaphore:
+            outcome, details = await play_match(code, game, strategy_factory, transport, rng, timeout,
+                                                result["latencies"], wire)
+        result[outcome] += 1
+        if auditor is not None and outcome == "ok":
+            board = auditor[0](wire)
+            if board is None:
+                result["audit_failures"] += 1
+            else:
+                final_boards.append(board)
+        for key in ("protocol_errors", "duplicates", "gaps", "unread_frames"):
+            result[key] += details.get(key, 0)
+        if "exception" in details and len(result["exceptions"]) < 5:
+            result["exceptions"].append(details["exception"])
+
+    await asyncio.gather(*(one() for _ in range(count)))
+    if final_boards:
+        results = auditor[1](np.array(final_boards, dtype=np.int8))
+        result["audited"] = len(final_boards)
+        result["audit_failures"] += int(np.count_nonzero((results == batch_eval.ONGOING) | (results == batch_eval.INVALID)))
+    return result
+
+
+def run_batch(file_path, count, concurrency, strategy_name, transport, seed, timeout):
+    """Process pool entry point: play count matches with game output silenced."""
+    errors = ErrorCounter()
+    logging.getLogger().addHandler(errors)
+    logging.getLogger().setLevel(logging.ERROR)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        result = asyncio.run(run_matches(file_path, count, concurrency, strategy_name, transport, seed, timeout))
+    result["logged_errors"] = errors.count
+    return result
+
+
+def merge(results):
+    total = {}
+    for result in results:
+        for key, value in result.items():
+            if isinstance(value, list):
+                total.setdefault(key, []).extend(value)
+            else:
+                total[key] = total.get(key, 0) + value
+    return total
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def report(args, workers, total, elapsed):
+    print(f"遊戲 {args.game}：{total['matches']} 場，{workers} 個程序，傳輸 {args.transport}，策略 {args.strategy}")
+    print(f"  完成 {total['ok']}，失敗 {total['failed']}，逾時 {total['timeout']}")
+    print(f"  每秒對局 {total['matches'] / elapsed:.1f}（{elapsed:.2f} 秒）")
+    print(f"  協定錯誤 {total['protocol_errors']}，重複訊框 {total['duplicates']}，序號缺漏 {total['gaps']}，"
+          f"未讀訊框 {total['unread_frames']}，遊戲錯誤日誌 {total['logged_errors']}")
+    if total["audited"] or total["audit_failures"]:
+        print(f"  終局檢查 {total['audited']} 盤，未結束或不合法 {total['audit_failures']}")
+    latencies = total["latencies"]
+    if latencies:
+        print(f"  每步延遲 p50 {statistics.median(latencies) * 1e3:.3f} ms，p95 {percentile(latencies, 0.95) * 1e3:.3f} ms，"
+              f"p99 {percentile(latencies, 0.99) * 1e3:.3f} ms（{len(latencies)} 步）")
+    for exception in total["exceptions"]:
+        print(f"  例外：{exception}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless bot-vs-bot matches for a game module.")
+    parser.add_argument("game", help="path to the game module, e.g. games/ttt.py")
+    parser.add_argument("--matches", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--concurrency", type=int, default=50, help="matches in flight per worker")
+    parser.add_argument("--strategy", default="random")
+    parser.add_argument("--transport", choices=["memory", "loopback"], default="memory")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds before a match counts as hung")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    load_strategy(args.strategy)  # fail fast on a bad name
+    workers = max(1, min(args.workers, args.matches))
+    batches = [args.matches // workers + (1 if i < args.matches % workers else 0) for i in range(workers)]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(run_batch, args.game, count, args.concurrency, args.strategy,
+                               args.transport, args.seed + i, args.timeout)
+                   for i, count in enumerate(batches)]
+        total = merge(future.result() for future in futures)
+    elapsed = time.perf_counter() - start
+    report(args, workers, total, elapsed)
+    problems = (total["failed"] + total["timeout"] + total["protocol_errors"] + total["duplicates"]
+                + total["gaps"] + total["unread_frames"] + total["audit_failures"] + total["logged_errors"])
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
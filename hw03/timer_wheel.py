@@ -0,0 +1,96 @@
+"""Hashed timer wheel for the lobby's expiry timers.
+
+Timers go into one of ``slots`` buckets by due tick, so scheduling,
+cancelling and rescheduling are dict operations, and each tick only looks
+at the one bucket whose turn it is. A delay longer than one turn of the
+wheel waits the extra full turns out in its bucket (``rounds``). Timers
+are keyed: scheduling a key that is already pending moves it, which is how
+a repeated invite or a new game in the same room pushes its expiry back.
+
+Callbacks may be coroutine functions; ``run`` awaits them one at a time on
+the loop, so they can take the same locks as the command handlers.
+"""
+import asyncio
+import inspect
+import logging
+import math
+import time
+
+
+class TimerWheel:
+    def __init__(self, tick=1.0, slots=512, logger=None):
+        self.tick = tick
+        self.slots = [{} for _ in range(slots)]  # key -> [rounds left, callback, args]
+        self.where = {}  # key -> slot index, for O(1) cancel
+        self.current = 0
+        self.fired = 0
+        self.logger = logger or logging.getLogger("LobbyServer")
+        self.task = None
+
+    def __len__(self):
+        return len(self.where)
+
+    def __contains__(self, key):
+        return key in self.where
+
+    def schedule(self, key, delay, callback, *args):
+        self.cancel(key)
+        ticks = max(1, math.ceil(delay / self.tick))
+        rounds, offset = divmod(ticks, len(self.slots))
+        if offset == 0:
+            rounds, offset = rounds - 1, len(self.slots)
+        index = (self.current + offset) % len(self.slots)
+        self.slots[index][key] = [rounds, callback, args]
+        self.where[key] = index
+
+    def cancel(self, key):
+        index = self.where.pop(key, None)
+        if index is None:
+            return False
+        del self.slots[index][key]
+        return True
+
+    def advance(self):
+        """Move one tick; returns the (callback, args) that came due."""
+        self.current = (self.current + 1) % len(self.slots)
+        bucket = self.slots[self.current]
+        due = []
+        for key, entry in list(bucket.items()):
+            if entry[0] > 0:
+                entry[0] -= 1
+                continue
+            del bucket[key]
+            del self.where[key]
+            due.append((entry[1], entry[2]))
+        return due
+
+    async def fire(self, due):
+        for callback, args in due:
+            self.fired += 1
+            try:
+                result = callback(*args)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                self.logger.exception("計時器回呼 %s 發生錯誤", getattr(callback, "__name__", callback))
+
+    async def run(self):
+        # Catch up on ticks missed while the loop was busy instead of drifting.
+        next_tick = time.monotonic() + self.tick
+        while True:
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            while next_tick <= time.monotonic():
+                next_tick += self.tick
+                await self.fire(self.advance())
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def register_metrics(self, registry, prefix="lobby_timers"):
+        registry.gauge(f"{prefix}_pending", "Expiry timers waiting on the wheel", callback=lambda: len(self))
+        registry.counter(f"{prefix}_fired_total", "Expiry timers that came due", callback=lambda: self.fired)
@@ -0,0 +1,89 @@
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+
+def make_span(trace_id, name, process, start, duration=0.0, **fields):
+    """A span is one JSON object: wall-clock start so processes can be merged, duration in seconds."""
+    span = {"trace_id": trace_id, "name": name, "process": process, "pid": os.getpid(),
+            "start": start, "duration": duration}
+    span.update(fields)
+    return span
+
+
+class Tracer:
+    """Buffers game-start spans and appends them to a JSON-lines file.
+
+    Nothing is recorded for a None trace_id, so untraced code paths cost a
+    dict lookup. ``merge_traces.py`` joins the files written by the server,
+    each client and their games into a per-phase breakdown.
+
+    ``record`` never touches the file: once ``buffer_size`` spans are waiting
+    it calls ``on_full``, and the owner writes them from its own task with
+    ``take()`` and ``write()``. Until ``path`` is set at most ``buffer_size``
+    spans are kept.
+    """
+
+    def __init__(self, process, path=None, enabled=True, buffer_size=64, on_full=None):
+        self.process = process
+        self.path = path
+        self.enabled = enabled
+        self.buffer_size = buffer_size
+        self.on_full = on_full
+        self.buffer = []
+
+    @contextmanager
+    def span(self, trace_id, name, **fields):
+        if not self.enabled or trace_id is None:
+            yield
+            return
+        start = time.time()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(make_span(trace_id, name, self.process, start, time.perf_counter() - started, **fields))
+
+    def event(self, trace_id, name, **fields):
+        if self.enabled and trace_id is not None:
+            self.record(make_span(trace_id, name, self.process, time.time(), **fields))
+
+    def record(self, span):
+        if not self.enabled:
+            return
+        if not self.path:
+            # Nowhere to write yet: keep the first spans rather than grow without bound.
+            if len(self.buffer) < self.buffer_size:
+                self.buffer.append(span)
+            return
+        self.buffer.append(span)
+        if len(self.buffer) >= self.buffer_size and self.on_full is not None:
+            self.on_full()
+
+    def flush(self):
+        """Write the buffer right away, blocking; for shutdown."""
+        lines = self.take()
+        if lines:
+            self.write(lines)
+
+    def take(self):
+        """Empty the buffer into JSON lines; write() them later, e.g. from an executor thread."""
+        if not self.buffer or not self.path:
+            return None
+        lines = ''.join(json.dumps(span, ensure_ascii=False) + '\n' for span in self.buffer)
+        self.buffer.clear()
+        return lines
+
+    def write(self, lines):
+        try:
+            with open(self.path, 'a') as f:
+                f.write(lines)
+        except OSError as e:
+            logging.getLogger("LobbyServer").warning(f"寫入追蹤檔案 {self.path} 失敗：{e}")
@@ -0,0 +1,83 @@
+import random
+
+# Square i of the board is bit i; squares are numbered 0-8 row by row.
+WIN_MASKS = (
+    0b000000111, 0b000111000, 0b111000000,  # rows
+    0b001001001, 0b010010010, 0b100100100,  # columns
+    0b100010001, 0b001010100                # diagonals
+)
+FULL = 0b111111111
+MOVE_BITS = tuple(1 << square for square in range(9))
+
+# WINNING[bits] tells whether a player holding the squares in bits has three in a row.
+WINNING = bytes(any(bits & mask == mask for mask in WIN_MASKS) for bits in range(1 << 9))
+# EMPTY[taken] is the number of free squares, which is also what winning next move is worth.
+EMPTY = bytes(9 - bin(taken).count("1") for taken in range(1 << 9))
+
+# Solved positions: (side to move, other side) -> score for the side to move.
+transposition = {}
+
+
+def is_win(bits):
+    return WINNING[bits]
+
+
+def is_full(x_bits, o_bits):
+    return x_bits | o_bits == FULL
+
+
+def legal_moves(x_bits, o_bits):
+    taken = x_bits | o_bits
+    return [square for square in range(9) if not taken & MOVE_BITS[square]]
+
+
+def solve(own, other):
+    """Negamax score for the side to move: >0 win, 0 draw, <0 loss.
+
+    Faster wins score higher: a win is worth the number of empty squares
+    before the winning move, so the bot finishes games instead of dawdling.
+    """
+    key = (own, other)
+    score = transposition.get(key)
+    if score is not None:
+        return score
+    taken = own | other
+    if taken == FULL:
+        score = 0
+    else:
+        score = -10
+        for bit in MOVE_BITS:
+            if taken & bit:
+                continue
+            mine = own | bit
+            if WINNING[mine]:
+                value = EMPTY[taken]
+            else:
+                value = -solve(other, mine)
+            if value > score:
+                score = value
+    transposition[key] = score
+    return score
+
+
+def move_scores(own, other):
+    taken = own | other
+    scores = {}
+    for square, bit in enumerate(MOVE_BITS):
+        if taken & bit:
+            continue
+        mine = own | bit
+        if WINNING[mine]:
+            scores[square] = EMPTY[taken]
+        else:
+            scores[square] = -solve(other, mine)
+    return scores
+
+
+def best_move(own, other, rng=random):
+    """One of the best squares for the side holding own; ties are broken at random."""
+    scores = move_scores(own, other)
+    if not scores:
+        return None
+    best = max(scores.values())
+    return rng.choice([square for square, score in scores.items() if score == best])